@@ -172,9 +172,23 @@ LOGGING = {
 }
 
 CACHES = {
+    # Per-process LRU in front of the shared cache, local entries live at
+    # most LOCAL_TIMEOUT seconds (other processes may see a deleted value
+    # for that long)
     'default': {
+        'BACKEND': 'cloud.helpers.cache.TieredCache',
+        'KEY_PREFIX': 'aurora',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': 5,
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Cache shared by all processes (web server and workers)
+    'shared': {
         'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'aurora_cache',
+        'KEY_PREFIX': 'aurora',
         #'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
         #'LOCATION': 'unix:/tmp/memcached.sock',
         #'LOCATION': '127.0.0.1:11211',
@@ -191,9 +205,133 @@ SDN_CONTROLLER = {
     'port': 6633,
 }
 
+# Open vSwitch database connections (JSON-RPC, kept open for each host)
+OVSDB = {
+    # Seconds to wait to connect and for each request
+    'timeout': 3,
+}
+
+# REST API of the SDN controller
+FLOODLIGHT = {
+    'rest_port': 8080,
+    # Seconds to wait for each request
+    'timeout': 5,
+    # Persistent connections kept open to the controller
+    'pool_size': 8,
+    # Flow entries pushed/deleted at the same time
+    'max_workers': 8,
+    # Seconds the switch/port list of the controller is reused
+    'inventory_ttl': 30,
+}
+
+# Background jobs executed by "python manage.py job_worker"
+JOBS = {
+    # Seconds an idle worker waits before looking for new jobs
+    'poll_interval': 2,
+    # Seconds after which a running job is considered lost when a worker starts
+    'stale_after': 6 * 3600,
+}
+
+# Network topology used to calculate distances between hosts (see cloud/helpers/topology.py)
+TOPOLOGY = {
+    # Where links are read from: 'controller' (falls back to the database) or 'database'
+    'source': 'controller',
+    # Seconds the link list is reused before asking the controller again
+    'refresh': 30,
+    # Seconds to wait for the controller
+    'timeout': 5,
+    # Seconds a computed distance matrix is kept in cache
+    'cache_timeout': 86400,
+}
+
+# libvirt connection pooling (see cloud/helpers/libvirt_connections.py)
+LIBVIRT_CONNECTIONS = {
+    # Seconds between keepalive messages and how many may go unanswered
+    # before the connection is considered dead
+    'keepalive_interval': 5,
+    'keepalive_count': 3,
+    # Seconds between health probes of a pooled connection
+    'probe_interval': 30,
+    # Reconnection backoff in seconds (doubles after every failure)
+    'backoff_initial': 1,
+    'backoff_max': 60,
+}
+
+# Parallel host synchronization (see cloud/helpers/host_sync.py)
+HOST_SYNC = {
+    # Hosts contacted at the same time
+    'max_workers': 8,
+    # Seconds to wait for a single host before giving up on it
+    'timeout': 60,
+}
+
+# Static host facts (see cloud/models/host_facts.py)
+HOST_FACTS = {
+    # Seconds before the facts of a host are read again from the hypervisor
+    # (python manage.py refresh_host_facts refreshes them on demand)
+    'max_age': 86400,
+}
+
+# Metric collection (see cloud/helpers/metric_collector.py)
+METRICS = {
+    # Collections running at the same time
+    'max_workers': 8,
+    # Seconds between checks for metrics due
+    'tick': 1,
+    # (resolution in seconds, number of samples) kept for every series, from
+    # the finest to the coarsest: 1 hour of 10 s, 1 day of 1 min and 30 days
+    # of 1 hour samples
+    'rollups': ((10, 360), (60, 1440), (3600, 720)),
+}
+
+# Evaluation of events with the collected metrics (see cloud/helpers/event_engine.py)
+EVENTS = {
+    # Seconds before the list of enabled events is read again
+    'reload': 30,
+}
+
+# Concurrent deployment of slices (see cloud/programs/deployment_program.py)
+DEPLOYMENT = {
+    # Devices deployed at the same time
+    'max_workers': 8,
+    # Devices deployed at the same time in a single host
+    'per_host': 2,
+}
+
+# Export of the infrastructure to the monitoring system (FlexCMS)
+MONITORING = {
+    # Seconds the XML fragment of a device is reused while it does not change
+    'fragment_timeout': 3600,
+    # Devices read at once (fragments and VM states are looked up per batch)
+    'batch_size': 500,
+    # Bytes of XML sent at once when streaming the platform document
+    'chunk_size': 65536,
+    # Seconds to wait for the monitoring system
+    'timeout': 30,
+    # Persistent connections kept to the monitoring system
+    'pool_size': 2,
+    # Attempts after a failed request, waiting backoff, 2 * backoff... seconds
+    'retries': 3,
+    'backoff': 1,
+    # Send the document gzip compressed (Content-Encoding: gzip)
+    'compress': True,
+    # Queue a deploy_monitoring job after every successful slice deployment
+    'deploy_with_slices': True,
+}
+
 # Path to store images in remote hosts
 REMOTE_IMAGE_PATH = '/'
 
+# Distribution of images to hosts (see cloud/models/image.py)
+IMAGE_STAGING = {
+    # Create copy-on-write overlays instead of full copies of base images
+    'overlays': True,
+    # Check that a base image listed in the inventory still exists in the host
+    'verify': True,
+    # Base images kept in each host (least recently used unused ones are removed)
+    'max_per_host': 10,
+}
+
 # Override default settings locally
 try:
     from local_settings import *
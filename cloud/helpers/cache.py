@@ -0,0 +1,188 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+# Marks keys not found (None is a valid cached value for some backends)
+MISSING = object()
+
+
+class LocalTier(object):
+    """Bounded LRU dictionary with per entry expiration
+
+    Values are pickled, so callers never share (and mutate) the same object.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+        self.counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'sets': 0, 'deletes': 0}
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.pop(key, None)
+            if entry is None:
+                return MISSING
+            value, expires = entry
+            if expires <= time.time():
+                return MISSING
+            # Most recently used entries are kept at the end
+            self.data[key] = entry
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        if timeout <= 0:
+            self.delete(key)
+            return
+        value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (value, time.time() + timeout)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+# Django creates a backend object per thread, local tiers are shared by all
+# threads of the process
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def get_tier(name, max_entries):
+    with _tiers_lock:
+        if name not in _tiers:
+            _tiers[name] = LocalTier(max_entries)
+        return _tiers[name]
+
+
+class TieredCache(BaseCache):
+    """Per-process LRU tier in front of a shared cache backend
+
+    Reads are answered by the local tier when possible, otherwise by the
+    shared backend (settings.CACHES[OPTIONS['SHARED']]) and kept locally.
+    Writes and deletes go to both tiers. Local entries live at most
+    OPTIONS['LOCAL_TIMEOUT'] seconds, which bounds how long other processes
+    may see a value after it was deleted or changed.
+    """
+
+    def __init__(self, location, params):
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.tier = get_tier(location or self.shared_alias, self._max_entries)
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def local_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def local_timeout_for(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.local_key(key, version)
+        value = self.tier.get(local_key)
+        if value is not MISSING:
+            self.tier.count('local_hits')
+            return value
+
+        value = self.shared.get(key, MISSING, version=version)
+        if value is MISSING:
+            self.tier.count('misses')
+            return default
+        self.tier.count('shared_hits')
+        self.tier.set(local_key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self.tier.set(self.local_key(key, version), value, self.local_timeout_for(timeout))
+        self.tier.count('sets')
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self.tier.set(self.local_key(key, version), value, self.local_timeout_for(timeout))
+            self.tier.count('sets')
+        return added
+
+    def delete(self, key, version=None):
+        self.tier.delete(self.local_key(key, version))
+        self.shared.delete(key, version=version)
+        self.tier.count('deletes')
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.tier.get(self.local_key(key, version))
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.tier.count('local_hits', len(found))
+
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key, value in shared.items():
+                self.tier.set(self.local_key(key, version), value, self.local_timeout)
+            found.update(shared)
+            self.tier.count('shared_hits', len(shared))
+            self.tier.count('misses', len(missing) - len(shared))
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set_many(data, timeout, version=version)
+        local_timeout = self.local_timeout_for(timeout)
+        for key, value in data.items():
+            self.tier.set(self.local_key(key, version), value, local_timeout)
+        self.tier.count('sets', len(data))
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self.tier.delete(self.local_key(key, version))
+        self.shared.delete_many(keys, version=version)
+        self.tier.count('deletes', len(keys))
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def incr(self, key, delta=1, version=None):
+        self.tier.delete(self.local_key(key, version))
+        return self.shared.incr(key, delta, version=version)
+
+    def clear(self):
+        self.tier.clear()
+        self.shared.clear()
+
+    # Hit/miss counters of this process
+    def stats(self):
+        with self.tier.lock:
+            stats = dict(self.tier.counters)
+            stats['local_entries'] = len(self.tier.data)
+        return stats
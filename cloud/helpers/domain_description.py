@@ -0,0 +1,108 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from xml.etree.ElementTree import fromstring
+
+# Parsed descriptions kept in memory, indexed by the hash of the XML
+MAX_DESCRIPTIONS = 500
+
+_descriptions = OrderedDict()
+_descriptions_lock = threading.Lock()
+
+
+def _attrib(element):
+    if element is None:
+        return None
+    return dict(element.attrib)
+
+
+def _text(element):
+    if element is None:
+        return None
+    return element.text
+
+
+class DomainDescription(object):
+    """Libvirt domain XML parsed once into plain lists and dictionaries
+
+    interfaces: list of {'type', 'mac', 'alias', 'model', 'source', 'target'}
+    disks: list of {'id', 'type', 'device', 'driver', 'source', 'target', 'alias'}
+    graphics: list of the attributes of every graphics element
+    source, target and driver are the attributes of those elements.
+    Descriptions are shared, callers must not change them.
+    """
+
+    def __init__(self, xml_desc):
+        domain = fromstring(xml_desc)
+        self.name = _text(domain.find('name'))
+        self.uuid = _text(domain.find('uuid'))
+        self.memory = _text(domain.find('memory'))
+        self.vcpu = _text(domain.find('vcpu'))
+
+        self.interfaces = []
+        for element in domain.findall('devices/interface'):
+            mac = element.find('mac')
+            alias = element.find('alias')
+            model = element.find('model')
+            self.interfaces.append({
+                'type': element.attrib.get('type'),
+                'mac': mac.attrib.get('address') if mac is not None else None,
+                'alias': alias.attrib.get('name') if alias is not None else None,
+                'model': model.attrib.get('type') if model is not None else None,
+                'source': _attrib(element.find('source')),
+                'target': _attrib(element.find('target')),
+            })
+
+        self.disks = []
+        for i, element in enumerate(domain.findall('devices/disk')):
+            alias = element.find('alias')
+            self.disks.append({
+                'id': i,
+                'type': element.attrib.get('type'),
+                'device': element.attrib.get('device'),
+                'driver': _attrib(element.find('driver')),
+                'source': _attrib(element.find('source')),
+                'target': _attrib(element.find('target')),
+                'alias': alias.attrib.get('name') if alias is not None else None,
+            })
+
+        self.graphics = [dict(element.attrib) for element in domain.findall('devices/graphics')]
+
+    # Parses a domain XML or returns the description already parsed for it
+    @classmethod
+    def parse(cls, xml_desc):
+        if isinstance(xml_desc, unicode):
+            key = hashlib.md5(xml_desc.encode('utf-8')).hexdigest()
+        else:
+            key = hashlib.md5(xml_desc).hexdigest()
+
+        with _descriptions_lock:
+            description = _descriptions.pop(key, None)
+            if description is not None:
+                _descriptions[key] = description
+                return description
+
+        description = cls(xml_desc)
+        with _descriptions_lock:
+            _descriptions[key] = description
+            while len(_descriptions) > MAX_DESCRIPTIONS:
+                _descriptions.popitem(last=False)
+        return description
+
+    # Interface matching the MAC address or the alias (there should be
+    # only one)
+    def find_interface(self, mac=None, alias=None):
+        for interface in self.interfaces:
+            if interface['mac'] == mac or (alias is not None and interface['alias'] == alias):
+                return interface
+        return None
+
+    def main_disk(self):
+        if len(self.disks) > 0:
+            return self.disks[0]
+        return None
+
+    def main_graphics(self):
+        if len(self.graphics) > 0:
+            return self.graphics[0]
+        return None
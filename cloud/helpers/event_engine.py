@@ -0,0 +1,116 @@
+import logging
+import time
+from collections import deque
+from django.conf import settings
+from cloud.models.event import Event
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Samples of the last seconds of one target, with a running sum for averages
+class Window(object):
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.samples = deque()
+        self.total = 0.0
+
+    def add(self, timestamp, value):
+        self.samples.append((timestamp, value))
+        self.total += value
+        while self.samples and self.samples[0][0] <= timestamp - self.seconds:
+            self.total -= self.samples.popleft()[1]
+
+    def value(self, aggregate):
+        if aggregate == 'avg':
+            return self.total / len(self.samples)
+        if aggregate == 'min':
+            return min(v for t, v in self.samples)
+        if aggregate == 'max':
+            return max(v for t, v in self.samples)
+        return self.samples[-1][1]
+
+
+class EventEngine(object):
+    """Evaluates the enabled events with the samples stored by the collector
+
+    Events are indexed by metric and field, so every sample is only compared
+    with the events watching it. Each (event, target) pair is evaluated on
+    its own: once its condition holds the program is queued (unless the
+    event is cooling down) and the pair is not evaluated again until the
+    condition clears by the event hysteresis. Triggers of one round for the
+    same program and slice are merged, and Event.trigger skips programs that
+    are already queued or running. Events are read again every
+    settings.EVENTS['reload'] seconds.
+    """
+
+    def __init__(self, reload_interval=None):
+        self.reload_interval = reload_interval or settings.EVENTS['reload']
+        self.index = {}
+        self.windows = {}
+        # (event id, target) pairs whose condition holds
+        self.fired = set()
+        self.loaded = 0
+
+    def load(self):
+        index = {}
+        events = {}
+        for event in Event.objects.filter(state='enabled'):
+            try:
+                event.threshold()
+            except Event.EventException as e:
+                logger.warning(str(e))
+                continue
+            index.setdefault((event.metric_id, event.field), []).append(event)
+            events[event.id] = event
+
+        # Forget the state of removed or changed events
+        for key in list(self.windows):
+            event = events.get(key[0])
+            if event is None or self.windows[key].seconds != event.window:
+                del self.windows[key]
+        self.fired = set(key for key in self.fired if key[0] in events)
+        self.index = index
+        self.loaded = time.time()
+        logger.debug('%d events loaded' % len(events))
+
+    # Value compared with the threshold: the sample itself or the aggregate
+    # of the window of the event
+    def evaluate(self, event, sample):
+        if event.window == 0:
+            return sample.value
+        key = (event.id, sample.target)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = Window(event.window)
+        window.add(sample.timestamp, sample.value)
+        return window.value(event.aggregate)
+
+    # Collector listener, returns the list of jobs queued
+    def handle(self, samples):
+        if time.time() - self.loaded > self.reload_interval:
+            self.load()
+
+        triggered = {}
+        for sample in samples:
+            for event in self.index.get((sample.metric.id, sample.field), ()):
+                if event.belongs_to_slice_id is not None and event.belongs_to_slice_id != sample.slice_id:
+                    continue
+                value = self.evaluate(event, sample)
+                key = (event.id, sample.target)
+                if key in self.fired:
+                    if event.cleared(value):
+                        self.fired.discard(key)
+                    continue
+                if not event.matches(value) or event.cooling_down():
+                    continue
+                self.fired.add(key)
+                logger.info('Event %s: %s %s is %s' % (event.name, sample.target, sample.field, value))
+                triggered.setdefault((event.program_id, event.belongs_to_slice_id), event)
+
+        jobs = []
+        for event in triggered.values():
+            job = event.trigger()
+            if job is not None:
+                jobs.append(job)
+        return jobs
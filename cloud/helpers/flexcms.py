@@ -0,0 +1,191 @@
+import hashlib
+import logging
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.core.cache import cache
+from cloud.models.slice import Slice
+from cloud.models.virtual_device import VirtualDevice
+from cloud.models.virtual_machine import VirtualMachine
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+
+def identifier_xml(text):
+    return '<identifier>%s</identifier>' % escape(unicode(text)).encode('ascii', 'xmlcharrefreplace')
+
+
+# Groups of at most size items
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Joins small strings into chunks of about size bytes
+def buffered(chunks, size):
+    buf = []
+    length = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buf)
+            buf = []
+            length = 0
+    if buf:
+        yield ''.join(buf)
+
+
+# A slice (None for the unbound devices) with the fragments of its devices,
+# represented as a cloud in FlexCMS. Fragments may be an iterator, the
+# version of the cloud is known once they were read (see load and xml).
+class CloudExport(object):
+    def __init__(self, slice, fragments):
+        self.slice = slice
+        # (version, fragment) of every device
+        self.fragments = fragments
+        self.version = None
+
+    @property
+    def key(self):
+        return 'FlexCMS-Cloud' + (str(self.slice.id) if self.slice is not None else '-Unbound')
+
+    @property
+    def identifier(self):
+        return self.slice.name if self.slice is not None else "Unbound Devices"
+
+    # Reads all the fragments to know the version before writing the cloud
+    def load(self):
+        self.fragments = list(self.fragments)
+        digest = hashlib.md5(repr(self.identifier))
+        for version, fragment in self.fragments:
+            digest.update(version)
+        self.version = digest.hexdigest()
+
+    # Strings forming the <cloud> element
+    def xml(self):
+        yield '<cloud>' + identifier_xml(self.identifier) + '<slices_attributes type="array">'
+        digest = hashlib.md5(repr(self.identifier))
+        for version, fragment in self.fragments:
+            digest.update(version)
+            yield fragment
+        self.version = digest.hexdigest()
+        yield '</slices_attributes></cloud>'
+
+
+class FlexCMSExporter(object):
+    """Incremental export of the platform XML read by FlexCMS
+
+    Every virtual device is a <slice> fragment of the document. Fragments
+    are cached with the version of the device (a digest of the exported
+    attributes: name, state, resources, host and image) and generated again
+    only when the version changes, so libvirt is only asked for disk and
+    interface details of changed devices (and when a fragment expires after
+    settings.MONITORING['fragment_timeout'] seconds). The version of every
+    cloud pushed to the monitoring system is kept to push the document only
+    when a cloud changed, was added or was removed.
+
+    The document is written as a stream: slices and devices are read with
+    queryset iterators, devices in batches of settings.MONITORING
+    ['batch_size'] (cache lookups and VM states are read per batch), and
+    the output is joined in chunks of settings.MONITORING['chunk_size']
+    bytes, so memory does not grow with the size of the cloud.
+    """
+
+    def __init__(self, monitoring, timeout=None, batch_size=None, chunk_size=None):
+        self.monitoring = monitoring
+        self.timeout = timeout or settings.MONITORING['fragment_timeout']
+        self.batch_size = batch_size or settings.MONITORING['batch_size']
+        self.chunk_size = chunk_size or settings.MONITORING['chunk_size']
+
+    # Digest of the attributes of a device written to its fragment
+    def device_version(self, device):
+        values = [device.name]
+        if device.is_virtual_machine():
+            vm = device.virtualmachine
+            values += [
+                vm.current_state(),
+                vm.vcpu,
+                vm.memory,
+                vm.host.hostname if vm.host is not None else None,
+                vm.image.name if vm.image is not None else None,
+            ]
+        return hashlib.md5(repr(values)).hexdigest()
+
+    # List of (version, fragment) of the devices, generating the changed ones
+    def fragments(self, devices):
+        # Reads the state of all VMs at once (one call per host)
+        VirtualMachine.states_for([dev.virtualmachine for dev in devices if dev.is_virtual_machine()])
+
+        cached = cache.get_many(['FlexCMS-Device' + str(dev.id) for dev in devices])
+        fragments = []
+        changed = {}
+        for dev in devices:
+            key = 'FlexCMS-Device' + str(dev.id)
+            version = self.device_version(dev)
+            entry = cached.get(key)
+            if entry is None or entry[0] != version:
+                entry = changed[key] = (version, self.monitoring.generate_flexcms_slice_xml(dev))
+            fragments.append(entry)
+        if changed:
+            cache.set_many(changed, self.timeout)
+            logger.debug('%d of %d FlexCMS fragments generated' % (len(changed), len(devices)))
+        return fragments
+
+    # (version, fragment) of the devices of a queryset, read in batches
+    def iter_fragments(self, devices):
+        devices = devices.select_related('virtualmachine__host', 'virtualmachine__image').order_by('id')
+        for batch in batches(devices.iterator(), self.batch_size):
+            for entry in self.fragments(batch):
+                yield entry
+
+    # CloudExport of every deployed slice and of the unbound devices
+    def clouds(self):
+        for s in Slice.objects.filter(state='deployed').order_by('id').iterator():
+            yield CloudExport(s, self.iter_fragments(s.virtualdevice_set.all()))
+        yield CloudExport(None, self.iter_fragments(VirtualDevice.objects.filter(belongs_to_slice=None)))
+
+    # Chunks of the platform document with the given clouds (all of them
+    # by default)
+    def document(self, clouds=None):
+        if clouds is None:
+            clouds = self.clouds()
+
+        def parts():
+            yield XML_DECLARATION + '<platform>' + identifier_xml('cloud') + '<cloud_attributes type="array">'
+            for cloud in clouds:
+                for part in cloud.xml():
+                    yield part
+            yield '</cloud_attributes></platform>'
+
+        return buffered(parts(), self.chunk_size)
+
+    # Whether the clouds (all of them by default) differ from the ones last
+    # pushed: a cloud changed, was added or was removed
+    def changed(self, clouds=None):
+        if clouds is None:
+            clouds = self.clouds()
+        pushed = cache.get('FlexCMS-Pushed')
+        if pushed is None:
+            return True
+        keys = set()
+        for cloud in clouds:
+            cloud.load()
+            cloud.fragments = None
+            keys.add(cloud.key)
+            if pushed.get(cloud.key) != cloud.version:
+                return True
+        return keys != set(pushed)
+
+    # Called once the monitoring system received a document with all the
+    # clouds
+    def mark_pushed(self, clouds):
+        cache.set('FlexCMS-Pushed', dict((cloud.key, cloud.version) for cloud in clouds), self.timeout)
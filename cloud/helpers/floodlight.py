@@ -0,0 +1,227 @@
+import json
+import logging
+import socket
+import threading
+import time
+import httplib
+from django.conf import settings
+from cloud.helpers.http import get_pool
+from cloud.helpers.parallel import run_parallel
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+class FloodlightException(IOError):
+    pass
+
+
+# Name of the static flow entry of a link in a switch. Floodlight 0.90
+# StaticFlowEntryPusher assumes all flow entries to have unique name across
+# all switches, so the dpid is part of the name
+def flow_name(dpid, link_id, direction):
+    return '%slink%d.%s' % (dpid.replace(':', ''), link_id, direction)
+
+
+# Forward and backward flow entries for every hop of a route. The route is
+# a list of coupled switch in/out ports, every two items represent a hop
+def path_flows(link_id, route, mac1, mac2):
+    entries = []
+    for i in range(0, len(route) - 1, 2):
+        dpid = route[i]['switch']
+        port1 = route[i]['port']
+        port2 = route[i + 1]['port']
+        # Forward flow
+        entries.append({
+            'switch': dpid,
+            'name': flow_name(dpid, link_id, 'f'),
+            'src-mac': mac1,
+            'cookie': '0',
+            'priority': '32768',
+            'ingress-port': str(port1),
+            'active': 'true',
+            'actions': 'output=%d' % port2,
+        })
+        # Backward flow
+        entries.append({
+            'switch': dpid,
+            'name': flow_name(dpid, link_id, 'r'),
+            'src-mac': mac2,
+            'cookie': '0',
+            'priority': '32768',
+            'ingress-port': str(port2),
+            'active': 'true',
+            'actions': 'output=%d' % port1,
+        })
+    return entries
+
+
+# Names of the flow entries created by path_flows
+def path_flow_names(link_id, route):
+    names = []
+    for i in range(0, len(route) - 1, 2):
+        dpid = route[i]['switch']
+        names.append(flow_name(dpid, link_id, 'f'))
+        names.append(flow_name(dpid, link_id, 'r'))
+    return names
+
+
+class FloodlightClient(object):
+    """REST client for the Floodlight (0.90) controller
+
+    Requests share a pool of persistent HTTP connections to the
+    controller. Non-2xx responses and error messages returned by the
+    static flow pusher raise FloodlightException. Batches of flow entries
+    are pushed/deleted concurrently.
+    """
+
+    def __init__(self, base_url=None, timeout=None, max_workers=None):
+        conf = settings.FLOODLIGHT
+        if base_url is None:
+            base_url = 'http://%s:%d' % (settings.SDN_CONTROLLER['ip'], conf['rest_port'])
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout or conf['timeout']
+        self.max_workers = max_workers or conf['max_workers']
+        self.pool = get_pool(self.base_url, self.timeout, conf['pool_size'])
+
+    def request(self, method, path, data=None):
+        body = None
+        headers = {'Accept': 'application/json'}
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        try:
+            response = self.pool.request(method, path, body, headers)
+        except (httplib.HTTPException, socket.error) as e:
+            raise FloodlightException('Could not connect to the controller at %s: %s' % (self.base_url, str(e)))
+
+        logger.debug('%s %s%s: %d' % (method, self.base_url, path, response.status))
+        if not response.ok():
+            raise FloodlightException('%s %s failed (Code: %d %s): %s' % (method, path, response.status, response.reason, response.body))
+        if not response.body:
+            return None
+        try:
+            return json.loads(response.body)
+        except ValueError:
+            raise FloodlightException('Invalid response for %s %s: %s' % (method, path, response.body))
+
+    def switches(self):
+        return self.request('GET', '/wm/core/controller/switches/json')
+
+    def links(self):
+        return self.request('GET', '/wm/topology/links/json')
+
+    def route(self, src_dpid, src_port, dst_dpid, dst_port):
+        return self.request('GET', '/wm/topology/route/%s/%s/%s/%s/json' % (src_dpid, src_port, dst_dpid, dst_port))
+
+    # The static flow pusher answers errors with 200 and a status message
+    def _check_status(self, result, name):
+        if isinstance(result, dict) and str(result.get('status', '')).lower().startswith('error'):
+            raise FloodlightException('Flow entry %s: %s' % (name, result['status']))
+        return result
+
+    def push_flow(self, entry):
+        return self._check_status(self.request('POST', '/wm/staticflowentrypusher/json', entry), entry['name'])
+
+    def delete_flow(self, name):
+        return self._check_status(self.request('DELETE', '/wm/staticflowentrypusher/json', {'name': name}), name)
+
+    # Removes every static flow entry of every switch
+    def clear_flows(self):
+        return self.request('GET', '/wm/staticflowentrypusher/clear/all/json')
+
+    # Runs func for every item concurrently and raises one exception
+    # listing every failure
+    def _batch(self, func, items, action):
+        failures = []
+        for task in run_parallel(func, items, max_workers=self.max_workers, timeout=self.timeout * 2):
+            if not task.ok():
+                error = 'timed out' if task.timed_out else str(task.error)
+                failures.append('%s: %s' % (task.item if isinstance(task.item, basestring) else task.item['name'], error))
+        if failures:
+            raise FloodlightException('Could not %s %d of %d flow entries: %s' % (action, len(failures), len(items), '; '.join(failures)))
+        return len(items)
+
+    def push_flows(self, entries):
+        return self._batch(self.push_flow, entries, 'push')
+
+    # Deleting entries that do not exist is not an error for the controller
+    def delete_flows(self, names):
+        return self._batch(self.delete_flow, names, 'delete')
+
+
+class SwitchInventory(object):
+    """Index of the switch ports known by the controller
+
+    Maps every port name (including the local port of each bridge, which
+    has the name of the bridge) to a (dpid, portNumber) tuple, so links
+    find their switches and ports without scanning the whole switch list.
+    The list is downloaded again after settings.FLOODLIGHT['inventory_ttl']
+    seconds, or when a name is not found and the inventory was invalidated
+    (new ports were added) or is older than one second.
+    """
+
+    def __init__(self, client=None, ttl=None):
+        self.client = client
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.ports = {}
+        self.fetched = 0
+        self.dirty = True
+
+    def get_client(self):
+        if self.client is None:
+            self.client = FloodlightClient()
+        return self.client
+
+    def get_ttl(self):
+        if self.ttl is None:
+            return settings.FLOODLIGHT['inventory_ttl']
+        return self.ttl
+
+    def refresh(self):
+        with self.lock:
+            self._refresh()
+
+    def _refresh(self):
+        ports = {}
+        for sw in self.get_client().switches() or []:
+            for pt in sw['ports']:
+                ports[pt['name']] = (sw['dpid'], pt['portNumber'])
+        self.ports = ports
+        self.fetched = time.time()
+        self.dirty = False
+        logger.debug('Switch inventory refreshed with %d ports' % len(ports))
+
+    # Called when ports are added to or removed from a bridge, the entry of
+    # the port is dropped so it is looked up again
+    def invalidate(self, name=None):
+        with self.lock:
+            self.dirty = True
+            if name is not None:
+                self.ports.pop(name, None)
+
+    def lookup(self, name):
+        with self.lock:
+            age = time.time() - self.fetched
+            if age > self.get_ttl():
+                self._refresh()
+            elif name not in self.ports and (self.dirty or age > 1):
+                self._refresh()
+            return self.ports.get(name)
+
+    # Datapath id of the switch of a port (or of a bridge)
+    def dpid(self, name):
+        found = self.lookup(name)
+        if found is None:
+            return None
+        return found[0]
+
+    def port_number(self, name):
+        found = self.lookup(name)
+        if found is None:
+            return None
+        return found[1]
+
+
+inventory = SwitchInventory()
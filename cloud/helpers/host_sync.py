@@ -0,0 +1,279 @@
+import libvirt
+import logging
+import threading
+import time
+from libvirt import libvirtError
+from xml.etree.ElementTree import fromstring
+from django.conf import settings
+from django.db import transaction
+from cloud.helpers.parallel import run_parallel
+from cloud.models.virtual_machine import VirtualMachine
+from cloud.models.virtual_interface import VirtualInterface
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Outcome of a host synchronization (lists of domain names)
+class SyncReport(object):
+    def __init__(self, host):
+        self.host = host
+        self.created = []
+        self.updated = []
+        self.unchanged = []
+        self.orphaned = []
+        self.elapsed = 0.0
+
+    def as_dict(self):
+        return {
+            'host': unicode(self.host),
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'orphaned': self.orphaned,
+            'elapsed': round(self.elapsed, 3),
+        }
+
+    def __str__(self):
+        return '%s: %d created, %d updated, %d unchanged, %d orphaned (%.3f s)' % (
+            unicode(self.host), len(self.created), len(self.updated),
+            len(self.unchanged), len(self.orphaned), self.elapsed
+        )
+
+
+_sync_locks = {}
+_sync_locks_lock = threading.Lock()
+
+
+# Lock held while a host is synchronized by this process
+def sync_lock(host_id):
+    with _sync_locks_lock:
+        return _sync_locks.setdefault(host_id, threading.Lock())
+
+
+class HostSynchronizer(object):
+    """Reads the domains of a host and mirrors them in the local database
+
+    All domains are enumerated with a single listAllDomains() (and their
+    memory/vCPU read with getAllDomainStats() where the hypervisor supports
+    it), local VMs are prefetched in one query and changes are written in
+    bulk inside a single transaction.
+    """
+
+    STATS = (libvirt.VIR_DOMAIN_STATS_STATE |
+             libvirt.VIR_DOMAIN_STATS_BALLOON |
+             libvirt.VIR_DOMAIN_STATS_VCPU) if hasattr(libvirt, 'VIR_DOMAIN_STATS_STATE') else 0
+
+    def __init__(self, host):
+        self.host = host
+
+    # Synchronizations of the same host never overlap: a sync abandoned by
+    # run_parallel after a timeout keeps the lock of the host until it ends
+    # (and the Host row is locked while changes are written, see apply)
+    def run(self):
+        t0 = time.time()
+        report = SyncReport(self.host)
+
+        with sync_lock(self.host.id):
+            lv_conn = self.host.libvirt_connect()
+            try:
+                domains = self.read_domains(lv_conn)
+            except libvirtError as e:
+                raise self.host.HostException('Failed to read domains from hypervisor: ' + str(lv_conn) + ' ' + str(e))
+
+            self.apply(domains, report)
+
+        report.elapsed = time.time() - t0
+        logger.debug('Host synchronized: ' + str(report))
+        return report
+
+    # Name index of the VMs already bound to this host
+    def local_vms(self):
+        local_vms = {}
+        for vm in self.host.virtualmachine_set.order_by('id'):
+            if vm.name in local_vms:
+                logger.warning("More than one VM named " + vm.name + " for host " + str(self.host.id))
+                continue
+            local_vms[vm.name] = vm
+        return local_vms
+
+    # Returns a list of {'name', 'memory', 'vcpu', 'domain'} dictionaries
+    def read_domains(self, lv_conn):
+        if self.STATS and hasattr(lv_conn, 'getAllDomainStats'):
+            try:
+                return self._read_domain_stats(lv_conn)
+            except libvirtError as e:
+                # Old daemons may reject the call, fallback below
+                logger.debug('getAllDomainStats not available: ' + str(e))
+
+        if hasattr(lv_conn, 'listAllDomains'):
+            domains = []
+            for dom in lv_conn.listAllDomains(0):
+                info = dom.info()
+                domains.append({'name': dom.name(), 'memory': info[2], 'vcpu': info[3], 'domain': dom})
+            return domains
+
+        # Very old bindings without listAllDomains
+        domains = []
+        for dom_id in lv_conn.listDomainsID():
+            dom = lv_conn.lookupByID(dom_id)
+            info = dom.info()
+            domains.append({'name': dom.name(), 'memory': info[2], 'vcpu': info[3], 'domain': dom})
+        for dom_name in lv_conn.listDefinedDomains():
+            dom = lv_conn.lookupByName(dom_name)
+            info = dom.info()
+            domains.append({'name': dom_name, 'memory': info[2], 'vcpu': info[3], 'domain': dom})
+        return domains
+
+    def _read_domain_stats(self, lv_conn):
+        domains = []
+        for dom, stats in lv_conn.getAllDomainStats(self.STATS, 0):
+            memory = stats.get('balloon.current')
+            vcpu = stats.get('vcpu.current')
+            if memory is None or vcpu is None:
+                # Some drivers omit these values, read them directly
+                info = dom.info()
+                memory, vcpu = info[2], info[3]
+            domains.append({'name': dom.name(), 'memory': memory, 'vcpu': vcpu, 'domain': dom})
+        return domains
+
+    @transaction.atomic
+    def apply(self, domains, report):
+        # Syncs of the host from other processes wait here until this
+        # transaction ends, so they see the VMs created by it
+        list(type(self.host).objects.select_for_update().filter(id=self.host.id).values_list('id', flat=True))
+        local_vms = self.local_vms()
+
+        # Updates are grouped by the new values so that every group is a
+        # single UPDATE statement
+        updates = {}
+        new_interfaces = []
+        seen = set()
+
+        for dom in domains:
+            seen.add(dom['name'])
+            vm = local_vms.get(dom['name'])
+            if vm is None:
+                logger.debug("VM " + dom['name'] + " not found in database, creating new one")
+                vm = VirtualMachine()
+                vm.name = dom['name']
+                vm.memory = dom['memory']
+                vm.vcpu = dom['vcpu']
+                vm.host = self.host
+                # Virtual machines use multi-table inheritance, which
+                # cannot be bulk created
+                vm.save()
+                # TODO: Fill in the disk_path of VM
+                new_interfaces += self.read_interfaces(vm, dom['domain'])
+                # TODO: Create disks also (when disk objects are available)
+                report.created.append(vm.name)
+            elif vm.memory != dom['memory'] or vm.vcpu != dom['vcpu']:
+                updates.setdefault((dom['memory'], dom['vcpu']), []).append(vm.id)
+                report.updated.append(vm.name)
+                # TODO: Update interface and disk information
+            else:
+                report.unchanged.append(vm.name)
+
+        for (memory, vcpu), ids in updates.items():
+            VirtualMachine.objects.filter(id__in=ids).update(memory=memory, vcpu=vcpu)
+
+        # Interfaces with a known MAC address and target can be inserted at
+        # once, the others need save() to generate them from their id
+        complete = [i for i in new_interfaces if i.mac_address and i.target]
+        if complete:
+            VirtualInterface.objects.bulk_create(complete)
+        for interface in new_interfaces:
+            if not (interface.mac_address and interface.target):
+                interface.save()
+
+        # VMs of this host that do not exist in the hypervisor anymore are
+        # only reported (deletion is temporarily disabled)
+        for name in local_vms:
+            if name not in seen:
+                report.orphaned.append(name)
+
+    # Creates (unsaved) interface objects from the domain XML description
+    def read_interfaces(self, vm, dom):
+        interfaces = []
+        try:
+            vm_element = fromstring(dom.XMLDesc(0))
+        except libvirtError as e:
+            logger.warning("Could not read XML description of " + vm.name + ": " + str(e))
+            return interfaces
+
+        i = 0
+        for if_element in vm_element.findall("devices/interface"):
+            interface = VirtualInterface()
+            interface.if_type = if_element.attrib.get("type")
+
+            # There should be at least a type defined
+            if interface.if_type is None:
+                logger.warning("Could not create interface from element " + str(vars(if_element)))
+                break
+
+            mac_element = if_element.find("mac")
+            if mac_element is not None:
+                interface.mac_address = mac_element.attrib["address"]
+
+            alias_element = if_element.find("alias")
+            if alias_element is not None:
+                interface.alias = alias_element.attrib["name"]
+            else:
+                interface.alias = "net" + str(i)
+
+            # Attach interface to VM
+            interface.attached_to = vm
+
+            # Optional parameters
+            source_element = if_element.find("source")
+            if source_element is not None:
+                interface.source = source_element.attrib.get("bridge", source_element.attrib.get("network"))
+
+            target_element = if_element.find("target")
+            if target_element is not None:
+                interface.target = target_element.attrib.get("dev")
+
+            interfaces.append(interface)
+            i += 1
+
+        return interfaces
+
+
+# Runs func(host) for many hosts in parallel and returns one report entry
+# per host: {'host', 'ok', 'result', 'error', 'timed_out', 'elapsed'}.
+# Total time is roughly the slowest host (bounded by timeout) instead of
+# the sum of all of them.
+def run_on_hosts(func, hosts, max_workers=None, timeout=None):
+    if max_workers is None:
+        max_workers = settings.HOST_SYNC['max_workers']
+    if timeout is None:
+        timeout = settings.HOST_SYNC['timeout']
+
+    output = []
+    for task in run_parallel(func, list(hosts), max_workers, timeout):
+        if task.timed_out:
+            error = 'Timed out after %d s' % timeout
+        elif task.error is not None:
+            error = str(task.error)
+        else:
+            error = None
+
+        output.append({
+            'host': task.item,
+            'ok': task.ok(),
+            'result': task.result if task.ok() else None,
+            'error': error,
+            'timed_out': task.timed_out,
+            'elapsed': task.elapsed,
+        })
+    return output
+
+
+# Synchronizes all hosts (or the given ones) in parallel, results are
+# SyncReport objects
+def sync_hosts(hosts=None, max_workers=None, timeout=None):
+    if hosts is None:
+        # Imported here because the Host model imports this module
+        from cloud.models.host import Host
+        hosts = Host.objects.all()
+    return run_on_hosts(lambda h: h.sync(), hosts, max_workers, timeout)
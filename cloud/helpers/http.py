@@ -0,0 +1,141 @@
+import errno
+import httplib
+import logging
+import socket
+import threading
+import Queue
+import urlparse
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Response of a pooled request
+class HTTPResponse(object):
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def ok(self):
+        return 200 <= self.status < 300
+
+
+class HTTPConnectionPool(object):
+    """Keeps persistent (keep-alive) connections to a single server
+
+    Connections are reused by every thread instead of opening a new TCP
+    connection per request. A request is retried once on a new connection
+    only when the reused one was closed by the server while idle (no status
+    line, connection reset or broken pipe), never after a timeout, as the
+    server may be processing the request.
+
+    The body of a request is a string or a function returning an iterable
+    of strings, sent with chunked transfer encoding while it is read (the
+    function is called again when the request is retried).
+    """
+
+    def __init__(self, host, port=80, timeout=10, maxsize=8, scheme='http'):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.scheme = scheme
+        self.pool = Queue.LifoQueue(maxsize)
+        self.maxsize = maxsize
+
+    def _new_connection(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _get_connection(self):
+        try:
+            return self.pool.get(block=False), True
+        except Queue.Empty:
+            return self._new_connection(), False
+
+    def _put_connection(self, conn):
+        try:
+            self.pool.put(conn, block=False)
+        except Queue.Full:
+            conn.close()
+
+    def _send(self, conn, method, path, body, headers):
+        if callable(body):
+            body = body()
+        if body is None or isinstance(body, basestring):
+            conn.request(method, path, body, headers)
+            return
+
+        conn.putrequest(method, path, skip_accept_encoding='Accept-Encoding' in headers)
+        for name, value in headers.items():
+            conn.putheader(name, value)
+        conn.putheader('Transfer-Encoding', 'chunked')
+        conn.endheaders()
+        for chunk in body:
+            if chunk:
+                conn.send('%x\r\n%s\r\n' % (len(chunk), chunk))
+        conn.send('0\r\n\r\n')
+
+    # Whether an error means the server closed an idle connection
+    @staticmethod
+    def _closed_by_server(error):
+        if isinstance(error, socket.timeout):
+            return False
+        if isinstance(error, httplib.BadStatusLine):
+            return True
+        return isinstance(error, socket.error) and error.errno in (errno.ECONNRESET, errno.EPIPE)
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        headers.setdefault('Connection', 'keep-alive')
+
+        conn, reused = self._get_connection()
+        try:
+            try:
+                self._send(conn, method, path, body, headers)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if not reused or not self._closed_by_server(e):
+                    raise
+                # Stale keep-alive connection, try again with a new one
+                conn = self._new_connection()
+                self._send(conn, method, path, body, headers)
+                response = conn.getresponse()
+
+            data = response.read()
+            result = HTTPResponse(response.status, response.reason, dict(response.getheaders()), data)
+        except:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put_connection(conn)
+        return result
+
+    def close(self):
+        while True:
+            try:
+                self.pool.get(block=False).close()
+            except Queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Shared pool for the server of a base URL (e.g. http://127.0.0.1:8080),
+# callers using another timeout get their own pool
+def get_pool(base_url, timeout=10, maxsize=8):
+    url = urlparse.urlparse(base_url)
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    key = (url.scheme, url.hostname, port, timeout)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = HTTPConnectionPool(url.hostname, port, timeout, maxsize, url.scheme)
+        return _pools[key]
@@ -0,0 +1,209 @@
+import logging
+import time
+import threading
+from django.conf import settings
+from cloud.helpers.programs import registry as program_registry
+from cloud.models.base_model import BaseModel
+from cloud.models.deployment_program import DeploymentProgram
+from cloud.models.monitoring import Monitoring
+from cloud.models.optimization_program import OptimizationProgram
+from cloud.models.virtual_link import VirtualLink
+from cloud.models.virtual_machine import VirtualMachine
+from cloud.models.virtual_router import VirtualRouter
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Copies log records of the cloud app into the job log while it runs, so the
+# status API shows what the program is doing. Records are written to the
+# database at most every flush_interval seconds.
+class JobLogHandler(logging.Handler):
+    def __init__(self, job, flush_interval=2):
+        logging.Handler.__init__(self, logging.INFO)
+        self.job = job
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.last_flush = time.time()
+        self.buffer_lock = threading.Lock()
+
+    def emit(self, record):
+        with self.buffer_lock:
+            self.buffer.append('[%s] %s' % (time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record.created)), record.getMessage()))
+        if time.time() - self.last_flush > self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self.buffer_lock:
+            if not self.buffer:
+                return
+            lines = self.buffer
+            self.buffer = []
+            self.last_flush = time.time()
+        self.job.write_log(lines)
+
+
+def deploy_slice(job):
+    params = job.get_params()
+    slc = job.slice
+    if slc is None:
+        raise job.JobException('Slice does not exist anymore')
+
+    program = DeploymentProgram.objects.get(pk=params['program_id'])
+    try:
+        program_class = program_registry.get(program)
+    except (ImportError, NotImplementedError, AttributeError) as e:
+        raise job.JobException('Problems loading program: ' + str(e))
+
+    job.set_progress(5, 'Deploying slice %s with program %s' % (slc.name, program.name))
+    algo = program_class()
+    t0 = time.time()
+    try:
+        deployed = algo.deploy(slc)
+    except Exception as e:
+        slc.state = 'created'
+        slc.save()
+        if isinstance(e, algo.DeploymentException):
+            raise job.JobException('Problems deploying slice: ' + str(e))
+        raise
+
+    if not deployed:
+        slc.state = 'created'
+        slc.save()
+        raise job.JobException('Program did not deploy the slice')
+
+    slc.state = 'deployed'
+    slc.deployed_with = program
+    slc.save()
+    message = 'Slice successfully deployed in ' + str(round(time.time() - t0, 2)) + ' seconds'
+
+    # Send new slice information to monitoring system without waiting for it
+    if settings.MONITORING['deploy_with_slices']:
+        monitoring_job = Monitoring.load().deploy_infrastructure(slc, changes_only=True, wait=False)
+        message += ' (monitoring deployment queued as job %d)' % monitoring_job.id
+    return message
+
+
+# Undoes the deployment of a slice (links, VMs and routers) and deletes it
+# when params['delete'] is set. Problems are logged and do not stop it.
+def undeploy_slice(job):
+    params = job.get_params()
+    slc = job.slice
+    if slc is None:
+        raise job.JobException('Slice does not exist anymore')
+
+    links = VirtualLink.objects.filter(belongs_to_slice=slc)
+    vms = VirtualMachine.objects.filter(belongs_to_slice=slc)
+    vrs = VirtualRouter.objects.filter(belongs_to_slice=slc)
+    total = max(1, len(links) + len(vms) + len(vrs))
+    done = 0
+    problems = 0
+
+    for link in links:
+        try:
+            link.unestablish()
+        except BaseModel.ModelException as e:
+            job.append_log('Problems unestablishing a virtual link: ' + str(e))
+            problems += 1
+        done += 1
+        job.set_progress(done * 100 / total)
+
+    for vm in vms:
+        try:
+            vm.undeploy()
+            job.append_log('VM %s was undeployed' % str(vm))
+        except BaseModel.ModelException as e:
+            job.append_log('Problems undeploying a virtual machine: ' + str(e))
+            problems += 1
+        done += 1
+        job.set_progress(done * 100 / total)
+
+    for vr in vrs:
+        try:
+            vr.undeploy()
+            job.append_log('Virtual Router %s was undeployed' % str(vr))
+        except BaseModel.ModelException as e:
+            job.append_log('Problems undeploying a virtual router: ' + str(e))
+            problems += 1
+        done += 1
+        job.set_progress(done * 100 / total)
+
+    name = slc.name
+    if params.get('delete'):
+        slc.delete()
+        logger.info("Slice %s was successfully deleted!" % name)
+        message = 'Slice %s was deleted' % name
+    else:
+        slc.state = 'created'
+        slc.save()
+        message = 'Slice %s was undeployed' % name
+
+    if problems:
+        message += ' (%d problems, see log)' % problems
+    return message
+
+
+def optimize(job):
+    params = job.get_params()
+    program = OptimizationProgram.objects.get(pk=params['program_id'])
+    try:
+        program_class = program_registry.get(program)
+    except (ImportError, NotImplementedError, AttributeError) as e:
+        raise job.JobException('Problems loading program: ' + str(e))
+
+    job.set_progress(5, 'Running optimization program %s' % program.name)
+    algo = program_class()
+    t0 = time.time()
+    try:
+        algo.optimize()
+    except algo.OptimizationException as e:
+        raise job.JobException('Problems executing optimization: ' + str(e))
+    return 'Optimization successfully executed in ' + str(round(time.time() - t0, 2)) + ' seconds'
+
+
+# Sends the infrastructure to the monitoring system
+def deploy_monitoring(job):
+    params = job.get_params()
+    try:
+        response = Monitoring.load().deploy_infrastructure(job.slice, params.get('changes_only', False))
+    except Monitoring.MonitoringException as e:
+        raise job.JobException(str(e))
+    if response is None:
+        return 'Monitoring infrastructure is up to date'
+    if not response.ok():
+        raise job.JobException('Monitoring system replied %d %s' % (response.status, response.reason))
+    return 'Monitoring infrastructure sent'
+
+
+HANDLERS = {
+    'deploy_slice': deploy_slice,
+    'undeploy_slice': undeploy_slice,
+    'optimize': optimize,
+    'deploy_monitoring': deploy_monitoring,
+}
+
+
+# Executes a claimed job and records its outcome
+def run_job(job):
+    handler = HANDLERS.get(job.job_type)
+    if handler is None:
+        job.fail('Unknown job type: ' + job.job_type)
+        return job
+
+    log_handler = JobLogHandler(job)
+    cloud_logger = logging.getLogger('cloud')
+    cloud_logger.addHandler(log_handler)
+    try:
+        result = handler(job)
+        log_handler.flush()
+        job.finish(result)
+        logger.info("Job %d finished: %s" % (job.id, result))
+    except Exception as e:
+        log_handler.flush()
+        error = e.msg if isinstance(e, BaseModel.ModelException) else str(e)
+        logger.error("Job %d failed: %s" % (job.id, error))
+        job.fail(error)
+    finally:
+        cloud_logger.removeHandler(log_handler)
+
+    return job
@@ -0,0 +1,244 @@
+import libvirt
+import logging
+import threading
+import time
+from libvirt import libvirtError
+from django.conf import settings
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+# Connections opened with force_tcp (migrations) are kept apart from the
+# default ones so a TLS and an unencrypted TCP connection can coexist
+POOL_DEFAULT = 'default'
+POOL_TCP = 'tcp'
+
+
+# Raised while a host is still inside its reconnection backoff window
+class ConnectionBackoff(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+    def __str__(self):
+        return repr(self.msg)
+
+
+class _PooledConnection(object):
+    def __init__(self, conn, uri):
+        self.conn = conn
+        self.uri = uri
+        self.opened_at = time.time()
+        self.last_probe = self.opened_at
+
+
+class LibvirtConnectionManager(object):
+    """Shared libvirt connections for every Host
+
+    Keeps one healthy virConnect per host and pool (libvirt connections are
+    thread safe, so they are shared by all threads of the process). Dead
+    connections are detected by keepalive, periodic probing and close
+    callbacks, and reopened with an exponential backoff so a restarting
+    libvirtd is not hammered by every request at the same time.
+    """
+
+    def __init__(self, config=None):
+        self.config = dict(settings.LIBVIRT_CONNECTIONS)
+        if config is not None:
+            self.config.update(config)
+
+        # Guards the dictionaries below (never held while talking to libvirt)
+        self._lock = threading.Lock()
+        # {(pool, host_id): _PooledConnection}
+        self._connections = {}
+        # {(pool, host_id): threading.Lock} serializes opening per host
+        self._open_locks = {}
+        # {(pool, host_id): (consecutive failures, next attempt timestamp)}
+        self._failures = {}
+        # Counters for benchmarking and debugging
+        self._stats = {'hits': 0, 'opened': 0, 'failed': 0, 'evicted': 0}
+
+        self._event_loop = None
+
+    # Returns a healthy connection for host, opening a new one if needed.
+    # May raise libvirtError (could not open) or ConnectionBackoff.
+    def get(self, host, force_tcp=False):
+        pool = POOL_TCP if force_tcp and host.transport == 'tls' else POOL_DEFAULT
+        key = (pool, host.id)
+        uri = host.get_libvirt_uri(force_tcp=force_tcp)
+
+        entry = self._lookup(key, uri)
+        if entry is not None:
+            return entry.conn
+
+        # Only one thread opens the connection for a host, the others wait
+        # and reuse it
+        with self._open_lock(key):
+            entry = self._lookup(key, uri)
+            if entry is not None:
+                return entry.conn
+
+            self._check_backoff(key, uri)
+            self._start_event_loop()
+
+            try:
+                conn = host.open_libvirt_connection(uri)
+            except libvirtError:
+                self._record_failure(key)
+                raise
+
+            self._setup(key, conn)
+
+            with self._lock:
+                self._connections[key] = _PooledConnection(conn, uri)
+                self._failures.pop(key, None)
+                self._stats['opened'] += 1
+
+            logger.debug('New libvirt connection (%s pool): %s' % (pool, uri))
+            return conn
+
+    # Drops connections of a host (all pools by default)
+    def evict(self, host_id, pool=None):
+        pools = [pool] if pool is not None else [POOL_DEFAULT, POOL_TCP]
+        for p in pools:
+            with self._lock:
+                entry = self._connections.pop((p, host_id), None)
+            if entry is not None:
+                self._close(entry)
+
+    def close_all(self):
+        with self._lock:
+            entries = self._connections.values()
+            self._connections = {}
+        for entry in entries:
+            self._close(entry)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = len(self._connections)
+        return stats
+
+    # Returns the pooled entry if it is still usable, evicting it otherwise
+    def _lookup(self, key, uri):
+        with self._lock:
+            entry = self._connections.get(key)
+        if entry is None:
+            return None
+
+        if entry.uri == uri and self._is_healthy(entry):
+            with self._lock:
+                self._stats['hits'] += 1
+            return entry
+
+        # Host settings changed or connection is dead
+        with self._lock:
+            if self._connections.get(key) is entry:
+                del self._connections[key]
+                self._stats['evicted'] += 1
+        self._close(entry)
+        return None
+
+    def _is_healthy(self, entry):
+        try:
+            # Local check, updated by the keepalive protocol
+            if not entry.conn.isAlive():
+                return False
+        except (libvirtError, AttributeError):
+            pass
+
+        now = time.time()
+        if now - entry.last_probe < self.config['probe_interval']:
+            return True
+
+        # Cheap round trip to make sure the daemon still answers
+        try:
+            entry.conn.getLibVersion()
+        except libvirtError as e:
+            logger.warning('Dropping stale libvirt connection %s: %s' % (entry.uri, str(e)))
+            return False
+
+        entry.last_probe = now
+        return True
+
+    def _setup(self, key, conn):
+        try:
+            conn.setKeepAlive(self.config['keepalive_interval'], self.config['keepalive_count'])
+        except (libvirtError, AttributeError) as e:
+            # Local and test drivers do not support keepalive
+            logger.debug('Keepalive not enabled for %s: %s' % (str(key), str(e)))
+
+        try:
+            conn.registerCloseCallback(self._close_callback, key)
+        except (libvirtError, AttributeError) as e:
+            logger.debug('Close callback not registered for %s: %s' % (str(key), str(e)))
+
+    # Called by libvirt (event loop thread) when a connection is closed
+    def _close_callback(self, conn, reason, key):
+        logger.warning('libvirt connection closed for %s (reason %d)' % (str(key), reason))
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is not None and entry.conn == conn:
+                del self._connections[key]
+                self._stats['evicted'] += 1
+
+    def _close(self, entry):
+        try:
+            entry.conn.unregisterCloseCallback()
+        except (libvirtError, AttributeError):
+            pass
+        try:
+            entry.conn.close()
+        except libvirtError:
+            pass
+
+    def _open_lock(self, key):
+        with self._lock:
+            if key not in self._open_locks:
+                self._open_locks[key] = threading.Lock()
+            return self._open_locks[key]
+
+    def _check_backoff(self, key, uri):
+        with self._lock:
+            failure = self._failures.get(key)
+        if failure is not None and time.time() < failure[1]:
+            raise ConnectionBackoff(
+                'Not reconnecting to %s for another %.1f s (%d failed attempts)' %
+                (uri, failure[1] - time.time(), failure[0])
+            )
+
+    def _record_failure(self, key):
+        with self._lock:
+            count = self._failures.get(key, (0, 0))[0] + 1
+            delay = min(
+                self.config['backoff_initial'] * (2 ** (count - 1)),
+                self.config['backoff_max']
+            )
+            self._failures[key] = (count, time.time() + delay)
+            self._stats['failed'] += 1
+
+    # Keepalive and close callbacks need a running libvirt event loop
+    def _start_event_loop(self):
+        with self._lock:
+            if self._event_loop is not None:
+                return
+            self._event_loop = threading.Thread(target=self._run_event_loop, name='libvirt-event-loop')
+            self._event_loop.daemon = True
+
+        try:
+            libvirt.virEventRegisterDefaultImpl()
+        except libvirtError as e:
+            logger.warning('Could not register libvirt event loop: %s' % str(e))
+            return
+        self._event_loop.start()
+
+    def _run_event_loop(self):
+        while True:
+            try:
+                libvirt.virEventRunDefaultImpl()
+            except libvirtError as e:
+                logger.warning('libvirt event loop error: %s' % str(e))
+                time.sleep(1)
+
+
+# Process wide manager used by the models
+connections = LibvirtConnectionManager()
@@ -0,0 +1,167 @@
+import inspect
+import logging
+import time
+from collections import namedtuple
+from django.conf import settings
+from django.db import connection
+from cloud.helpers.parallel import run_parallel
+from cloud.helpers.programs import registry as program_registry
+from cloud.models.host import Host
+from cloud.models.metric import Metric
+from cloud.models.metric_series import MetricSeries
+from cloud.models.virtual_machine import VirtualMachine
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+# States of the slices whose metrics are collected (optimizations are
+# decided from the metrics of the slice being optimized)
+COLLECTED_SLICE_STATES = ('deployed', 'optimizing')
+
+# Value stored for a series, passed to the collector listeners. slice_id is
+# the slice of the VM the sample was collected for (None otherwise)
+Sample = namedtuple('Sample', ['metric', 'target', 'field', 'timestamp', 'value', 'slice_id'])
+
+
+# Numeric values of a metric result indexed by field name. Dictionaries and
+# lists are flattened joining keys and indexes with dots, anything that is
+# not a number is ignored.
+def flatten(value, prefix=''):
+    numbers = {}
+    if isinstance(value, (int, long, float)):
+        numbers[prefix] = float(value)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            numbers.update(flatten(item, prefix + '.' + str(key) if prefix else str(key)))
+    elif isinstance(value, (list, tuple)):
+        for i, item in enumerate(value):
+            numbers.update(flatten(item, prefix + '.' + str(i) if prefix else str(i)))
+    elif isinstance(value, basestring):
+        try:
+            numbers[prefix] = float(value)
+        except ValueError:
+            pass
+    return numbers
+
+
+# Collection of a metric for one target
+class CollectTask(object):
+    def __init__(self, metric, instance, target, kwargs, slice_id=None):
+        self.metric = metric
+        self.instance = instance
+        self.target = target
+        self.kwargs = kwargs
+        self.slice_id = slice_id
+
+    def run(self):
+        return self.instance.collect(**self.kwargs)
+
+    def __str__(self):
+        return '%s %s' % (self.metric.name, self.target)
+
+
+class MetricCollector(object):
+    """Periodic collection of the enabled metrics
+
+    Metrics taking a vm_name or host_name parameter are collected for every
+    VM or host (only the members of deployed slices for slice scoped
+    metrics), the other ones once. Every metric is collected each
+    Metric.interval seconds; all collections due run in parallel and are
+    abandoned after Metric.timeout seconds. Numeric results are stored in
+    MetricSeries and passed to the listeners (see subscribe).
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or settings.METRICS['max_workers']
+        self.listeners = []
+        # Next collection time by metric id
+        self.next_run = {}
+
+    # listener(samples) is called with the list of Sample stored after
+    # every collection round
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def tasks_for(self, metric):
+        metric_class = program_registry.get(metric)
+        instance = metric_class()
+        args = inspect.getargspec(metric_class.collect).args
+
+        if 'vm_name' in args:
+            vms = VirtualMachine.objects.all()
+            if metric.scope == 'slice':
+                vms = vms.filter(belongs_to_slice__state__in=COLLECTED_SLICE_STATES)
+            return [CollectTask(metric, instance, 'vm:' + vm.name, {'vm_name': vm.name}, vm.belongs_to_slice_id)
+                for vm in vms.only('name', 'belongs_to_slice')]
+
+        if 'host_name' in args:
+            hosts = Host.objects.all()
+            if metric.scope == 'slice':
+                hosts = hosts.filter(virtualmachine__belongs_to_slice__state__in=COLLECTED_SLICE_STATES).distinct()
+            return [CollectTask(metric, instance, 'host:' + host.hostname, {'host_name': host.hostname})
+                for host in hosts.only('hostname')]
+
+        return [CollectTask(metric, instance, '', {})]
+
+    def due(self, now):
+        metrics = []
+        for metric in Metric.objects.filter(state='enabled').exclude(returns='text'):
+            if self.next_run.get(metric.id, 0) <= now:
+                self.next_run[metric.id] = now + metric.interval
+                metrics.append(metric)
+        return metrics
+
+    # Collects the metrics due (or the given ones) and stores the samples
+    # Returns the list of Sample stored
+    def collect(self, metrics=None, now=None):
+        if now is None:
+            now = time.time()
+        if metrics is None:
+            metrics = self.due(now)
+
+        tasks = []
+        for metric in metrics:
+            try:
+                tasks.extend(self.tasks_for(metric))
+            except (ImportError, NotImplementedError, AttributeError) as e:
+                logger.error('Problems loading metric %s: %s' % (metric.name, str(e)))
+
+        results = {}
+        for task in run_parallel(lambda t: t.run(), tasks, self.max_workers, timeout=lambda t: t.metric.timeout):
+            if task.timed_out:
+                # Already logged by run_parallel
+                continue
+            if task.error is not None:
+                logger.warning('Problems collecting metric %s: %s' % (str(task.item), str(task.error)))
+            else:
+                results.setdefault(task.item.metric, []).append((task.item, task.result))
+
+        samples = []
+        for metric, collected in results.items():
+            slices = {}
+            values = []
+            for task, result in collected:
+                slices[task.target] = task.slice_id
+                for field, value in flatten(result).items():
+                    values.append((task.target, field, value))
+            for target, field, value in MetricSeries.record(metric, values, now):
+                samples.append(Sample(metric, target, field, now, value, slices[target]))
+
+        for listener in self.listeners:
+            try:
+                listener(samples)
+            except Exception as e:
+                logger.exception('Metric listener failed: %s' % str(e))
+        return samples
+
+    def run(self, tick=None):
+        if tick is None:
+            tick = settings.METRICS['tick']
+        while True:
+            started = time.time()
+            samples = self.collect(now=started)
+            if samples:
+                logger.debug('%d samples collected in %.2f s' % (len(samples), time.time() - started))
+            # Do not keep a connection open while idle
+            connection.close()
+            time.sleep(max(0, tick - (time.time() - started)))
@@ -0,0 +1,84 @@
+import base64
+import httplib
+import logging
+import socket
+import time
+import zlib
+from django.conf import settings
+from cloud.helpers.http import get_pool
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+class MonitoringTransportException(Exception):
+    pass
+
+
+# Compresses a sequence of strings into a gzip stream
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class MonitoringTransport(object):
+    """HTTP client of the monitoring system
+
+    Requests use the shared keep-alive connections of the server (see
+    cloud.helpers.http.get_pool) and bodies are sent with chunked transfer
+    encoding while they are generated, gzip compressed when
+    settings.MONITORING['compress'] is set. Connection errors, timeouts and
+    5xx replies are retried settings.MONITORING['retries'] times, waiting
+    backoff, 2 * backoff, 4 * backoff... seconds between attempts.
+    """
+
+    def __init__(self, hostname, username='', password='', timeout=None, retries=None, backoff=None, compress=None):
+        conf = settings.MONITORING
+        self.pool = get_pool('http://' + hostname, timeout or conf['timeout'], conf['pool_size'])
+        self.username = username
+        self.password = password
+        self.retries = conf['retries'] if retries is None else retries
+        self.backoff = conf['backoff'] if backoff is None else backoff
+        self.compress = conf['compress'] if compress is None else compress
+
+    def headers(self):
+        headers = {
+            'User-Agent': 'Python post',
+            'Content-Type': 'text/xml; charset="UTF-8"',
+        }
+        if self.username != '' and self.password != '':
+            headers['Authorization'] = 'Basic ' + base64.b64encode('%s:%s' % (self.username, self.password))
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+        return headers
+
+    # body() returns the strings of the document, it is called again for
+    # every attempt. Returns the cloud.helpers.http.HTTPResponse.
+    def post(self, path, body):
+        def encoded():
+            if self.compress:
+                return gzip_chunks(body())
+            return body()
+
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                delay = self.backoff * 2 ** (attempt - 1)
+                logger.info('Monitoring system request failed (%s), trying again in %s seconds' % (error, delay))
+                time.sleep(delay)
+            try:
+                response = self.pool.request('POST', path, encoded, self.headers())
+            except (httplib.HTTPException, socket.error) as e:
+                error = '%s: %s' % (e.__class__.__name__, str(e))
+                continue
+            if response.status < 500:
+                return response
+            error = '%d %s' % (response.status, response.reason)
+
+        raise MonitoringTransportException(
+            'Could not reach the monitoring system after %d attempts: %s' % (self.retries + 1, error)
+        )
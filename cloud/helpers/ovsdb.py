@@ -0,0 +1,448 @@
+import json
+import logging
+import socket
+import threading
+from django.conf import settings
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+DATABASE = 'Open_vSwitch'
+
+# Tables and columns kept in the local replica of every connection
+MONITORED = {
+    'Open_vSwitch': ['bridges'],
+    'Bridge': ['name', 'ports', 'controller', 'other_config'],
+    'Port': ['name', 'interfaces'],
+    'Interface': ['name', 'type', 'options'],
+    'Controller': ['target'],
+}
+
+
+class OVSDBException(Exception):
+    pass
+
+
+# Splits an Open vSwitch database address (unix:<path> or tcp:<ip>:<port>)
+def parse_address(address):
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    if address.startswith('tcp:'):
+        host, port = address[4:].rsplit(':', 1)
+        return socket.AF_INET, (host, int(port))
+    raise OVSDBException('Unsupported Open vSwitch database address: ' + address)
+
+
+# OVSDB values (RFC 7047 section 5.1)
+def uuid_atom(uuid):
+    return ['uuid', uuid]
+
+
+def named_uuid(name):
+    return ['named-uuid', name]
+
+
+def ovs_set(items):
+    return ['set', list(items)]
+
+
+def ovs_map(items):
+    return ['map', [[k, v] for k, v in items.items()]]
+
+
+# Decodes a set (or a single atom) into a list of python values
+def from_set(value):
+    if isinstance(value, list) and len(value) == 2 and value[0] == 'set':
+        return [from_atom(v) for v in value[1]]
+    return [from_atom(value)]
+
+
+def from_atom(value):
+    if isinstance(value, list) and len(value) == 2 and value[0] in ('uuid', 'named-uuid'):
+        return value[1]
+    return value
+
+
+def from_map(value):
+    if isinstance(value, list) and len(value) == 2 and value[0] == 'map':
+        return dict((from_atom(k), from_atom(v)) for k, v in value[1])
+    return {}
+
+
+class Replica(object):
+    """Local copy of the monitored tables, kept up to date by the updates
+    the server sends after every change, used for read-only checks"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tables = dict((table, {}) for table in MONITORED)
+
+    def reset(self):
+        with self.lock:
+            self.tables = dict((table, {}) for table in MONITORED)
+
+    def update(self, updates):
+        with self.lock:
+            for table, rows in updates.items():
+                rows_table = self.tables.setdefault(table, {})
+                for uuid, change in rows.items():
+                    new = change.get('new')
+                    if new is None:
+                        rows_table.pop(uuid, None)
+                    else:
+                        rows_table.setdefault(uuid, {}).update(new)
+
+    # Uuid of the row of a table with the given name
+    def find(self, table, name):
+        with self.lock:
+            for uuid, row in self.tables[table].items():
+                if row.get('name') == name:
+                    return uuid
+        return None
+
+    def bridge_names(self):
+        with self.lock:
+            return [row['name'] for row in self.tables['Bridge'].values()]
+
+    def bridge_exists(self, name):
+        return self.find('Bridge', name) is not None
+
+    # Name of the bridge that has a port (or None)
+    def port_to_bridge(self, name):
+        port = self.find('Port', name)
+        if port is None:
+            return None
+        with self.lock:
+            for row in self.tables['Bridge'].values():
+                if port in from_set(row.get('ports', ovs_set([]))):
+                    return row['name']
+        return None
+
+    def bridge_ports(self, name):
+        bridge = self.find('Bridge', name)
+        if bridge is None:
+            return []
+        with self.lock:
+            ports = self.tables['Port']
+            uuids = from_set(self.tables['Bridge'][bridge].get('ports', ovs_set([])))
+            return [ports[u]['name'] for u in uuids if u in ports]
+
+
+# Response expected by a call
+class Waiter(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class OVSDBConnection(object):
+    """JSON-RPC connection (RFC 7047) to the Open vSwitch database of a host
+
+    A reader thread receives responses, answers echo requests and applies
+    monitor updates to the replica, so several threads may call the
+    server at the same time through the same connection.
+    """
+
+    def __init__(self, address, timeout=None):
+        self.address = address
+        self.timeout = timeout or settings.OVSDB['timeout']
+        self.lock = threading.Lock()
+        self.connect_lock = threading.Lock()
+        self.sock = None
+        self.closed = True
+        self.pending = {}
+        self.next_id = 0
+        self.monitor_id = None
+        self.replica = Replica()
+
+    def connect(self):
+        with self.connect_lock:
+            if not self.closed:
+                return
+            if self.sock is not None:
+                self.sock.close()
+            family, address = parse_address(self.address)
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(address)
+            except socket.error as e:
+                sock.close()
+                raise OVSDBException('Could not connect to ' + self.address + ': ' + str(e))
+            sock.settimeout(None)
+            self.sock = sock
+            self.closed = False
+
+            reader = threading.Thread(target=self.read, args=(sock,))
+            reader.daemon = True
+            reader.start()
+
+            # The replica is filled by the reader thread when the response
+            # arrives, before any update that follows it
+            self.replica.reset()
+            tables = dict((table, {'columns': columns}) for table, columns in MONITORED.items())
+            try:
+                self.call('monitor', [DATABASE, None, tables], monitor=True)
+            except OVSDBException:
+                self.close()
+                raise
+            logger.debug('Connected to Open vSwitch database at ' + self.address)
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+                self.sock.close()
+            self.closed = True
+
+    def send(self, message):
+        try:
+            self.sock.sendall(json.dumps(message))
+        except socket.error as e:
+            self.closed = True
+            raise OVSDBException('Connection to ' + self.address + ' lost: ' + str(e))
+
+    def call(self, method, params, monitor=False):
+        waiter = Waiter()
+        with self.lock:
+            if self.closed:
+                raise OVSDBException('Not connected to ' + self.address)
+            request_id = self.next_id
+            self.next_id += 1
+            self.pending[request_id] = waiter
+            if monitor:
+                self.monitor_id = request_id
+            self.send({'method': method, 'params': params, 'id': request_id})
+
+        if not waiter.event.wait(self.timeout):
+            with self.lock:
+                self.pending.pop(request_id, None)
+            raise OVSDBException('Timeout waiting for %s at %s' % (method, self.address))
+        if waiter.error is not None:
+            raise OVSDBException('%s failed at %s: %s' % (method, self.address, str(waiter.error)))
+        return waiter.result
+
+    def read(self, sock):
+        decoder = json.JSONDecoder()
+        buf = ''
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                buf += data
+                # Messages are concatenated JSON objects without separators
+                while True:
+                    buf = buf.lstrip()
+                    if not buf:
+                        break
+                    try:
+                        message, end = decoder.raw_decode(buf)
+                    except ValueError:
+                        # Incomplete message
+                        break
+                    buf = buf[end:]
+                    self.handle(message)
+        except socket.error as e:
+            logger.debug('Open vSwitch database connection closed (' + self.address + '): ' + str(e))
+        finally:
+            pending = {}
+            with self.lock:
+                # A new connection may have replaced this one already
+                if self.sock is sock:
+                    self.closed = True
+                    pending = self.pending
+                    self.pending = {}
+            for waiter in pending.values():
+                waiter.error = 'connection closed'
+                waiter.event.set()
+
+    def handle(self, message):
+        method = message.get('method')
+        if method == 'echo':
+            with self.lock:
+                self.send({'id': message['id'], 'result': message['params'], 'error': None})
+        elif method == 'update':
+            self.replica.update(message['params'][1])
+        elif method is None:
+            with self.lock:
+                waiter = self.pending.pop(message.get('id'), None)
+            if waiter is None:
+                return
+            if message.get('id') == self.monitor_id and message.get('error') is None:
+                self.replica.update(message['result'])
+            waiter.result = message.get('result')
+            waiter.error = message.get('error')
+            waiter.event.set()
+
+    # Executes a list of operations atomically
+    def transact(self, operations):
+        result = self.call('transact', [DATABASE] + list(operations))
+        errors = [r for r in result if r is not None and 'error' in r]
+        if errors:
+            raise OVSDBException('; '.join('%s: %s' % (e['error'], e.get('details', '')) for e in errors))
+        return result
+
+    def transaction(self):
+        return Transaction(self)
+
+
+class Transaction(object):
+    """Changes to bridges, ports and interfaces sent in a single transact
+
+    Existence checks (may_exist/if_exists) are answered by the replica, so
+    building a transaction does not talk to the server.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.replica = connection.replica
+        self.operations = []
+        self.counter = 0
+        self.new_bridges = {}
+        self.new_ports = {}
+        self.deleted_ports = set()
+
+    def new_name(self, prefix):
+        self.counter += 1
+        return '%s%d' % (prefix, self.counter)
+
+    def bridge_ref(self, name):
+        if name in self.new_bridges:
+            return named_uuid(self.new_bridges[name])
+        uuid = self.replica.find('Bridge', name)
+        if uuid is None:
+            raise OVSDBException('No bridge named ' + name)
+        return uuid_atom(uuid)
+
+    def bridge_exists(self, name):
+        return name in self.new_bridges or self.replica.bridge_exists(name)
+
+    def port_to_bridge(self, name):
+        if name in self.new_ports:
+            return self.new_ports[name]
+        if name in self.deleted_ports:
+            return None
+        return self.replica.port_to_bridge(name)
+
+    def add_bridge(self, name, may_exist=False, datapath_id=None):
+        if self.bridge_exists(name):
+            if may_exist:
+                return self
+            raise OVSDBException('Bridge ' + name + ' already exists')
+
+        iface = self.new_name('iface')
+        port = self.new_name('port')
+        bridge = self.new_name('bridge')
+        row = {'name': name, 'ports': named_uuid(port)}
+        if datapath_id is not None:
+            row['other_config'] = ovs_map({'datapath-id': datapath_id})
+
+        self.operations.extend([
+            {'op': 'insert', 'table': 'Interface', 'row': {'name': name, 'type': 'internal'}, 'uuid-name': iface},
+            {'op': 'insert', 'table': 'Port', 'row': {'name': name, 'interfaces': named_uuid(iface)}, 'uuid-name': port},
+            {'op': 'insert', 'table': 'Bridge', 'row': row, 'uuid-name': bridge},
+            {'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+             'mutations': [['bridges', 'insert', ovs_set([named_uuid(bridge)])]]},
+        ])
+        self.new_bridges[name] = bridge
+        self.new_ports[name] = name
+        return self
+
+    # Ports and interfaces of the bridge are garbage collected by the server
+    def del_bridge(self, name, if_exists=False):
+        uuid = self.replica.find('Bridge', name)
+        if uuid is None:
+            if if_exists:
+                return self
+            raise OVSDBException('No bridge named ' + name)
+        self.operations.append({'op': 'mutate', 'table': 'Open_vSwitch', 'where': [],
+                                'mutations': [['bridges', 'delete', ovs_set([uuid_atom(uuid)])]]})
+        return self
+
+    def add_port(self, bridge, name, may_exist=False, type=None, options=None):
+        current = self.port_to_bridge(name)
+        if current is not None:
+            if may_exist and current == bridge:
+                return self
+            raise OVSDBException('Port ' + name + ' already exists on ' + current)
+
+        iface = self.new_name('iface')
+        port = self.new_name('port')
+        iface_row = {'name': name}
+        if type is not None:
+            iface_row['type'] = type
+        if options:
+            iface_row['options'] = ovs_map(options)
+
+        self.operations.extend([
+            {'op': 'insert', 'table': 'Interface', 'row': iface_row, 'uuid-name': iface},
+            {'op': 'insert', 'table': 'Port', 'row': {'name': name, 'interfaces': named_uuid(iface)}, 'uuid-name': port},
+            {'op': 'mutate', 'table': 'Bridge', 'where': [['_uuid', '==', self.bridge_ref(bridge)]],
+             'mutations': [['ports', 'insert', ovs_set([named_uuid(port)])]]},
+        ])
+        self.new_ports[name] = bridge
+        self.deleted_ports.discard(name)
+        return self
+
+    # Without bridge the port is removed from whatever bridge has it
+    def del_port(self, bridge, name, if_exists=False):
+        current = self.port_to_bridge(name)
+        if current is None or (bridge is not None and current != bridge) or name in self.new_ports:
+            if if_exists and name not in self.new_ports:
+                return self
+            raise OVSDBException('No port ' + name + ' in bridge ' + str(bridge or current))
+
+        uuid = self.replica.find('Port', name)
+        self.operations.append({'op': 'mutate', 'table': 'Bridge', 'where': [['_uuid', '==', self.bridge_ref(current)]],
+                                'mutations': [['ports', 'delete', ovs_set([uuid_atom(uuid)])]]})
+        self.deleted_ports.add(name)
+        return self
+
+    # Replaces the controllers of a bridge (targets like tcp:ip:port)
+    def set_controller(self, bridge, targets):
+        controllers = []
+        for target in targets:
+            name = self.new_name('controller')
+            self.operations.append({'op': 'insert', 'table': 'Controller', 'row': {'target': target}, 'uuid-name': name})
+            controllers.append(named_uuid(name))
+        self.operations.append({'op': 'update', 'table': 'Bridge', 'where': [['_uuid', '==', self.bridge_ref(bridge)]],
+                                'row': {'controller': ovs_set(controllers)}})
+        return self
+
+    def commit(self):
+        if not self.operations:
+            return []
+        result = self.connection.transact(self.operations)
+        self.operations = []
+        return result
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+# Shared connection to the database of a host (one per address)
+def connection_for(address):
+    with _connections_lock:
+        conn = _connections.get(address)
+        if conn is None:
+            conn = OVSDBConnection(address)
+            _connections[address] = conn
+    if conn.closed:
+        conn.connect()
+    return conn
+
+
+# Shared connection to the database of a host when it is already open
+# (None otherwise), never connects
+def open_connection(address):
+    with _connections_lock:
+        conn = _connections.get(address)
+    if conn is None or conn.closed:
+        return None
+    return conn
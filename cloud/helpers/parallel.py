@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+from django.db import connection
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Result of one task executed by run_parallel
+class TaskResult(object):
+    def __init__(self, item):
+        self.item = item
+        self.result = None
+        self.error = None
+        self.timed_out = False
+        self.started = None
+        self.elapsed = None
+        self.timeout = None
+        self.done = threading.Event()
+
+    def ok(self):
+        return self.done.is_set() and self.error is None and not self.timed_out
+
+
+# Runs func(item) for every item using at most max_workers threads at a
+# time. Tasks running for more than timeout seconds are abandoned (their
+# thread keeps running in background but stops holding a worker slot);
+# timeout may also be a function returning the timeout of each item.
+# Returns a list of TaskResult in the same order of items; exceptions are
+# stored in TaskResult.error instead of being raised.
+def run_parallel(func, items, max_workers=8, timeout=None):
+    tasks = [TaskResult(item) for item in items]
+    for task in tasks:
+        task.timeout = timeout(task.item) if callable(timeout) else timeout
+    changed = threading.Event()
+
+    def worker(task):
+        try:
+            task.result = func(task.item)
+        except Exception as e:
+            task.error = e
+        finally:
+            task.elapsed = time.time() - task.started
+            # Every thread gets its own database connection from Django,
+            # close it so they do not pile up in the database server
+            connection.close()
+            task.done.set()
+            changed.set()
+
+    pending = list(tasks)
+    active = []
+    while pending or active:
+        # Fill free worker slots
+        while pending and len(active) < max(1, max_workers):
+            task = pending.pop(0)
+            task.started = time.time()
+            t = threading.Thread(target=worker, args=(task,))
+            t.daemon = True
+            t.start()
+            active.append(task)
+
+        changed.clear()
+        now = time.time()
+        wait = None
+        for task in list(active):
+            if task.done.is_set():
+                active.remove(task)
+            elif task.timeout is not None and now - task.started >= task.timeout:
+                task.timed_out = True
+                task.elapsed = now - task.started
+                logger.warning('Task for %s timed out after %.1f s' % (str(task.item), task.elapsed))
+                active.remove(task)
+            elif task.timeout is not None:
+                remaining = task.timeout - (now - task.started)
+                wait = remaining if wait is None else min(wait, remaining)
+
+        # Sleep until a task finishes or the next deadline expires
+        if active and (not pending or len(active) >= max_workers):
+            changed.wait(wait)
+
+    return tasks
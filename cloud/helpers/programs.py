@@ -0,0 +1,173 @@
+import hashlib
+import imp
+import logging
+import os
+import sys
+import threading
+import time
+from cloud.metrics.metric import Metric as BaseMetric
+from cloud.models.deployment_program import DeploymentProgram
+from cloud.models.metric import Metric
+from cloud.models.optimization_program import OptimizationProgram
+from cloud.models.program import Program
+from cloud.programs.deployment_program import DeploymentProgram as BaseDeploymentProgram
+from cloud.programs.optimization_program import OptimizationProgram as BaseOptimizationProgram
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+# Base class and method every kind of uploaded program must implement
+KINDS = {
+    'deployment': (BaseDeploymentProgram, 'deploy'),
+    'optimization': (BaseOptimizationProgram, 'optimize'),
+    'metric': (BaseMetric, 'collect'),
+}
+
+
+# Raised when an uploaded program can not be loaded. It is an ImportError so
+# callers handling the errors of __import__ keep working.
+class ProgramLoadError(ImportError):
+    pass
+
+
+# Program loaded from a file, valid while the file does not change
+class LoadedProgram(object):
+    def __init__(self, path, mtime, size, digest, program_class):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.program_class = program_class
+
+
+class ProgramRegistry(object):
+    """Classes of the uploaded deployment/optimization programs and metrics
+
+    Programs are stored as MEDIA_ROOT/programs/<ClassName>.py (metrics in
+    MEDIA_ROOT/metrics) and the main class must have the same name as the
+    file. Files are compiled and executed once, then the class is reused
+    until the modification time or size of the file changes (and its
+    contents too, files are also identified by their SHA-1). Compiled code
+    is kept by SHA-1, so a program validated at upload time is not compiled
+    again. Classes must extend the base class of their kind and implement
+    its main method, otherwise ProgramLoadError is raised.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.loaded = {}
+        self.code = {}
+
+    # Kind of a Program or Metric model instance
+    def kind_of(self, item):
+        if isinstance(item, Metric):
+            return 'metric'
+        if isinstance(item, DeploymentProgram):
+            return 'deployment'
+        if isinstance(item, OptimizationProgram):
+            return 'optimization'
+        if item.is_deployment():
+            return 'deployment'
+        if item.is_optimization():
+            return 'optimization'
+        raise ProgramLoadError('Program %s is neither a deployment nor an optimization program' % item.name)
+
+    def compile(self, source, filename, digest):
+        with self.lock:
+            code = self.code.get(digest)
+        if code is None:
+            try:
+                code = compile(source, filename, 'exec')
+            except SyntaxError as e:
+                raise ProgramLoadError('Syntax error in %s line %s: %s' % (os.path.basename(filename), e.lineno, e.msg))
+            with self.lock:
+                self.code[digest] = code
+        return code
+
+    # Executes the source as module_name and returns the validated class
+    def build(self, kind, source, filename, module_name, class_name, digest):
+        base, method = KINDS[kind]
+        code = self.compile(source, filename, digest)
+        module = imp.new_module(module_name)
+        module.__file__ = filename
+        module.__package__ = module_name.rpartition('.')[0]
+        try:
+            exec code in module.__dict__
+        except Exception as e:
+            raise ProgramLoadError('Problems loading %s: %s: %s' % (os.path.basename(filename), e.__class__.__name__, str(e)))
+
+        program_class = getattr(module, class_name, None)
+        if not isinstance(program_class, type):
+            raise ProgramLoadError('Must implement main class %s in %s' % (class_name, os.path.basename(filename)))
+        if not issubclass(program_class, base):
+            raise ProgramLoadError('Class %s must extend %s' % (class_name, base.__name__))
+        if getattr(program_class, method).im_func is getattr(base, method).im_func:
+            raise ProgramLoadError('Class %s must implement %s()' % (class_name, method))
+        return module, program_class
+
+    # Checks the source of a program before it is saved, returns the
+    # seconds it took to load it. Raises ProgramLoadError.
+    def validate(self, kind, class_name, source):
+        t0 = time.time()
+        if isinstance(source, unicode):
+            source = source.encode('utf-8')
+        digest = hashlib.sha1(source).hexdigest()
+        package = 'cloud.metrics.' if kind == 'metric' else 'cloud.programs.'
+        self.build(kind, source, class_name + '.py', package + class_name, class_name, digest)
+        return time.time() - t0
+
+    def load(self, item, kind=None):
+        path = item.file.path
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            raise ProgramLoadError('Could not read %s: %s' % (path, str(e)))
+
+        with self.lock:
+            entry = self.loaded.get(path)
+            if entry is not None and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+                return entry.program_class
+
+            with open(path) as f:
+                source = f.read()
+            digest = hashlib.sha1(source).hexdigest()
+            if entry is not None and entry.digest == digest:
+                entry.mtime, entry.size = stat.st_mtime, stat.st_size
+                return entry.program_class
+
+            # File name without the '.py' and with '/' replaced by '.'
+            file_path = item.file.name[0:-3].replace("/", ".")
+            class_name = file_path.split(".")[-1]
+            module_name = 'cloud.' + file_path
+
+            t0 = time.time()
+            module, program_class = self.build(kind or self.kind_of(item), source, path, module_name, class_name, digest)
+            sys.modules[module_name] = module
+            self.loaded[path] = LoadedProgram(path, stat.st_mtime, stat.st_size, digest, program_class)
+            logger.info('%s loaded in %.3f seconds' % (module_name, time.time() - t0))
+            return program_class
+
+    # Class of a Program or Metric (model instance or name)
+    def get(self, item):
+        if isinstance(item, basestring):
+            try:
+                item = Program.objects.get(name=item)
+            except Program.DoesNotExist:
+                try:
+                    item = Metric.objects.get(name=item)
+                except Metric.DoesNotExist:
+                    raise ProgramLoadError('No program or metric named %s' % item)
+        return self.load(item)
+
+    # Called when a program is deleted
+    def forget(self, item):
+        if not item.file:
+            return
+        with self.lock:
+            entry = self.loaded.pop(item.file.path, None)
+            if entry is not None:
+                self.code.pop(entry.digest, None)
+
+
+registry = ProgramRegistry()
+
@@ -0,0 +1,213 @@
+import logging
+from django.db import connection
+from cloud.models.image import Image
+from cloud.models.remote_controller import RemoteController
+from cloud.models.virtual_device import VirtualDevice
+from cloud.models.virtual_interface import VirtualInterface
+from cloud.models.virtual_link import VirtualLink
+from cloud.models.virtual_link_qos import VirtualLinkQos
+from cloud.models.virtual_machine import VirtualMachine
+from cloud.models.virtual_router import VirtualRouter
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Reserves count primary keys of model from the sequence of its table
+# (PostgreSQL only, other databases give ids when rows are inserted)
+def allocate_ids(model, count):
+    if count == 0:
+        return []
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+        [model._meta.db_table, count]
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+# bulk_create refuses models extending other models, so the rows of the
+# parent tables are inserted first and then the rows of the model itself
+# (objs must have their ids set). The manager's _insert is the insert used
+# by Model.save and bulk_create themselves (one INSERT for all objs), there
+# is no public API to insert only the fields of the child table.
+def bulk_create_inherited(model, objs):
+    if not objs:
+        return objs
+    for parent in model._meta.parents:
+        parent._base_manager.bulk_create(objs)
+    model._base_manager._insert(objs, fields=model._meta.local_concrete_fields)
+    return objs
+
+
+# Writes every model with one bulk insert, ids are reserved beforehand
+class BulkWriter(object):
+    # Models in the order they are inserted
+    MODELS = (VirtualMachine, VirtualRouter, VirtualInterface, RemoteController, VirtualLink, VirtualLinkQos)
+
+    # counts: number of ids to reserve for each model
+    def __init__(self, counts):
+        self.ids = dict((model, iter(allocate_ids(model, count))) for model, count in counts.items())
+        self.objs = dict((model, []) for model in self.MODELS)
+
+    def new_id(self, model):
+        return next(self.ids[model])
+
+    def add(self, obj):
+        self.objs[type(obj)].append(obj)
+
+    def flush(self):
+        for model in self.MODELS:
+            if model._meta.parents:
+                bulk_create_inherited(model, self.objs[model])
+            else:
+                model.objects.bulk_create(self.objs[model])
+
+
+# Saves every object when it is added, ids are given by the database.
+# MySQL can not reserve ids without inserting rows: taking the greatest id
+# would give again the ids of deleted rows, and MAC addresses, bridge names
+# and cached states are derived from the ids.
+class SaveWriter(object):
+    def new_id(self, model):
+        return None
+
+    def add(self, obj):
+        obj.save()
+
+    def flush(self):
+        pass
+
+
+class SliceImporter(object):
+    """Writes the virtual infrastructure of a SliceGraph to a saved slice
+
+    Images are resolved with one query. On PostgreSQL the ids of devices,
+    interfaces and links are reserved beforehand (so MAC addresses, bridge
+    names and foreign keys are known before inserting) and every model is
+    written with one bulk insert, on other databases every object is saved
+    on its own. Must run inside the transaction of the slice.
+    """
+
+    def __init__(self, slice):
+        self.slice = slice
+
+    # Name of a device of the slice (with the slice name as suffix)
+    def device_name(self, name):
+        slice_name = self.slice.name
+        if len(name) <= len(slice_name) or name[-len(slice_name):] != slice_name:
+            name += "-" + slice_name
+        return name
+
+    def resolve_images(self, graph):
+        images = {}
+        for image in Image.objects.filter(name__in=graph.image_names()).order_by('id'):
+            images.setdefault(image.name, image)
+        for name in graph.image_names():
+            if name not in images:
+                raise self.slice.VXDLException('Could not determine Virtual Machine image: ' + name)
+        return images
+
+    # MAC address, target and bridge names are derived from the ids, they
+    # are set by the save methods of the models when ids are not reserved
+    def new_interface(self, device, alias, if_type='bridge', mac_address=None):
+        interface = VirtualInterface(
+            id=self.writer.new_id(VirtualInterface), attached_to_id=device.id, alias=alias, if_type=if_type,
+            mac_address=mac_address
+        )
+        if interface.id is not None:
+            interface.mac_address = mac_address or interface.gen_mac_address()
+            interface.target = "veth" + str(interface.id)
+        self.writer.add(interface)
+        self.interfaces.append(interface)
+        return interface
+
+    def writer_for(self, graph):
+        if connection.vendor != 'postgresql':
+            return SaveWriter()
+        # Router ports are created for every link end at a router
+        ports = sum(1 for link in graph.links for end in (link.source, link.destination) if end.router is not None)
+        return BulkWriter({
+            VirtualDevice: len(graph.nodes) + len(graph.routers),
+            VirtualInterface: sum(len(node.interfaces) for node in graph.nodes) + ports,
+            VirtualLink: len(graph.links),
+        })
+
+    def save(self, graph):
+        images = self.resolve_images(graph)
+        self.writer = self.writer_for(graph)
+        self.interfaces = []
+
+        # Foreign keys are set by id, with bulk inserts related rows are
+        # inserted at the end
+        vms = []
+        vm_interfaces = {}
+        for node in graph.nodes:
+            device_id = self.writer.new_id(VirtualDevice)
+            vm = VirtualMachine(
+                id=device_id,
+                virtualdevice_ptr_id=device_id,
+                belongs_to_slice=self.slice,
+                name=self.device_name(node.name),
+                memory=node.memory,
+                vcpu=node.vcpu,
+                image=images[node.image],
+            )
+            self.writer.add(vm)
+            vms.append(vm)
+            for v_if in node.interfaces:
+                vm_interfaces[(node.name, v_if.alias)] = self.new_interface(vm, v_if.alias, v_if.if_type, v_if.mac_address)
+
+        vrs = {}
+        routers = []
+        for v_router in graph.routers:
+            device_id = self.writer.new_id(VirtualDevice)
+            vr = VirtualRouter(
+                id=device_id,
+                virtualdevice_ptr_id=device_id,
+                belongs_to_slice=self.slice,
+                name=self.device_name(v_router.name),
+                cp_type=v_router.cp_type,
+                cp_routing_protocol=v_router.cp_routing_protocol,
+                dev_name="br" + str(device_id) if device_id is not None else '',
+                host=None,
+            )
+            self.writer.add(vr)
+            vrs[v_router.name] = vr
+            routers.append(vr)
+            # One controller row for every router using the list
+            for v_controller in graph.controller_lists.get(v_router.controller_list, ()):
+                self.writer.add(RemoteController(
+                    belongs_to_slice=self.slice,
+                    ip=v_controller.ip,
+                    port=v_controller.port,
+                    connection=v_controller.connection,
+                    controller_type=v_controller.controller_type,
+                    controls_vrouter_id=vr.id,
+                ))
+
+        # Routers have no interfaces in VXDL, every link gets a new port
+        router_ports = {}
+
+        def endpoint_interface(end):
+            if end.router is None:
+                return vm_interfaces[(end.node, end.interface)]
+            router_ports[end.router] = router_ports.get(end.router, -1) + 1
+            return self.new_interface(vrs[end.router], "port" + str(router_ports[end.router]))
+
+        for v_link in graph.links:
+            link = VirtualLink(
+                id=self.writer.new_id(VirtualLink),
+                belongs_to_slice=self.slice,
+                if_start_id=endpoint_interface(v_link.source).id,
+                if_end_id=endpoint_interface(v_link.destination).id,
+            )
+            self.writer.add(link)
+            self.writer.add(VirtualLinkQos(belongs_to_virtual_link_id=link.id, **v_link.qos))
+
+        self.writer.flush()
+
+        logger.debug('Slice %s: %d VMs, %d routers, %d interfaces and %d links created' % (
+            self.slice.name, len(vms), len(routers), len(self.interfaces), len(graph.links)
+        ))
+        return vms, routers
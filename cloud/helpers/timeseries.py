@@ -0,0 +1,142 @@
+import struct
+
+# Slot of a ring buffer: bucket number (timestamp / resolution), count, sum,
+# minimum and maximum of the samples that fell into the bucket
+SLOT = struct.Struct('<qIddd')
+
+AGGREGATES = ('avg', 'min', 'max', 'sum', 'count', 'last')
+
+
+class RingBuffer(object):
+    """Fixed number of slots covering resolution seconds each
+
+    Bucket b is stored in slot b % size, so the buffer keeps the last
+    resolution * size seconds and never grows. Slots whose bucket does not
+    match the requested one are stale (overwritten by newer buckets or
+    never written).
+    """
+
+    def __init__(self, resolution, size, data=None):
+        self.resolution = resolution
+        self.size = size
+        if data is not None and len(data) == size * SLOT.size:
+            self.data = bytearray(data)
+        else:
+            self.data = bytearray(size * SLOT.size)
+
+    def span(self):
+        return self.resolution * self.size
+
+    def slot(self, bucket):
+        return SLOT.unpack_from(self.data, (bucket % self.size) * SLOT.size)
+
+    def add(self, timestamp, value):
+        bucket = int(timestamp // self.resolution)
+        offset = (bucket % self.size) * SLOT.size
+        stored, count, total, low, high = SLOT.unpack_from(self.data, offset)
+        if stored == bucket and count > 0:
+            count, total, low, high = count + 1, total + value, min(low, value), max(high, value)
+        elif stored > bucket:
+            # Too old, the slot already holds a newer bucket
+            return False
+        else:
+            count, total, low, high = 1, value, value, value
+        SLOT.pack_into(self.data, offset, bucket, count, total, low, high)
+        return True
+
+    # (timestamp, count, sum, min, max) of the buckets between start and end
+    def points(self, start, end):
+        first = int(start // self.resolution)
+        last = int(end // self.resolution)
+        first = max(first, last - self.size + 1)
+        found = []
+        for bucket in xrange(first, last + 1):
+            stored, count, total, low, high = self.slot(bucket)
+            if stored == bucket and count > 0:
+                found.append((bucket * self.resolution, count, total, low, high))
+        return found
+
+    # Most recent bucket written
+    def last(self):
+        newest = None
+        for i in xrange(self.size):
+            entry = SLOT.unpack_from(self.data, i * SLOT.size)
+            if entry[1] > 0 and (newest is None or entry[0] > newest[0]):
+                newest = entry
+        if newest is None:
+            return None
+        return (newest[0] * self.resolution,) + newest[1:]
+
+
+class TimeSeries(object):
+    """Samples of one series kept at several resolutions
+
+    rollups is a list of (resolution, size) from the finest to the coarsest,
+    every sample is added to all of them (the coarser ones are downsampled
+    rollups keeping count, sum, min and max of each bucket). Queries use the
+    finest buffer that still covers the requested range.
+    """
+
+    def __init__(self, rollups, data=None):
+        self.rings = []
+        offset = 0
+        for resolution, size in rollups:
+            length = size * SLOT.size
+            chunk = None
+            if data is not None and len(data) >= offset + length:
+                chunk = data[offset:offset + length]
+            self.rings.append(RingBuffer(resolution, size, chunk))
+            offset += length
+        # Layout changed (different rollups), start again
+        if data is not None and len(data) != offset:
+            self.rings = [RingBuffer(resolution, size) for resolution, size in rollups]
+
+    def dumps(self):
+        return str(bytearray().join(ring.data for ring in self.rings))
+
+    def add(self, timestamp, value):
+        for ring in self.rings:
+            ring.add(timestamp, value)
+
+    def ring_for(self, start, now, resolution=None):
+        if resolution is not None:
+            for ring in self.rings:
+                if ring.resolution == resolution:
+                    return ring
+            raise ValueError('No rollup with resolution %s' % resolution)
+        for ring in self.rings:
+            if start >= now - ring.span():
+                return ring
+        return self.rings[-1]
+
+    # List of (timestamp, avg, min, max, count) between start and end
+    def points(self, start, end, now, resolution=None):
+        ring = self.ring_for(start, now, resolution)
+        return [(ts, total / count, low, high, count) for ts, count, total, low, high in ring.points(start, end)]
+
+    # (timestamp, value) of the last bucket of the finest resolution
+    def last(self):
+        entry = self.rings[0].last()
+        if entry is None:
+            return None
+        ts, count, total, low, high = entry
+        return ts, total / count
+
+    # One of AGGREGATES over the samples between start and end
+    def aggregate(self, func, start, end, now, resolution=None):
+        if func not in AGGREGATES:
+            raise ValueError('Unknown aggregate %s' % func)
+        buckets = self.ring_for(start, now, resolution).points(start, end)
+        if not buckets:
+            return None
+        if func == 'count':
+            return sum(b[1] for b in buckets)
+        if func == 'sum':
+            return sum(b[2] for b in buckets)
+        if func == 'avg':
+            return sum(b[2] for b in buckets) / sum(b[1] for b in buckets)
+        if func == 'min':
+            return min(b[3] for b in buckets)
+        if func == 'max':
+            return max(b[4] for b in buckets)
+        return buckets[-1][2] / buckets[-1][1]
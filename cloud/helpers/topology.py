@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from django.conf import settings
+from django.core.cache import cache
+from cloud.helpers.floodlight import FloodlightClient
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+# Hop count used when there is no path between two hosts
+UNREACHABLE = 42
+
+
+# Datapath id of the Open vSwitch bridge of a host (see Host.path_to)
+def host_dpid(host):
+    return 'a0b0b4' + str(host.id).zfill(10)
+
+
+# Floodlight writes datapath ids as 00:00:a0:b0:..., routes use plain hex
+def normalize_dpid(dpid):
+    return str(dpid).replace(':', '').lower().zfill(16)
+
+
+# Adjacency sets ({dpid: set(dpid)}) from Floodlight /wm/topology/links/json
+def graph_from_links(links):
+    graph = {}
+    for link in links:
+        src = normalize_dpid(link['src-switch'])
+        dst = normalize_dpid(link['dst-switch'])
+        graph.setdefault(src, set()).add(dst)
+        graph.setdefault(dst, set()).add(src)
+    return graph
+
+
+# Adjacency sets built from the physical infrastructure registered in the
+# database (switch ports connected to host interfaces or to other ports)
+def graph_from_models():
+    # Imported here because cloud.models imports helpers
+    from cloud.models.port import Port
+
+    graph = {}
+
+    def connect(a, b):
+        graph.setdefault(a, set()).add(b)
+        graph.setdefault(b, set()).add(a)
+
+    ports = Port.objects.select_related('switch').prefetch_related(
+        'connected_interfaces__attached_to', 'connected_ports__switch'
+    )
+    for port in ports:
+        switch = 'switch' + str(port.switch_id)
+        graph.setdefault(switch, set())
+        for interface in port.connected_interfaces.all():
+            connect(switch, host_dpid(interface.attached_to))
+        for other in port.connected_ports.all():
+            if other.switch_id != port.switch_id:
+                connect(switch, 'switch' + str(other.switch_id))
+    return graph
+
+
+# Identifies a topology, equal graphs always have the same version
+def graph_version(graph):
+    edges = []
+    for node in sorted(graph):
+        for neighbour in sorted(graph[node]):
+            if node < neighbour:
+                edges.append(node + '-' + neighbour)
+    return hashlib.md5(','.join(edges)).hexdigest()
+
+
+# Breadth-first search from node, returns {node: edges} and {node: previous node}
+def bfs(graph, start):
+    distances = {start: 0}
+    previous = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        for neighbour in graph.get(node, ()):
+            if neighbour not in distances:
+                distances[neighbour] = distances[node] + 1
+                previous[neighbour] = node
+                queue.append(neighbour)
+    return distances, previous
+
+
+# Hop counts between all pairs of nodes. Hops are the number of switches
+# in the path (edges + 1), the same as len(path) / 2 of a Floodlight route
+def all_pairs_hops(graph):
+    matrix = {}
+    for node in graph:
+        distances, previous = bfs(graph, node)
+        matrix[node] = dict((n, d + 1) for n, d in distances.items())
+    return matrix
+
+
+class TopologyService(object):
+    """Distances between hosts computed from the whole network graph
+
+    The link list is fetched once from the controller (or read from the
+    local Switch/Port/Interface models when the controller is not
+    reachable) and reused for settings.TOPOLOGY['refresh'] seconds. The
+    all-pairs matrix is computed with BFS and cached under the version of
+    the topology, so it is only recomputed when links change.
+    """
+
+    def __init__(self, base_url=None):
+        self.client = FloodlightClient(base_url, timeout=settings.TOPOLOGY['timeout'])
+        self.lock = threading.Lock()
+        self._graph = None
+        self._graph_version = None
+        self._fetched = 0
+        self._version = None
+        self._matrix = None
+
+    def fetch_links(self):
+        return self.client.links()
+
+    def graph(self, force=False):
+        with self.lock:
+            if force or self._graph is None or time.time() - self._fetched > settings.TOPOLOGY['refresh']:
+                graph = None
+                if settings.TOPOLOGY['source'] == 'controller':
+                    try:
+                        graph = graph_from_links(self.fetch_links())
+                    except (IOError, ValueError, KeyError) as e:
+                        logger.warning('Could not read topology from the controller, using local models: %s' % str(e))
+                if graph is None:
+                    graph = graph_from_models()
+                self._graph = graph
+                self._graph_version = graph_version(graph)
+                self._fetched = time.time()
+            return self._graph
+
+    def matrix(self, force=False):
+        graph = self.graph(force)
+        with self.lock:
+            version = self._graph_version
+            if self._version != version:
+                key = 'Topology-' + version + '-Hops'
+                matrix = cache.get(key)
+                if matrix is None:
+                    t0 = time.time()
+                    matrix = all_pairs_hops(graph)
+                    cache.set(key, matrix, settings.TOPOLOGY['cache_timeout'])
+                    logger.debug('Computed hops of %d nodes in %.3f s' % (len(graph), time.time() - t0))
+                self._version = version
+                self._matrix = matrix
+            return self._matrix
+
+    # Number of switches between two hosts (1 for the same host)
+    def distance(self, h1, h2, matrix=None):
+        if h1.id == h2.id:
+            return 1
+        if matrix is None:
+            matrix = self.matrix()
+        return matrix.get(host_dpid(h1), {}).get(host_dpid(h2), UNREACHABLE)
+
+    # Datapath ids of the switches between two hosts or None if unreachable
+    def path(self, h1, h2):
+        src = host_dpid(h1)
+        dst = host_dpid(h2)
+        if src == dst:
+            return [src]
+        distances, previous = bfs(self.graph(), src)
+        if dst not in previous:
+            return None
+        output = []
+        node = dst
+        while node is not None:
+            output.append(node)
+            node = previous[node]
+        output.reverse()
+        return output
+
+    # Distances from host to every host of the list, indexed by host name
+    def distances_from(self, host, hosts):
+        matrix = self.matrix()
+        output = {}
+        for h in hosts:
+            output[h.name] = self.distance(host, h, matrix)
+        return output
+
+    # Distances between all hosts of the list ({name: {name: hops}})
+    def host_hops(self, hosts):
+        output = {}
+        for h in hosts:
+            output[h.name] = self.distances_from(h, hosts)
+        return output
+
+
+# Shared service using the configured controller
+topology = TopologyService()
@@ -0,0 +1,367 @@
+import logging
+from cStringIO import StringIO
+from xml.etree.cElementTree import iterparse
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+# Multipliers to KiB
+MEMORY_UNITS = {'TB': 1024 * 1024 * 1024, 'GB': 1024 * 1024, 'MB': 1024, 'KB': 1}
+
+# (multiplier, divisor) to Mbps
+BANDWIDTH_UNITS = {'bps': (1, 1024 * 1024), 'Kbps': (1, 1024), 'Mbps': (1, 1), 'Gbps': (1024, 1)}
+
+# (multiplier, divisor) to ms
+LATENCY_UNITS = {'us': (1, 1000), 'ms': (1, 1), 's': (1000, 1)}
+
+# Types of VirtualInterface ('NAT' in VXDL is 'network')
+INTERFACE_TYPES = ('bridge', 'network', 'ethernet')
+
+# Default memory of VMs (KiB)
+DEFAULT_MEMORY = 128 * 1024
+
+
+# Problems found in a VXDL document (the slice must not be created)
+class VXDLError(ValueError):
+    pass
+
+
+class VXDLInterface(object):
+    __slots__ = ('alias', 'if_type', 'mac_address')
+
+    def __init__(self, alias, if_type='bridge', mac_address=None):
+        self.alias = alias
+        self.if_type = if_type
+        self.mac_address = mac_address
+
+
+class VXDLNode(object):
+    __slots__ = ('name', 'memory', 'vcpu', 'image', 'interfaces')
+
+    def __init__(self, name, memory, vcpu, image, interfaces):
+        self.name = name
+        self.memory = memory
+        self.vcpu = vcpu
+        self.image = image
+        self.interfaces = interfaces
+
+    def interface(self, alias):
+        found = [i for i in self.interfaces if i.alias == alias]
+        if len(found) != 1:
+            return None
+        return found[0]
+
+
+class VXDLController(object):
+    __slots__ = ('ip', 'port', 'connection', 'controller_type')
+
+    def __init__(self, ip, port='6633', connection='tcp', controller_type='master'):
+        self.ip = ip
+        self.port = port
+        self.connection = connection
+        self.controller_type = controller_type
+
+
+class VXDLRouter(object):
+    __slots__ = ('name', 'cp_type', 'cp_routing_protocol', 'controller_list')
+
+    def __init__(self, name, cp_type, cp_routing_protocol, controller_list=None):
+        self.name = name
+        self.cp_type = cp_type
+        self.cp_routing_protocol = cp_routing_protocol
+        # Id of the controllerList of OpenFlow routers
+        self.controller_list = controller_list
+
+
+# End of a link: an interface of a vNode or a new port of a vRouter
+class VXDLEndpoint(object):
+    __slots__ = ('node', 'interface', 'router')
+
+    def __init__(self, node=None, interface=None, router=None):
+        self.node = node
+        self.interface = interface
+        self.router = router
+
+    def __str__(self):
+        if self.router is not None:
+            return self.router
+        return '%s %s' % (self.node, self.interface)
+
+
+class VXDLLink(object):
+    __slots__ = ('source', 'destination', 'qos')
+
+    def __init__(self, source, destination, qos):
+        self.source = source
+        self.destination = destination
+        # Fields of VirtualLinkQos
+        self.qos = qos
+
+
+class SliceGraph(object):
+    """Virtual infrastructure described by a VXDL document
+
+    Plain objects checked for consistency (every link endpoint exists,
+    OpenFlow routers have controllers), so the slice can be written to the
+    database without looking anything up.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.routers = []
+        # Controllers by controllerList id
+        self.controller_lists = {}
+        self.links = []
+        self.nodes_by_name = {}
+        self.routers_by_name = {}
+
+    def add_node(self, node):
+        if node.name in self.nodes_by_name:
+            raise VXDLError('Duplicated vNode ' + node.name)
+        self.nodes.append(node)
+        self.nodes_by_name[node.name] = node
+
+    def add_router(self, router):
+        if router.name in self.routers_by_name:
+            raise VXDLError('Duplicated vRouter ' + router.name)
+        self.routers.append(router)
+        self.routers_by_name[router.name] = router
+
+    def node(self, name):
+        return self.nodes_by_name.get(name)
+
+    def router(self, name):
+        return self.routers_by_name.get(name)
+
+    def image_names(self):
+        return set(node.image for node in self.nodes)
+
+
+def _text(element, path):
+    found = element.find(path)
+    if found is None:
+        return None
+    return found.text
+
+
+def _number(element, path, convert=float):
+    value = _text(element, path)
+    if value is None:
+        return None
+    try:
+        return convert(value.strip())
+    except ValueError:
+        raise VXDLError('Invalid number in %s/%s: %s' % (element.tag, path, value))
+
+
+def _unit(element, units):
+    unit = _text(element, "unit")
+    if unit is not None and unit not in units:
+        raise VXDLError('Unknown unit in %s: %s (expected %s)' % (element.tag, unit, ', '.join(sorted(units))))
+    return unit
+
+
+def parse_memory(element):
+    value = _number(element, "memory/simple", int)
+    memory = element.find("memory")
+    unit = _unit(memory, MEMORY_UNITS) if memory is not None else None
+    if value is None or unit is None:
+        return DEFAULT_MEMORY
+    return value * MEMORY_UNITS[unit]
+
+
+# Converts value to the unit of the database (Mbps or ms), at least 1
+def _convert(value, unit, units):
+    if unit is None or value <= 0:
+        return value
+    multiplier, divisor = units[unit]
+    return max(round(value * multiplier / divisor), 1)
+
+
+# Maximum bandwidth (Mbps) and committed percentage of one direction
+def parse_bandwidth(element):
+    if element is None:
+        return 0, 0
+    bw_max = _number(element, "interval/max")
+    bw_min = _number(element, "interval/min")
+    unit = _unit(element, BANDWIDTH_UNITS)
+
+    maximum = committed = 0
+    # When both are set
+    if bw_max is not None and bw_min is not None:
+        if bw_max == 0:
+            raise VXDLError('Maximum bandwidth must be greater than 0 when the minimum is set')
+        maximum = round(bw_max)
+        committed = round(bw_min / bw_max * 100)
+    # Only min is set
+    elif bw_min is not None:
+        maximum = round(bw_min)
+        committed = 100
+    # Only max is set
+    elif bw_max is not None:
+        maximum = round(bw_max)
+
+    return int(_convert(maximum, unit, BANDWIDTH_UNITS)), int(committed)
+
+
+# Maximum latency in ms
+def parse_latency(element):
+    if element is None:
+        return 0
+    latency_max = _number(element, "interval/max")
+    unit = _unit(element, LATENCY_UNITS)
+
+    latency = 0
+    if latency_max is not None:
+        latency = round(latency_max)
+    return int(_convert(latency, unit, LATENCY_UNITS))
+
+
+def parse_node(graph, v_node):
+    name = v_node.attrib.get("id", "vm" + str(len(graph.nodes)))
+    image = _text(v_node, "image")
+    if not image:
+        raise VXDLError('Could not determine Virtual Machine image: ' + name)
+
+    vcpu = _number(v_node, "cpu/cores/simple", int)
+    interfaces = []
+    for j, v_if in enumerate(v_node.findall("interface")):
+        if_type = _text(v_if, "type") or "bridge"
+        if if_type == "NAT":
+            if_type = "network"
+        if if_type not in INTERFACE_TYPES:
+            raise VXDLError('Unknown interface type in vNode %s: %s' % (name, if_type))
+        interfaces.append(VXDLInterface(
+            _text(v_if, "alias") or "veth" + str(j),
+            if_type,
+            _text(v_if, "macaddress"),
+        ))
+    graph.add_node(VXDLNode(name, parse_memory(v_node), vcpu if vcpu is not None else 1, image, interfaces))
+
+
+def parse_controller_list(graph, v_clist):
+    if "id" not in v_clist.attrib:
+        raise VXDLError('Error! Controller list must have an attribute id.')
+    if v_clist.attrib["id"] in graph.controller_lists:
+        raise VXDLError('Duplicated controllerList ' + v_clist.attrib["id"])
+    controllers = []
+    for v_controller in v_clist.findall("controller"):
+        ip = _text(v_controller, "ipAddress")
+        if ip is None:
+            raise VXDLError('Error! Controller IP address must be specified.')
+        controllers.append(VXDLController(
+            ip,
+            _text(v_controller, "port") or '6633',
+            _text(v_controller, "connectionType") or 'tcp',
+            v_controller.attrib.get('type', 'master'),
+        ))
+    graph.controller_lists[v_clist.attrib["id"]] = controllers
+
+
+def parse_router(graph, v_router):
+    name = v_router.attrib.get("id", "vr" + str(len(graph.routers)))
+    v_control_plane = v_router.find("controlPlane")
+    if v_control_plane is None:
+        raise VXDLError('Error! Virtual Routers must have a controlPlane tag.')
+
+    router = VXDLRouter(
+        name,
+        v_control_plane.attrib.get("type", "dynamic"),
+        v_control_plane.attrib.get("routingProtocol", "openflow").lower(),
+    )
+    if router.cp_routing_protocol == "openflow":
+        # Checked at the end, the list may come later in the document
+        router.controller_list = v_control_plane.text
+    graph.add_router(router)
+
+
+def parse_endpoint(element, side):
+    node = _text(element, side + "/vNode")
+    alias = _text(element, side + "/interface")
+    if node is not None and alias is not None:
+        return VXDLEndpoint(node=node, interface=alias)
+
+    router = _text(element, side + "/vRouter")
+    if router is None:
+        raise VXDLError('%s not specified, will not create virtual link' % side.capitalize())
+    return VXDLEndpoint(router=router)
+
+
+def parse_link(graph, v_link):
+    bandwidth_up_maximum, bandwidth_up_committed = parse_bandwidth(v_link.find("bandwidth/forward"))
+    bandwidth_down_maximum, bandwidth_down_committed = parse_bandwidth(v_link.find("bandwidth/reverse"))
+    graph.links.append(VXDLLink(
+        parse_endpoint(v_link, "source"),
+        parse_endpoint(v_link, "destination"),
+        {
+            'bandwidth_up_maximum': bandwidth_up_maximum,
+            'bandwidth_up_committed': bandwidth_up_committed,
+            'bandwidth_down_maximum': bandwidth_down_maximum,
+            'bandwidth_down_committed': bandwidth_down_committed,
+            'latency': parse_latency(v_link.find("latency")),
+        },
+    ))
+
+
+# Elements of a virtualInfrastructure and the functions reading them, any
+# other element (startDate, totalTime...) is skipped
+SCHEMA = {
+    'vNode': parse_node,
+    'controllerList': parse_controller_list,
+    'vRouter': parse_router,
+    'vLink': parse_link,
+}
+
+
+# References between elements, checked once the whole document is read
+def check_references(graph):
+    for router in graph.routers:
+        if router.cp_routing_protocol == "openflow" and router.controller_list not in graph.controller_lists:
+            # Openflow Routers must have at least one controller associated
+            raise VXDLError('Error! Virtual Routers with OpenFlow must have at least one controller associated.')
+
+    for link in graph.links:
+        for side, end in (('source', link.source), ('destination', link.destination)):
+            if end.router is not None:
+                found = graph.router(end.router) is not None
+            else:
+                node = graph.node(end.node)
+                found = node is not None and node.interface(end.interface) is not None
+            if not found:
+                raise VXDLError('Incorrect alias for %s, will not create virtual link: %s' % (side, str(end)))
+
+
+# Reads a VXDL document (string or file) into a SliceGraph, raises VXDLError.
+# The document is read in one pass and every element of the infrastructure
+# is discarded once converted, so memory only grows with the SliceGraph.
+def parse_vxdl(vxdl):
+    if isinstance(vxdl, unicode):
+        vxdl = vxdl.encode('utf-8')
+    if isinstance(vxdl, str):
+        vxdl = StringIO(vxdl)
+
+    graph = SliceGraph()
+    depth = 0
+    root = None
+    try:
+        for event, element in iterparse(vxdl, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    if element.tag != 'virtualInfrastructure':
+                        raise VXDLError('Invalid VXDL document: root element must be virtualInfrastructure, not ' + element.tag)
+                    root = element
+                continue
+
+            depth -= 1
+            if depth == 1:
+                parse = SCHEMA.get(element.tag)
+                if parse is not None:
+                    parse(graph, element)
+                # Drop the elements already converted
+                root.clear()
+    except SyntaxError as e:
+        raise VXDLError('Invalid VXDL document: ' + str(e))
+
+    check_references(graph)
+    return graph
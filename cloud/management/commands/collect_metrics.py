@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from cloud.helpers.event_engine import EventEngine
+from cloud.helpers.metric_collector import MetricCollector
+from cloud.models.metric import Metric
+
+
+class Command(BaseCommand):
+    help = 'Collects the enabled metrics periodically, stores their samples and evaluates the events'
+
+    def add_arguments(self, parser):
+        parser.add_argument('metric_names', nargs='*',
+            help='Collect these metrics once and exit')
+        parser.add_argument('--once', action='store_true', default=False,
+            help='Collect every enabled metric once and exit')
+        parser.add_argument('--workers', type=int, default=None,
+            help='Number of collections running at the same time')
+        parser.add_argument('--no-events', action='store_true', default=False,
+            help='Do not evaluate events with the collected samples')
+
+    def handle(self, *args, **options):
+        collector = MetricCollector(options['workers'])
+        if not options['no_events']:
+            collector.subscribe(EventEngine().handle)
+
+        if options['metric_names'] or options['once']:
+            metrics = Metric.objects.filter(state='enabled').exclude(returns='text')
+            if options['metric_names']:
+                metrics = Metric.objects.filter(name__in=options['metric_names'])
+                if len(metrics) != len(options['metric_names']):
+                    raise CommandError('Unknown metric in %s' % ', '.join(options['metric_names']))
+            samples = collector.collect(list(metrics))
+            for sample in samples:
+                self.stdout.write('%s %s %s: %s' % (sample.metric.name, sample.target, sample.field, sample.value))
+            return
+
+        collector.run()
@@ -0,0 +1,43 @@
+import logging
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from cloud.helpers.jobs import run_job
+from cloud.models.job import Job
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Executes queued jobs (slice deployments, undeployments and optimizations)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', default=False,
+            help='Execute the queued jobs and exit')
+        parser.add_argument('--interval', type=float, default=None,
+            help='Seconds to wait before looking for new jobs')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = settings.JOBS['poll_interval']
+
+        stale = Job.fail_stale(settings.JOBS['stale_after'])
+        if stale:
+            self.stderr.write('%d stale jobs marked as failed' % stale)
+
+        while True:
+            job = Job.claim()
+            if job is None:
+                if options['once']:
+                    break
+                # Do not keep a connection open while idle
+                connection.close()
+                time.sleep(interval)
+                continue
+
+            self.stdout.write('Running %s' % unicode(job))
+            run_job(job)
+            self.stdout.write('%s %s: %s' % (unicode(job), job.state, job.result))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from cloud.models.host import Host
+from cloud.models.host_facts import HostFacts
+
+
+class Command(BaseCommand):
+    help = 'Reads the static facts (CPU topology, memory, versions, sysinfo) of every host (in parallel)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('host_ids', nargs='*', type=int,
+            help='Only refresh these hosts')
+        parser.add_argument('--stale', action='store_true', default=False,
+            help='Only refresh hosts without facts or with facts older than HOST_FACTS max_age')
+        parser.add_argument('--workers', type=int, default=None,
+            help='Number of hosts contacted at the same time')
+        parser.add_argument('--timeout', type=int, default=None,
+            help='Seconds to wait for each host')
+
+    def handle(self, *args, **options):
+        hosts = Host.objects.select_related('facts')
+        if options['host_ids']:
+            hosts = hosts.filter(id__in=options['host_ids'])
+        hosts = list(hosts)
+
+        if options['stale']:
+            stale = []
+            for host in hosts:
+                try:
+                    if host.facts.is_stale():
+                        stale.append(host)
+                except HostFacts.DoesNotExist:
+                    stale.append(host)
+            hosts = stale
+
+        report = Host.refresh_facts_for(hosts, options['workers'], options['timeout'])
+        for entry in report:
+            if entry['ok']:
+                self.stdout.write('%s: %s %d cores, libvirt %s' % (unicode(entry['host']), entry['result'].architecture, entry['result'].cores, entry['result'].libvirt_version))
+            else:
+                self.stderr.write('%s: %s' % (unicode(entry['host']), entry['error']))
+
+        if any(not entry['ok'] for entry in report):
+            raise CommandError('Facts of some hosts could not be read')
@@ -0,0 +1,46 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from cloud.helpers.host_sync import sync_hosts
+from cloud.models.host import Host
+
+
+class Command(BaseCommand):
+    help = 'Synchronizes the virtual machines of every host (in parallel) with the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('host_ids', nargs='*', type=int,
+            help='Only synchronize these hosts')
+        parser.add_argument('--workers', type=int, default=None,
+            help='Number of hosts synchronized at the same time')
+        parser.add_argument('--timeout', type=int, default=None,
+            help='Seconds to wait for each host')
+        parser.add_argument('--json', action='store_true', default=False,
+            help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        hosts = Host.objects.all()
+        if options['host_ids']:
+            hosts = hosts.filter(id__in=options['host_ids'])
+
+        report = sync_hosts(hosts, options['workers'], options['timeout'])
+
+        if options['json']:
+            output = []
+            for entry in report:
+                output.append({
+                    'host': unicode(entry['host']),
+                    'ok': entry['ok'],
+                    'error': entry['error'],
+                    'elapsed': entry['elapsed'],
+                    'report': entry['result'].as_dict() if entry['ok'] else None,
+                })
+            self.stdout.write(json.dumps(output, indent=2))
+        else:
+            for entry in report:
+                if entry['ok']:
+                    self.stdout.write(str(entry['result']))
+                else:
+                    self.stderr.write('%s: %s' % (unicode(entry['host']), entry['error']))
+
+        if any(not entry['ok'] for entry in report):
+            raise CommandError('Some hosts could not be synchronized')
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('job_type', models.CharField(max_length=20, db_index=True, choices=[('deploy_slice', 'Deploy slice'), ('undeploy_slice', 'Undeploy slice'), ('optimize', 'Optimize')])),
+                ('state', models.CharField(default=b'queued', max_length=10, db_index=True, choices=[('queued', 'Queued'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')])),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('params', models.TextField(default=b'{}')),
+                ('log', models.TextField(default=b'', blank=True)),
+                ('result', models.TextField(null=True, blank=True)),
+                ('worker', models.CharField(max_length=200, null=True, blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('started', models.DateTimeField(null=True, blank=True)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('slice', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, verbose_name=b'Slice', blank=True, to='cloud.Slice', null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
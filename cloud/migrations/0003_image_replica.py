@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0002_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='checksum',
+            field=models.CharField(db_index=True, max_length=32, null=True, blank=True),
+        ),
+        migrations.CreateModel(
+            name='ImageReplica',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('checksum', models.CharField(max_length=32, db_index=True)),
+                ('path', models.CharField(max_length=200)),
+                ('size', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('last_used', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('host', models.ForeignKey(verbose_name=b'Host', to='cloud.Host')),
+                ('image', models.ForeignKey(verbose_name=b'Image', to='cloud.Image')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='imagereplica',
+            unique_together=set([('host', 'checksum')]),
+        ),
+    ]
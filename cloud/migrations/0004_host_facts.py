@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0003_image_replica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostFacts',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('architecture', models.CharField(max_length=20, blank=True)),
+                ('memory', models.BigIntegerField(default=0)),
+                ('cpus', models.IntegerField(default=0)),
+                ('mhz', models.IntegerField(default=0)),
+                ('nodes', models.IntegerField(default=0)),
+                ('sockets', models.IntegerField(default=0)),
+                ('cores', models.IntegerField(default=0)),
+                ('threads', models.IntegerField(default=0)),
+                ('libvirt_version', models.CharField(max_length=20, blank=True)),
+                ('hypervisor_type', models.CharField(max_length=20, blank=True)),
+                ('hypervisor_version', models.CharField(max_length=50, blank=True)),
+                ('sysinfo', models.TextField(blank=True)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now, db_index=True)),
+                ('host', models.OneToOneField(related_name='facts', verbose_name=b'Host', to='cloud.Host')),
+            ],
+        ),
+    ]
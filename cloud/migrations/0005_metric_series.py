@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0004_host_facts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metric',
+            name='interval',
+            field=models.PositiveIntegerField(default=60),
+        ),
+        migrations.AddField(
+            model_name='metric',
+            name='timeout',
+            field=models.PositiveIntegerField(default=10),
+        ),
+        migrations.CreateModel(
+            name='MetricSeries',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('target', models.CharField(max_length=200, blank=True)),
+                ('field', models.CharField(max_length=200, blank=True)),
+                ('key', models.CharField(max_length=32)),
+                ('last_raw', models.FloatField(null=True, blank=True)),
+                ('last_raw_time', models.FloatField(null=True, blank=True)),
+                ('data', models.BinaryField(blank=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('metric', models.ForeignKey(verbose_name=b'Metric', to='cloud.Metric')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='metricseries',
+            unique_together=set([('metric', 'key')]),
+        ),
+    ]
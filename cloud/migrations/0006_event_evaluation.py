@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0005_metric_series'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='event',
+            name='value',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='field',
+            field=models.CharField(default='', max_length=200, blank=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='aggregate',
+            field=models.CharField(default='last', max_length=10, choices=[('last', 'Last value'), ('avg', 'Average'), ('min', 'Minimum'), ('max', 'Maximum')]),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='window',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='hysteresis',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='cooldown',
+            field=models.PositiveIntegerField(default=300),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='last_triggered',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
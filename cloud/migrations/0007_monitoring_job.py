@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cloud', '0006_event_evaluation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='job_type',
+            field=models.CharField(max_length=20, db_index=True, choices=[('deploy_slice', 'Deploy slice'), ('undeploy_slice', 'Undeploy slice'), ('optimize', 'Optimize'), ('deploy_monitoring', 'Deploy monitoring')]),
+        ),
+    ]
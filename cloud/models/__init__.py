@@ -3,7 +3,9 @@ import cloud.models.base_singleton_model
 
 import cloud.models.device
 import cloud.models.host
+import cloud.models.host_facts
 import cloud.models.image
+import cloud.models.image_replica
 import cloud.models.interface
 import cloud.models.port
 import cloud.models.router
@@ -23,6 +25,8 @@ import cloud.models.deployment_program
 import cloud.models.optimization_program
 import cloud.models.optimizes_slice
 import cloud.models.metric
+import cloud.models.metric_series
 import cloud.models.event
 import cloud.models.monitoring
+import cloud.models.job
 
@@ -1,6 +1,12 @@
 import logging
+from datetime import timedelta
 from django.db import models
+from django.utils import timezone
 from cloud.models.base_model import BaseModel
+from cloud.models.job import Job
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
 
 EVENT_STATES = (
         (u'enabled', u'Enabled'),
@@ -14,6 +20,12 @@ RELATIONAL_OPERATION = (
         (u'eqlt', u'(<=) Equals or Less Than'),
         (u'diff', u'(!=) Different'),
 )
+EVENT_AGGREGATES = (
+        (u'last', u'Last value'),
+        (u'avg', u'Average'),
+        (u'min', u'Minimum'),
+        (u'max', u'Maximum'),
+)
 
 
 class Event(BaseModel):
@@ -37,11 +49,79 @@ class Event(BaseModel):
         choices=RELATIONAL_OPERATION,
         default='eq', db_index=True
     )
-    value = models.CharField(max_length=200, unique=True)
+    value = models.CharField(max_length=200)
     program = models.ForeignKey(
         # Import as string to avoid circular import problems
         'OptimizationProgram',
     )
+    # Field of the metric result compared (empty for metrics returning a
+    # single number, see cloud/helpers/metric_collector.py)
+    field = models.CharField(max_length=200, blank=True, default='')
+    # Samples of the last window seconds are combined with aggregate
+    # (0 compares every sample alone)
+    aggregate = models.CharField(
+        max_length=10,
+        choices=EVENT_AGGREGATES,
+        default='last'
+    )
+    window = models.PositiveIntegerField(default=0)
+    # After triggering, the value must go back past the threshold by this
+    # margin before the event can trigger again for the same target
+    hysteresis = models.FloatField(default=0)
+    # Minimum seconds between two runs of the program triggered by the event
+    cooldown = models.PositiveIntegerField(default=300)
+    last_triggered = models.DateTimeField(blank=True, null=True)
+
+    def threshold(self):
+        try:
+            return float(self.value)
+        except ValueError:
+            raise self.EventException('Value of event %s is not a number: %s' % (self.name, self.value))
+
+    # Whether the condition of the event holds for value
+    def matches(self, value):
+        threshold = self.threshold()
+        op = self.relational_operation
+        if op == 'eq':
+            return value == threshold
+        if op == 'gt':
+            return value > threshold
+        if op == 'eqgt':
+            return value >= threshold
+        if op == 'lt':
+            return value < threshold
+        if op == 'eqlt':
+            return value <= threshold
+        return value != threshold
+
+    # Whether the condition stopped holding by more than the hysteresis
+    def cleared(self, value):
+        threshold = self.threshold()
+        op = self.relational_operation
+        if op in ('gt', 'eqgt'):
+            return value < threshold - self.hysteresis
+        if op in ('lt', 'eqlt'):
+            return value > threshold + self.hysteresis
+        if op == 'eq':
+            return abs(value - threshold) > self.hysteresis
+        return abs(value - threshold) <= self.hysteresis
+
+    def cooling_down(self):
+        if self.last_triggered is None:
+            return False
+        return self.last_triggered > timezone.now() - timedelta(seconds=self.cooldown)
+
+    # Queues a run of the program unless one for the same program and slice
+    # is already queued or running. Returns the new job or None.
+    def trigger(self):
+        for job in Job.objects.filter(job_type='optimize', state__in=('queued', 'running'), slice=self.belongs_to_slice_id):
+            if job.get_params().get('program_id') == self.program_id:
+                logger.debug('Event %s: program %s already queued (job %d)' % (self.name, self.program_id, job.id))
+                return None
+
+        self.last_triggered = timezone.now()
+        self.save(update_fields=['last_triggered'])
+        return Job.enqueue('optimize', {'program_id': self.program_id, 'event_id': self.id}, self.belongs_to_slice)
 
     def __unicode__(self):
         return self.name
@@ -1,18 +1,20 @@
 import commands
 import libvirt
 import logging
+import os
 import socket
-import urllib
 import json
-from subprocess import Popen, PIPE
 from django.db import models
 from django.core.cache import cache
 from django.conf import settings
 from libvirt import libvirtError
-from xml.etree.ElementTree import fromstring
-from cloud.models.virtual_machine import VirtualMachine, LIBVIRT_VM_STATES
-from cloud.models.virtual_interface import VirtualInterface
+from cloud.models.virtual_machine import VirtualMachine, LIBVIRT_VM_STATES, INACTIVE_VM_STATES
 from cloud.models.device import Device
+from cloud.models.host_facts import HostFacts, format_version
+from cloud.helpers.host_sync import HostSynchronizer, run_on_hosts
+from cloud.helpers.floodlight import FloodlightClient, FloodlightException, inventory as switch_inventory
+from cloud.helpers.ovsdb import connection_for as ovsdb_connection_for, open_connection as ovsdb_open_connection, OVSDBException
+from cloud.helpers.libvirt_connections import connections as libvirt_connections, ConnectionBackoff
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -42,9 +44,6 @@ ARCHITECTURES = (
 
 
 class Host(Device):
-    # libvirt connections (class attribute)
-    libvirt_connections = {}
-
     # libvirt connection URI
     # drv[+transport]://[username@][hostname][:port]/[path][?extraparameters]
     driver = models.CharField(
@@ -103,12 +102,9 @@ class Host(Device):
 
         return conn
 
-    def libvirt_connect(self, force_tcp=False):
-        # Allows only one connection for each different host
-        if force_tcp is False and self.__class__.libvirt_connections.has_key(self.id) and isinstance(self.__class__.libvirt_connections[self.id], libvirt.virConnect):
-            #logger.debug("Connections found: " + str(self.__class__.libvirt_connections))
-            return self.__class__.libvirt_connections[self.id]
-
+    # Builds the libvirt connection URI
+    # Format: driver[+transport]://[username@][hostname][:port]/[path][?extraparameters]
+    def get_libvirt_uri(self, force_tcp=False):
         driver = self.driver
         path = ""
         if self.transport == "local":
@@ -134,32 +130,32 @@ class Host(Device):
             else:
                 port = ":" + str(self.port)
 
-        if not self.path.startswith("/"):
-            if self.path == "":
-                path = ""
-            else:
-                path = "/" + str(self.path)
+        if not self.path:
+            path = ""
+        elif not self.path.startswith("/"):
+            path = "/" + str(self.path)
 
-        if self.extraparameters == "":
+        if not self.extraparameters:
             extraparameters = ""
         else:
             extraparameters = "?" + str(self.extraparameters)
 
-        # Format: driver[+transport]://[username@][hostname][:port]/[path][?extraparameters]
-        host_path = driver + transport + "://" + hostname + port + path + extraparameters
+        return driver + transport + "://" + hostname + port + path + extraparameters
 
-        try:
-            if force_tcp:
-                return libvirt.open(host_path)
+    # Opens a new (not pooled) connection to the hypervisor
+    def open_libvirt_connection(self, uri):
+        # If SASL authentication is needed
+        if self.username and self.password:
+            return self.open_auth(uri)
+        return libvirt.open(uri)
 
-            # If SASL authentication is needed
-            if self.username and self.password:
-                self.__class__.libvirt_connections[self.id] = self.open_auth(host_path)
-            else:
-                self.__class__.libvirt_connections[self.id] = libvirt.open(host_path)
-            #logger.debug("New connection: " + str(self.__class__.libvirt_connections))
-            return self.__class__.libvirt_connections[self.id]
-        except libvirtError as e:
+    # Connections are shared among threads and requests by the connection
+    # manager, which also takes care of reconnecting to restarted daemons
+    def libvirt_connect(self, force_tcp=False):
+        try:
+            return libvirt_connections.get(self, force_tcp=force_tcp)
+        except (libvirtError, ConnectionBackoff) as e:
+            host_path = self.get_libvirt_uri(force_tcp=force_tcp)
             logger.error('Failed to open connection to the hypervisor: ' + host_path + ' ' + str(e))
             raise self.HostException('Failed to open connection to the hypervisor: ' + host_path + ' ' + str(e))
 
@@ -171,123 +167,20 @@ class Host(Device):
             return "Off-line"
 
     # Reads current libvirt status and updates local database
+    # Returns a SyncReport with the created, updated and orphaned VMs
     def sync(self):
-        lv_conn = self.libvirt_connect()
-
-        # Gather all domains
-        all_domains = []
+        return HostSynchronizer(self).run()
 
+    # States of all domains of the host indexed by domain name, read with a
+    # single libvirt call (see VirtualMachine.states_for)
+    def get_domain_states(self):
+        lv_conn = self.libvirt_connect()
         try:
-            def_domains = lv_conn.listDefinedDomains()
-            active_domains = lv_conn.listDomainsID()
-        except libvirtError as e:
-            raise self.HostException('Failed to read domains from hypervisor: ' + str(lv_conn) + ' ' + str(e))
-
-        for dom_id in active_domains:
-            # Get domain info from libvirt
-            try:
-                dom = lv_conn.lookupByID(dom_id)
-                all_domains.append({
-                    "name": dom.name(),
-                    "info": dom.info()
-                })
-            except libvirtError as e:
-                raise self.HostException('Failed to read domains from hypervisor: ' + str(lv_conn) + ' ' + str(e))
-
-        for dom_name in def_domains:
-            # Get domain info from libvirt
-            try:
-                dom = lv_conn.lookupByName(dom_name)
-                all_domains.append({
-                    "name": dom_name,
-                    "info": dom.info()
-                })
-            except libvirtError as e:
-                raise self.HostException('Failed to read domain info from hypervisor: ' + str(lv_conn) + ' ' + str(e))
-
-        for dom in all_domains:
-            # Try to find the defined VM in the local database
-            vms = self.virtualmachine_set.filter(name=dom["name"])
-            if len(vms) == 0:
-                # Not found, create new
-                logger.debug("VM " + str(dom) + " not found in database, creating new one")
-                vm = VirtualMachine()
-                vm.name = dom["name"]
-                vm.memory = dom["info"][2]
-                vm.vcpu = dom["info"][3]
-                vm.host = self
-                vm.save()
-
-                # TODO: Fill in the disk_path of VM
-
-                # Create also interfaces
-                vm_element = fromstring(vm.get_xml_desc())
-                if_elements = vm_element.findall("devices/interface")
-                i = 0
-                for if_element in if_elements:
-                    interface = VirtualInterface()
-                    interface.if_type = None
-
-                    if 'type' in if_element.attrib:
-                        interface.if_type = if_element.attrib["type"]
-
-                    # There should be at least a type defined
-                    if interface.if_type is None:
-                        logger.warning("Could not create interface from element " + str(vars(if_element)))
-                        break
-
-                    mac_element = if_element.find("mac")
-                    if mac_element is not None:
-                        interface.mac_address = mac_element.attrib["address"]
-
-                    alias_element = if_element.find("alias")
-                    if alias_element is not None:
-                        interface.alias = alias_element.attrib["name"]
-                    else:
-                        interface.alias = "net" + str(i)
-
-                    # Attach interface to VM
-                    interface.attached_to = vm
-
-                    # Optional parameters
-                    source_element = if_element.find("source")
-                    if source_element is not None:
-                        interface.source = source_element.attrib
-
-                    target_element = if_element.find("target")
-                    if target_element is not None:
-                        interface.target = target_element.attrib
-
-                    interface.save()
-
-                    i += 1
-
-                # TODO: Create disks also (when disk objects are available)
-
-            else:
-                #Take the first VM from the list
-                vm = vms[0]
-                # Update info anyway
-                vm.memory = dom["info"][2]
-                vm.vcpu = dom["info"][3]
-                vm.save()
-                # TODO: Update interface and disk information
-
-            # More than one VM with the same name
-            if len(vms) > 1:
-                logger.warning("More than one VM named " + str(dom["name"]) + " for host " + str(self.id))
-
-
-        # Deleted non existing vms (temporarily disabled)
-        #vms = self.virtualmachine_set.all()
-        #for vm in vms:
-        #    found = False
-        #    for dom in all_domains:
-        #        if dom["name"] == vm.name:
-        #            found = True
-        #            break;
-        #    if not found:
-        #        vm.delete()
+            stats = lv_conn.getAllDomainStats(libvirt.VIR_DOMAIN_STATS_STATE)
+            return dict((dom.name(), LIBVIRT_VM_STATES.get(record['state.state'])) for dom, record in stats)
+        except (AttributeError, libvirtError):
+            # getAllDomainStats needs libvirt 1.2.8
+            return dict((dom.name(), LIBVIRT_VM_STATES.get(dom.info()[0])) for dom in lv_conn.listAllDomains(0))
 
     # Reads memory usage information from libvirt and returns the following structure
     # {'cached': 999L, 'total': 999L, 'buffers': 999L, 'free': 999L}
@@ -316,14 +209,7 @@ class Host(Device):
         except:
             return False
 
-        daemon_version = lv_conn.getLibVersion()
-
-        major = daemon_version / 1000000;
-        daemon_version %= 1000000;
-        minor = daemon_version / 1000;
-        rel = daemon_version % 1000;
-
-        return str(major) + '.' + str(minor) + '.' + str(rel)
+        return format_version(lv_conn.getLibVersion())
 
     def get_hypervisor_version(self):
         try:
@@ -332,12 +218,7 @@ class Host(Device):
             return False
 
         try:
-            hv_version = lv_conn.getVersion()
-            major = hv_version / 1000000;
-            hv_version %= 1000000;
-            minor = hv_version / 1000;
-            rel = hv_version % 1000;
-            return str(major) + '.' + str(minor) + '.' + str(rel)
+            return format_version(lv_conn.getVersion())
         except libvirtError as e:
             logger.warning('Failed to get hypervisor version: ' + str(self) + ' ' + str(e))
             return 'Failed to get hypervisor version'
@@ -351,6 +232,39 @@ class Host(Device):
 
         return lv_conn.getType()
 
+    # Static facts of the host (see HostFacts). They are read from the
+    # hypervisor only when missing, older than settings.HOST_FACTS['max_age']
+    # or when refresh is set, and kept in the instance afterwards.
+    # Returns None if the host never answered.
+    def get_facts(self, refresh=False):
+        if hasattr(self, '_facts') and not refresh:
+            return self._facts
+
+        try:
+            facts = self.facts
+        except HostFacts.DoesNotExist:
+            facts = None
+
+        if refresh or facts is None or facts.is_stale():
+            try:
+                facts = HostFacts.collect(self)
+            except (self.HostException, libvirtError) as e:
+                # Stale facts are still better than none for an off-line host
+                logger.warning('Failed to collect facts of ' + str(self) + ': ' + str(e))
+
+        self._facts = facts
+        return facts
+
+    # Reads the facts of many hosts from their hypervisors in parallel
+    # Returns the run_on_hosts report
+    @classmethod
+    def refresh_facts_for(cls, hosts, max_workers=None, timeout=None):
+        report = run_on_hosts(HostFacts.collect, hosts, max_workers, timeout)
+        for entry in report:
+            if entry['ok']:
+                entry['host']._facts = entry['result']
+        return report
+
     # System info
     # Output:
     # - bios: bios information (vendor, version, date, release)
@@ -365,145 +279,103 @@ class Host(Device):
     # - threads: number of threads per core
     # - libvirt_version: version of daemon running in the connection
     # - hypervisor_version: version and type of hypervisor running in the connection
+    # Served from the host facts, without contacting the hypervisor
     def get_info(self):
-        try:
-            lv_conn = self.libvirt_connect()
-        except:
+        facts = self.get_facts()
+        if facts is None:
             return False
 
-        sysinfo_element = fromstring(self.get_xml_info())
-        bios_element = sysinfo_element.find("bios")
-        bios_info = {}
-        if bios_element != None:
-            entries = bios_element.findall("entry")
-            for entry in entries:
-                if entry.attrib.has_key("name"):
-                    bios_info[entry.attrib["name"]] = entry.text
-
-        sys_element = sysinfo_element.find("system")
-        sys_info = {}
-        if sys_element != None:
-            entries = sys_element.findall("entry")
-            for entry in entries:
-                if entry.attrib.has_key("name"):
-                    sys_info[entry.attrib["name"]] = entry.text
-
-        info = lv_conn.getInfo()
-        return {
-            'bios': bios_info,
-            'system': sys_info,
-            'architecture': info[0],
-            'memory': info[1] / 16, # Ajust to make resource allocation work on virtualized datacenter
-            'cpus': info[2] / 16, # Ajust to make resource allocation work on virtualized datacenter
-            'mhz': info[3],
-            'nodes': info[4],
-            'sockets': info[5],
-            'cores': info[6],
-            'threads': info[7],
-            'libvirt_version': self.get_libvirt_version(),
-            'hypervisor_version': self.get_hypervisor_type() + ": " + self.get_hypervisor_version()
-        }
+        return facts.as_info()
 
     # CPU specific information
     # Output is list of processors with the following characteristics:
     # - socket_destination, type, family, manufacturer, signature, version,
     #   external_clock, max_speed, status
     def get_cpu_info(self):
-        xml_info = self.get_xml_info()
-        if not xml_info:
+        facts = self.get_facts()
+        if facts is None or not facts.sysinfo:
             return False
 
-        sysinfo_element = fromstring(xml_info)
-
-        processors = sysinfo_element.findall("processor")
-
-        procs = []
-        for proc in processors:
-            entries = proc.findall("entry")
-            info = {}
-            for entry in entries:
-                if 'name' in entry.attrib:
-                    info[entry.attrib["name"]] = entry.text
-
-            procs.append(info)
-
-        return procs
+        return facts.processors()
 
     # Memory specific information
     # Output is list of memory banks with the following characteristics:
     # - size, form_factor, locator, bank_locator, type, type_detail, speed,
     #   manufacturer, serial_number
     def get_memory_info(self):
-        xml_info = self.get_xml_info()
-        if not xml_info:
+        facts = self.get_facts()
+        if facts is None or not facts.sysinfo:
             return False
 
-        sysinfo_element = fromstring(xml_info)
-        memories = sysinfo_element.findall("memory_device")
-
-        mems = []
-        for mem in memories:
-            entries = mem.findall("entry")
-            info = {}
-            for entry in entries:
-                if 'name' in entry.attrib:
-                    info[entry.attrib["name"]] = entry.text
-
-            mems.append(info)
-
-        return mems
+        return facts.memory_devices()
 
     # CPU allocation information
     # Will return not the real usage, but the number of cpus
     # allocated for virtual machines
-    def get_cpu_allocation(self):
-        vms = VirtualMachine.objects.filter(host=self)
-        stats = {
-            'total': 0,
-            'active': 0
-        }
-        for vm in vms:
-            stats['total'] += vm.vcpu
-            stats['active'] += vm.vcpu
-            #TODO: Count active vcpu from active domains (it is raising a warning)
-            #vm_state = vm.current_state()
-            #if vm_state == 'running':
-            #    stats['active'] += vm.vcpu
-
-        return stats
+    def get_cpu_allocation(self, active_only=False):
+        return Host.get_allocations([self], active_only)[self.id]['cpu']
 
     # Memory allocation information
     # Will return not the real usage, but the sum of all memory
     # allocated for virtual machines
-    def get_memory_allocation(self):
-        vms = VirtualMachine.objects.filter(host=self)
-        stats = {
-            'total': 0,
-            'active': 0
-        }
-        for vm in vms:
-            stats['total'] += vm.memory
-            stats['active'] += vm.memory
-            #TODO: Count active memory from active domains
-            #vm_state = vm.current_state()
-            #if vm_state == 'running':
-            #    stats['active'] += vm.memory
-
-        return stats
-
-    # Detailed system description (XML)
+    def get_memory_allocation(self, active_only=False):
+        return Host.get_allocations([self], active_only)[self.id]['memory']
+
+    # Allocation of many hosts (all of them if hosts is None) indexed by host id:
+    # {'cpu': {'total', 'active'}, 'memory': {'total', 'active'}, 'vms': n}
+    # Totals are summed by the database in a single GROUP BY query. When
+    # active_only is set, 'active' only counts VMs whose cached state is not
+    # an inactive one (VMs without a cached state count as active so that
+    # hosts are never overcommitted).
+    @classmethod
+    def get_allocations(cls, hosts=None, active_only=False):
+        vms = VirtualMachine.objects.all()
+        if hosts is None:
+            host_ids = list(cls.objects.values_list('id', flat=True))
+        else:
+            host_ids = [h.id for h in hosts]
+            vms = vms.filter(host__in=host_ids)
+
+        allocations = {}
+        for host_id in host_ids:
+            allocations[host_id] = {
+                'cpu': {'total': 0, 'active': 0},
+                'memory': {'total': 0, 'active': 0},
+                'vms': 0
+            }
+
+        totals = vms.values('host').annotate(
+            cpu=models.Sum('vcpu'), memory=models.Sum('memory'), vms=models.Count('id')
+        )
+        for row in totals:
+            if row['host'] not in allocations:
+                continue
+            entry = allocations[row['host']]
+            entry['cpu']['total'] = entry['cpu']['active'] = row['cpu'] or 0
+            entry['memory']['total'] = entry['memory']['active'] = row['memory'] or 0
+            entry['vms'] = row['vms']
+
+        if active_only:
+            rows = list(vms.exclude(host=None).values_list('id', 'host', 'vcpu', 'memory'))
+            # States of all VMs in one cache read
+            states = cache.get_many(['VM' + str(vm_id) + '-State' for vm_id, host_id, vcpu, memory in rows])
+            for vm_id, host_id, vcpu, memory in rows:
+                if host_id not in allocations:
+                    continue
+                if states.get('VM' + str(vm_id) + '-State') in INACTIVE_VM_STATES:
+                    allocations[host_id]['cpu']['active'] -= vcpu
+                    allocations[host_id]['memory']['active'] -= memory
+
+        return allocations
+
+    # Detailed system description (XML), kept with the host facts (use
+    # force to read it again from the hypervisor)
     def get_xml_info(self, force=False):
-        try:
-            lv_conn = self.libvirt_connect()
-        except:
+        facts = self.get_facts(refresh=force)
+        if facts is None:
             return False
 
-        # Cache XMLDesc for one day (use force to read it through)
-        XMLDesc = cache.get('Host' + str(self.id) + '-XMLDesc')
-        if XMLDesc is None or force:
-            XMLDesc = lv_conn.getSysinfo(0)
-            cache.set('Host' + str(self.id) + '-XMLDesc', XMLDesc, 86400)
-        return XMLDesc
+        return facts.sysinfo
 
     # Total number of active VMs
     def get_num_of_active_vms(self):
@@ -597,29 +469,80 @@ class Host(Device):
 
         return message
 
+    # Runs a shell command in the host (locally for the 'local' transport,
+    # through ssh otherwise) and returns (status, output)
+    def run_command(self, command):
+        if self.transport == 'local':
+            return commands.getstatusoutput(command)
+        return commands.getstatusoutput(
+            'ssh -o StrictHostKeyChecking=no root@' + self.hostname + ' "' + command.replace('"', '\\"') + '"'
+        )
+
+    # Copies a local file to the host (cp for the 'local' transport, rsync otherwise)
+    def copy_file(self, source, destination):
+        out = self.run_command('mkdir -p ' + os.path.dirname(destination))
+        if out[0] != 0:
+            return out
+        if self.transport == 'local':
+            return commands.getstatusoutput('cp -f ' + source + ' ' + destination)
+        # BUG: rsync will fail in case the host is not in the known_hosts file (for ssh we use StrictHostKeychecking)
+        return commands.getstatusoutput('rsync --partial ' + source + ' root@' + self.hostname + ':' + destination)
+
     def openvswitch_status(self):
         if not hasattr(self, '_openvswitch_status'):
             self._openvswitch_status = self.check_openvswitch_status()
         return self._openvswitch_status
 
+    # Shared connection to the Open vSwitch database of the host
+    def ovsdb_connection(self):
+        return ovsdb_connection_for(self.ovsdb)
+
+    # Batch of changes to the Open vSwitch database of the host
+    def ovsdb_transaction(self):
+        return self.ovsdb_connection().transaction()
+
+    # Names of the Open vSwitch bridges of the host (None when the database
+    # is not reachable), read from the replica of the database
+    def get_openvswitch_bridges(self):
+        return Host.get_openvswitch_bridges_for([self])[self.id]
+
+    # Bridges of many hosts: open connections are read at once from their
+    # replicas, the other databases are connected to in parallel
+    @classmethod
+    def get_openvswitch_bridges_for(cls, hosts):
+        bridges = {}
+        missing = []
+        for h in hosts:
+            conn = ovsdb_open_connection(h.ovsdb)
+            if conn is not None:
+                bridges[h.id] = conn.replica.bridge_names()
+            else:
+                missing.append(h)
+
+        if missing:
+            for r in run_on_hosts(lambda h: h.ovsdb_connection().replica.bridge_names(), missing, timeout=settings.OVSDB['timeout'] * 2):
+                h = r['host']
+                if not r['ok']:
+                    logger.warning('Could not read Open vSwitch bridges at ' + h.ovsdb + ': ' + str(r['error']))
+                bridges[h.id] = r['result']
+
+        return bridges
+
     def check_openvswitch_status(self):
         bridge = self.get_openvswitch_bridge()
         dpid = 'a0b0b4' + str(self.id).zfill(10)
         ctrl = settings.SDN_CONTROLLER
-        out = commands.getstatusoutput('ovs-vsctl --db=' + self.ovsdb + ' --timeout=3 br-exists "' + bridge + '"')
-        if out[0] != 0:
-            logger.warning('Open vSwitch bridge not found (' + bridge + ') at ' + self.ovsdb + ', will try to create one. ' + out[1])
-            # Will try to create a bridge
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.ovsdb + ' ' +
-                                           '--timeout=3 add-br "' + bridge + '" ' +
-                                           '-- set Bridge "' + bridge + '" ' +
-                                           'other_config:datapath-id=' + dpid)
-            if out[0] != 0:
-                return 'Could not find bridge (' + bridge + ') at ' + self.ovsdb + ': ' + out[1]
-            # Setup controller
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.ovsdb + ' --timeout=3 set-controller ' + bridge + ' ' + ctrl['transport'] + ':' + ctrl['ip'] + ':' + str(ctrl['port']))
-            if out[0] != 0:
-                return 'Could not set controller ' + ctrl['transport'] + ':' + ctrl['ip'] + ':' + ctrl['port'] + ' (' + bridge + ') at ' + self.ovsdb + ': ' + out[1]
+        try:
+            conn = self.ovsdb_connection()
+            if not conn.replica.bridge_exists(bridge):
+                logger.warning('Open vSwitch bridge not found (' + bridge + ') at ' + self.ovsdb + ', will try to create one.')
+                # Will try to create a bridge and setup the controller
+                txn = conn.transaction()
+                txn.add_bridge(bridge, datapath_id=dpid)
+                txn.set_controller(bridge, [ctrl['transport'] + ':' + ctrl['ip'] + ':' + str(ctrl['port'])])
+                txn.commit()
+        except OVSDBException as e:
+            return 'Could not find bridge (' + bridge + ') at ' + self.ovsdb + ': ' + str(e)
 
         return 'OK'
 
@@ -627,21 +550,24 @@ class Host(Device):
         bridge = self.get_openvswitch_bridge()
 
         # Add interface to the default bridge
-        cmd = ['ovs-vsctl', '--db=' + self.ovsdb, '--timeout=3', '--', '--may-exist', 'add-port', bridge, port]
-        p = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        p_out = p.communicate()
-        if p.returncode != 0:
-            raise self.HostException('Could not add port (' + port + ') to bridge (' + bridge + '): ' + p_out[1])
+        try:
+            self.ovsdb_transaction().add_port(bridge, port, may_exist=True).commit()
+        except OVSDBException as e:
+            raise self.HostException('Could not add port (' + port + ') to bridge (' + bridge + '): ' + str(e))
+
+        # The controller will report a new port for the bridge
+        switch_inventory.invalidate(port)
 
     def del_openvswitch_port(self, port):
         bridge = self.get_openvswitch_bridge()
 
-        # Add interface to the default bridge
-        cmd = ['ovs-vsctl', '--db=' + self.ovsdb, '--timeout=3', '--', '--if-exists', 'del-port', bridge, port]
-        p = Popen(cmd, stdout=PIPE, stderr=PIPE)
-        p_out = p.communicate()
-        if p.returncode != 0:
-            raise self.HostException('Could not delete port (' + port + ') to bridge (' + bridge + '): ' + p_out[1])
+        # Remove interface from the default bridge
+        try:
+            self.ovsdb_transaction().del_port(bridge, port, if_exists=True).commit()
+        except OVSDBException as e:
+            raise self.HostException('Could not delete port (' + port + ') to bridge (' + bridge + '): ' + str(e))
+
+        switch_inventory.invalidate(port)
 
     def get_openvswitch_bridge(self):
         return 'hostbr' + str(self.id)
@@ -655,17 +581,10 @@ class Host(Device):
         src_dpid = 'a0b0b4' + str(self.id).zfill(10)
         dst_dpid = 'a0b0b4' + str(host.id).zfill(10)
         # Use different ports in case source and destination hosts are the same
-        url = "http://%s:8080/wm/topology/route/%s/1/%s/2/json" % (settings.SDN_CONTROLLER['ip'], src_dpid, dst_dpid)
         try:
-            # Fetch path
-            route_response = urllib.urlopen(url)
-            if route_response.code == 200: # Success
-                route_data = json.loads(route_response.read())
-                return route_data
-            else:
-                logger.warning('Could not find route between %s -> %s (Code: %d)' % (src_dpid, dst_dpid, route_response.code))
-        except IOError as e:
-            logger.warning('Could not connect to the controller: %s' % str(e))
+            return FloodlightClient().route(src_dpid, 1, dst_dpid, 2)
+        except FloodlightException as e:
+            logger.warning('Could not find route between %s -> %s: %s' % (src_dpid, dst_dpid, str(e)))
 
         return None
 
@@ -0,0 +1,154 @@
+import logging
+from datetime import timedelta
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+from libvirt import libvirtError
+from xml.etree.ElementTree import fromstring
+from cloud.models.base_model import BaseModel
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+# Formats libvirt version numbers (major * 1000000 + minor * 1000 + release)
+def format_version(version):
+    major = version / 1000000
+    version %= 1000000
+    minor = version / 1000
+    rel = version % 1000
+    return str(major) + '.' + str(minor) + '.' + str(rel)
+
+
+# Name/value entries of every element found in the sysinfo XML
+def sysinfo_entries(element, path):
+    found = []
+    for child in element.findall(path):
+        info = {}
+        for entry in child.findall("entry"):
+            if 'name' in entry.attrib:
+                info[entry.attrib["name"]] = entry.text
+        found.append(info)
+    return found
+
+
+# Static description of a host (CPU topology, memory size, versions and
+# sysinfo) read from the hypervisor with a single connection and kept in
+# the database, so pages and placement programs do not need any libvirt
+# call to know what a host is. Facts are read again when they are older
+# than settings.HOST_FACTS['max_age'] or on demand (refresh_host_facts).
+class HostFacts(BaseModel):
+    host = models.OneToOneField(
+        'Host',
+        verbose_name="Host",
+        related_name='facts'
+    )
+    # Values returned by getInfo()
+    architecture = models.CharField(max_length=20, blank=True)
+    memory = models.BigIntegerField(default=0)
+    cpus = models.IntegerField(default=0)
+    mhz = models.IntegerField(default=0)
+    nodes = models.IntegerField(default=0)
+    sockets = models.IntegerField(default=0)
+    cores = models.IntegerField(default=0)
+    threads = models.IntegerField(default=0)
+    libvirt_version = models.CharField(max_length=20, blank=True)
+    hypervisor_type = models.CharField(max_length=20, blank=True)
+    hypervisor_version = models.CharField(max_length=50, blank=True)
+    # Detailed system description (getSysinfo XML)
+    sysinfo = models.TextField(blank=True)
+    updated = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        app_label = 'cloud'
+
+    # Reads the facts of host from the hypervisor and saves them
+    @classmethod
+    def collect(cls, host):
+        lv_conn = host.libvirt_connect()
+        info = lv_conn.getInfo()
+        values = {
+            'architecture': info[0],
+            'memory': info[1],
+            'cpus': info[2],
+            'mhz': info[3],
+            'nodes': info[4],
+            'sockets': info[5],
+            'cores': info[6],
+            'threads': info[7],
+            'libvirt_version': format_version(lv_conn.getLibVersion()),
+            'hypervisor_type': lv_conn.getType(),
+        }
+        try:
+            values['hypervisor_version'] = format_version(lv_conn.getVersion())
+        except libvirtError as e:
+            logger.warning('Failed to get hypervisor version: ' + str(host) + ' ' + str(e))
+            values['hypervisor_version'] = 'Failed to get hypervisor version'
+        values['sysinfo'] = lv_conn.getSysinfo(0)
+        values['updated'] = timezone.now()
+
+        # Facts of a host collected for the first time by two threads at
+        # once are created only once
+        facts, created = cls.objects.get_or_create(host=host, defaults=values)
+        if not created:
+            for name, value in values.items():
+                setattr(facts, name, value)
+            facts.save()
+        return facts
+
+    def is_stale(self, max_age=None):
+        if max_age is None:
+            max_age = settings.HOST_FACTS['max_age']
+        return self.updated < timezone.now() - timedelta(seconds=max_age)
+
+    # sysinfo XML is parsed once per instance
+    def sysinfo_element(self):
+        if not hasattr(self, '_sysinfo_element'):
+            self._sysinfo_element = fromstring(self.sysinfo) if self.sysinfo else None
+        return self._sysinfo_element
+
+    def bios(self):
+        element = self.sysinfo_element()
+        if element is None:
+            return {}
+        found = sysinfo_entries(element, "bios")
+        return found[0] if found else {}
+
+    def system(self):
+        element = self.sysinfo_element()
+        if element is None:
+            return {}
+        found = sysinfo_entries(element, "system")
+        return found[0] if found else {}
+
+    def processors(self):
+        element = self.sysinfo_element()
+        if element is None:
+            return []
+        return sysinfo_entries(element, "processor")
+
+    def memory_devices(self):
+        element = self.sysinfo_element()
+        if element is None:
+            return []
+        return sysinfo_entries(element, "memory_device")
+
+    # Same structure returned by Host.get_info()
+    def as_info(self):
+        return {
+            'bios': self.bios(),
+            'system': self.system(),
+            'architecture': self.architecture,
+            'memory': self.memory / 16, # Ajust to make resource allocation work on virtualized datacenter
+            'cpus': self.cpus / 16, # Ajust to make resource allocation work on virtualized datacenter
+            'mhz': self.mhz,
+            'nodes': self.nodes,
+            'sockets': self.sockets,
+            'cores': self.cores,
+            'threads': self.threads,
+            'libvirt_version': self.libvirt_version,
+            'hypervisor_version': self.hypervisor_type + ": " + self.hypervisor_version
+        }
+
+    def __unicode__(self):
+        return u'Facts of %s' % self.host
@@ -1,6 +1,8 @@
-import commands
+import hashlib
 import logging
 import os
+import threading
+import uuid
 
 from django.db import models
 from django.conf import settings
@@ -30,6 +32,22 @@ IMG_TARGETS = (
 )
 
 
+# Formats that can back a qcow2 copy-on-write overlay
+OVERLAY_FORMATS = ('raw', 'qcow', 'qcow2')
+
+# Disks of VMs ending with this suffix are qcow2 overlays
+OVERLAY_SUFFIX = '.overlay.qcow2'
+
+_staging_locks = {}
+_staging_locks_lock = threading.Lock()
+
+
+# Lock of the staging of an image version (checksum) in a host
+def staging_lock(host_id, checksum):
+    with _staging_locks_lock:
+        return _staging_locks.setdefault((host_id, checksum), threading.Lock())
+
+
 class Image(BaseModel):
     name = models.CharField(max_length=200)
     file_format = models.CharField(
@@ -47,35 +65,101 @@ class Image(BaseModel):
     description = models.TextField(blank=True, null=True)
     image_file = models.FileField(upload_to='images')
 
-    # Deploys the image to a host based on the virtual machine object it 
-    # is associated with
-    def deploy(self, virtual_machine):
-        # Create a copy of the VM disk
-        disk_path = settings.REMOTE_IMAGE_PATH + self.image_file.name + "." + str(virtual_machine.id)
-
-        # First sync the local image remotelly to speedup future copies
-        # BUG: rsync will fail in case the host is not in the known_hosts file (for ssh we use StrictHostKeychecking)
-        rsync_path = self.image_file.path.replace(self.image_file.name, './'+self.image_file.name)
-        rsync_cmd = 'rsync --update --relative ' + rsync_path + ' ' + \
-                    'root@' + virtual_machine.host.hostname + ':' + settings.REMOTE_IMAGE_PATH
-        out = commands.getstatusoutput(rsync_cmd)
-        if out[0] != 0:
-            logger.warning(rsync_cmd)
-            raise self.ImageException(
-                "Could not copy image: " + out[1]
+    # MD5 of the image file, identifies the version of the image in hosts
+    checksum = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+
+    def compute_checksum(self):
+        md5 = hashlib.md5()
+        with open(self.image_file.path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        return md5.hexdigest()
+
+    # Checksum of the current file (computed once and stored)
+    def get_checksum(self):
+        if not self.checksum:
+            self.checksum = self.compute_checksum()
+            if self.id is not None:
+                Image.objects.filter(id=self.id).update(checksum=self.checksum)
+        return self.checksum
+
+    def save(self, *args, **kwargs):
+        # A new file means a new version of the image
+        if self.image_file and not self.image_file._committed:
+            self.checksum = None
+        super(Image, self).save(*args, **kwargs)
+        if self.image_file and not self.checksum:
+            self.get_checksum()
+
+    # Copies the base image to the host unless the inventory says it is
+    # already there. Returns the ImageReplica of this version of the image.
+    # Staging of the same image in the same host is serialized within the
+    # process, and the file is copied to a temporary name and then moved into
+    # place, so concurrent copies (from other processes) never leave a
+    # partial base image behind.
+    def stage(self, host):
+        from cloud.models.image_replica import ImageReplica
+
+        checksum = self.get_checksum()
+        with staging_lock(host.id, checksum):
+            try:
+                replica = ImageReplica.objects.get(host=host, checksum=checksum)
+                # Make sure the file was not removed from the host
+                if not settings.IMAGE_STAGING['verify'] or host.run_command('test -f ' + replica.path)[0] == 0:
+                    replica.touch()
+                    return replica
+                logger.warning('Image replica ' + replica.path + ' missing at ' + host.hostname + ', copying it again')
+            except ImageReplica.DoesNotExist:
+                pass
+
+            path = settings.REMOTE_IMAGE_PATH + 'images/base/' + checksum + '.' + self.file_format
+            partial = path + '.' + uuid.uuid4().hex + '.part'
+            out = host.copy_file(self.image_file.path, partial)
+            if out[0] == 0:
+                out = host.run_command('mv -f ' + partial + ' ' + path)
+            if out[0] != 0:
+                host.run_command('rm -f ' + partial)
+                raise self.ImageException(
+                    "Could not copy image: " + out[1]
+                )
+
+            # Another process may have staged the same image meanwhile
+            replica, created = ImageReplica.objects.get_or_create(
+                host=host, checksum=checksum,
+                defaults={'image': self, 'path': path, 'size': os.path.getsize(self.image_file.path)},
             )
+            replica.touch()
 
-        # Then copy the image for the virtual machine 
-        copy_cmd = 'ssh -o StrictHostKeyChecking=no root@' + virtual_machine.host.hostname + ' ' + \
-                   '"cp -f ' + settings.REMOTE_IMAGE_PATH + self.image_file.name + ' ' + disk_path + '"'
-        out = commands.getstatusoutput(copy_cmd)
+        # Make room for the new base image
+        ImageReplica.evict(host)
+        return replica
+
+    # Deploys the image to a host based on the virtual machine object it
+    # is associated with. The base image is copied once per host and every
+    # VM gets a copy-on-write overlay (or a full copy when the format does
+    # not support backing files).
+    def deploy(self, virtual_machine):
+        host = virtual_machine.host
+        replica = self.stage(host)
+
+        if self.supports_overlay():
+            disk_path = settings.REMOTE_IMAGE_PATH + self.image_file.name + "." + str(virtual_machine.id) + OVERLAY_SUFFIX
+            command = 'qemu-img create -f qcow2 -o backing_fmt=' + self.file_format + ' -b ' + replica.path + ' ' + disk_path
+        else:
+            disk_path = settings.REMOTE_IMAGE_PATH + self.image_file.name + "." + str(virtual_machine.id)
+            command = 'cp -f ' + replica.path + ' ' + disk_path
+
+        out = host.run_command('mkdir -p ' + os.path.dirname(disk_path) + ' && ' + command)
         if out[0] != 0:
-            logger.warning(copy_cmd)
+            logger.warning(command)
             raise self.ImageException(
-                "Could not copy image: " + out[1]
+                "Could not create disk: " + out[1]
             )
         return disk_path
 
+    def supports_overlay(self):
+        return settings.IMAGE_STAGING['overlays'] and self.file_format in OVERLAY_FORMATS
+
     # Current size on disk of this image
     def get_size(self):
         return self.image_file.file.size
@@ -0,0 +1,93 @@
+import logging
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+from cloud.models.base_model import BaseModel
+from cloud.models.image import OVERLAY_SUFFIX
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# Inventory of base images already copied to each host. Replicas are
+# identified by the checksum of the image, so a new version of an image
+# never overwrites the base file that older VM overlays still use.
+class ImageReplica(BaseModel):
+    image = models.ForeignKey(
+        'Image',
+        verbose_name="Image",
+    )
+    host = models.ForeignKey(
+        'Host',
+        verbose_name="Host",
+    )
+    checksum = models.CharField(max_length=32, db_index=True)
+    # Path of the base image in the host
+    path = models.CharField(max_length=200)
+    size = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    last_used = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        app_label = 'cloud'
+        unique_together = ('host', 'checksum')
+
+    def touch(self):
+        self.last_used = timezone.now()
+        self.save(update_fields=['last_used'])
+
+    # Replicas are in use while a VM of the same image is bound to the host
+    # or the overlay of any VM of the image is visible from the host. VMs
+    # migrated with shared storage keep using the base image of the host
+    # where they were deployed, so overlays are looked for in every host.
+    # When the host can not be asked the replica is considered in use.
+    def in_use(self):
+        from cloud.models.virtual_machine import VirtualMachine
+
+        if self.host.virtualmachine_set.filter(image=self.image).exists():
+            return True
+        overlays = list(VirtualMachine.objects.filter(
+            image=self.image, disk_path__endswith=OVERLAY_SUFFIX
+        ).values_list('disk_path', flat=True).distinct())
+        if not overlays:
+            return False
+        out = self.host.run_command(
+            ''.join('test -e ' + path + ' && echo used; ' for path in overlays) + 'true'
+        )
+        return out[0] != 0 or 'used' in out[1]
+
+    # Removes the base image from the host and forgets about it
+    def remove(self):
+        out = self.host.run_command('rm -f ' + self.path)
+        if out[0] != 0:
+            raise self.ImageReplicaException('Could not remove image replica ' + self.path + ' from ' + self.host.hostname + ': ' + out[1])
+        logger.debug('Image replica removed: ' + self.path + ' from ' + self.host.hostname)
+        self.delete()
+
+    # Least recently used policy: keeps at most max_per_host base images in
+    # the host, removing the oldest ones not used by any VM
+    @classmethod
+    def evict(cls, host, max_per_host=None):
+        if max_per_host is None:
+            max_per_host = settings.IMAGE_STAGING['max_per_host']
+
+        replicas = list(cls.objects.filter(host=host).select_related('image').order_by('last_used'))
+        excess = len(replicas) - max_per_host
+        evicted = []
+        for replica in replicas:
+            if excess <= 0:
+                break
+            if replica.in_use():
+                continue
+            try:
+                replica.remove()
+                evicted.append(replica)
+                excess -= 1
+            except cls.ImageReplicaException:
+                pass
+        return evicted
+
+    def __unicode__(self):
+        return u'%s at %s' % (self.image, self.host)
+
+    class ImageReplicaException(BaseModel.ModelException):
+        pass
@@ -1,8 +1,8 @@
 import logging
-import commands
 from django.db import models
 from cloud.models.host import Host
 from cloud.models.base_model import BaseModel
+from cloud.helpers.ovsdb import OVSDBException
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -38,15 +38,17 @@ class Interface(BaseModel):
         if ovs_status != 'OK':
             return ovs_status
         else:
-            # First remove interface from previous ovs (if it was somewhere else)
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.attached_to.ovsdb + ' --timeout=3 port-to-br "' + self.alias + '"')
-            if out[0] == 0:
-                # Interface was found at another switch
-                out = commands.getstatusoutput('ovs-vsctl --db=' + self.attached_to.ovsdb + ' --timeout=3 del-port "' + out[1] + '" "' + self.alias + '"')
-            # Will try to add interface to the bridge (may-exist)
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.attached_to.ovsdb + ' --timeout=3 -- --may-exist add-port "' + bridge + '" "' + self.alias + '"')
-            if out[0] != 0:
-                return 'Could not add interface (' + self.alias + ') to bridge (' + bridge + ') at ' + self.attached_to.ovsdb + ': ' + out[1]
+            try:
+                txn = self.attached_to.ovsdb_transaction()
+                # First remove interface from previous ovs (if it was somewhere else)
+                current = txn.port_to_bridge(self.alias)
+                if current is not None and current != bridge:
+                    txn.del_port(current, self.alias)
+                # Will try to add interface to the bridge (may-exist)
+                txn.add_port(bridge, self.alias, may_exist=True)
+                txn.commit()
+            except OVSDBException as e:
+                return 'Could not add interface (' + self.alias + ') to bridge (' + bridge + ') at ' + self.attached_to.ovsdb + ': ' + str(e)
 
         return 'OK'
 
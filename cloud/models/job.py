@@ -0,0 +1,144 @@
+import json
+import logging
+import socket
+import os
+import threading
+from datetime import timedelta
+from django.db import models
+from django.utils import timezone
+from cloud.models.base_model import BaseModel
+from cloud.models.slice import Slice
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+JOB_TYPES = (
+        (u'deploy_slice', u'Deploy slice'),
+        (u'undeploy_slice', u'Undeploy slice'),
+        (u'optimize', u'Optimize'),
+        (u'deploy_monitoring', u'Deploy monitoring'),
+)
+
+JOB_STATES = (
+        (u'queued', u'Queued'),
+        (u'running', u'Running'),
+        (u'finished', u'Finished'),
+        (u'failed', u'Failed'),
+)
+
+# Held for every change of the log and progress of a job, log records are
+# also written from the threads started by the job (see JobLogHandler)
+_log_lock = threading.Lock()
+
+
+# Long running operations executed by the job_worker command. The database
+# is the only broker: workers claim queued jobs with a conditional UPDATE,
+# so any number of them can run at the same time.
+class Job(BaseModel):
+    job_type = models.CharField(max_length=20, choices=JOB_TYPES, db_index=True)
+    state = models.CharField(max_length=10, choices=JOB_STATES, default='queued', db_index=True)
+    # Percentage of the work done
+    progress = models.PositiveSmallIntegerField(default=0)
+    # JSON encoded parameters of the job handler
+    params = models.TextField(default='{}')
+    log = models.TextField(blank=True, default='')
+    result = models.TextField(blank=True, null=True)
+    slice = models.ForeignKey(
+        Slice,
+        verbose_name="Slice",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    worker = models.CharField(max_length=200, blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    @classmethod
+    def enqueue(cls, job_type, params=None, slice_obj=None):
+        job = cls(job_type=job_type, params=json.dumps(params or {}), slice=slice_obj)
+        job.save()
+        logger.info("Job %d (%s) queued" % (job.id, job_type))
+        return job
+
+    # Takes the oldest queued job for this worker or returns None
+    @classmethod
+    def claim(cls, worker=None):
+        if worker is None:
+            worker = '%s:%d' % (socket.gethostname(), os.getpid())
+
+        for job_id in cls.objects.filter(state='queued').order_by('id').values_list('id', flat=True)[:10]:
+            # Only one worker succeeds in changing the state of a job
+            claimed = cls.objects.filter(id=job_id, state='queued').update(
+                state='running', worker=worker, started=timezone.now()
+            )
+            if claimed:
+                return cls.objects.get(id=job_id)
+        return None
+
+    # Fails jobs whose worker died (running for more than max_age seconds)
+    @classmethod
+    def fail_stale(cls, max_age):
+        limit = timezone.now() - timedelta(seconds=max_age)
+        return cls.objects.filter(state='running', started__lt=limit).update(
+            state='failed', result='Worker lost', finished=timezone.now()
+        )
+
+    def get_params(self):
+        return json.loads(self.params)
+
+    # Appends lines to the log and saves it with the progress (when given)
+    def write_log(self, lines, progress=None):
+        with _log_lock:
+            self.log += ''.join(line + '\n' for line in lines)
+            if progress is not None:
+                self.progress = max(0, min(100, int(progress)))
+            self.save(update_fields=['progress', 'log'])
+
+    def log_line(self, message):
+        return '[%s] %s' % (timezone.now().strftime('%Y-%m-%d %H:%M:%S'), message)
+
+    def append_log(self, message):
+        logger.debug("Job %d: %s" % (self.id, message))
+        self.write_log([self.log_line(message)])
+
+    def set_progress(self, progress, message=None):
+        self.write_log([self.log_line(message)] if message is not None else [], progress)
+
+    def finish(self, result=None):
+        self.state = 'finished'
+        self.progress = 100
+        self.result = result
+        self.finished = timezone.now()
+        self.save(update_fields=['state', 'progress', 'result', 'finished'])
+
+    def fail(self, error):
+        self.state = 'failed'
+        self.result = error
+        self.finished = timezone.now()
+        self.save(update_fields=['state', 'result', 'finished'])
+
+    def is_done(self):
+        return self.state in ('finished', 'failed')
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'type': self.job_type,
+            'state': self.state,
+            'progress': self.progress,
+            'result': self.result,
+            'log': self.log,
+            'slice': self.slice_id,
+            'worker': self.worker,
+            'created': self.created.isoformat() if self.created else None,
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None,
+        }
+
+    def __unicode__(self):
+        return u'%s #%d' % (self.job_type, self.id)
+
+    class JobException(BaseModel.ModelException):
+        pass
@@ -36,6 +36,10 @@ class Metric(BaseModel):
         choices=METRIC_SCOPES,
         default='infra', db_index=True
     )
+    # Seconds between collections (see cloud/helpers/metric_collector.py)
+    interval = models.PositiveIntegerField(default=60)
+    # Seconds to wait for a single collection before giving up on it
+    timeout = models.PositiveIntegerField(default=10)
 
     def get_size(self):
         return self.file.file.size
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import time
+from django.db import models, transaction
+from django.conf import settings
+from cloud.helpers.timeseries import TimeSeries
+from cloud.models.base_model import BaseModel
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+
+# Samples collected by a metric for one target (a VM, a host or nothing
+# for metrics without parameters) and one numeric field of the result
+# (empty for metrics returning a single number). Samples are kept in ring
+# buffers at the resolutions of settings.METRICS['rollups'], so a series
+# has a fixed size no matter how long it is collected.
+#
+# Series are unique by metric and a digest of target and field: a unique
+# index on both columns would be longer than the 767 bytes allowed by
+# InnoDB with utf8 columns.
+class MetricSeries(BaseModel):
+    metric = models.ForeignKey(
+        'Metric',
+        verbose_name="Metric",
+    )
+    target = models.CharField(max_length=200, blank=True)
+    field = models.CharField(max_length=200, blank=True)
+    key = models.CharField(max_length=32)
+    # Last raw value of counters (samples are stored as rates per second)
+    last_raw = models.FloatField(blank=True, null=True)
+    last_raw_time = models.FloatField(blank=True, null=True)
+    data = models.BinaryField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = 'cloud'
+        unique_together = ('metric', 'key')
+
+    # Digest of target and field
+    @staticmethod
+    def series_key(target, field):
+        return hashlib.md5((u'%s\0%s' % (target, field)).encode('utf-8')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        self.key = self.series_key(self.target, self.field)
+        super(MetricSeries, self).save(*args, **kwargs)
+
+    def timeseries(self):
+        if not hasattr(self, '_timeseries'):
+            self._timeseries = TimeSeries(settings.METRICS['rollups'], self.data or None)
+        return self._timeseries
+
+    # Adds a sample, returns the stored value (None for the first sample of
+    # a counter, which is only used as reference for the next one)
+    def add(self, timestamp, value):
+        if self.metric.returns == 'counter':
+            previous, previous_time = self.last_raw, self.last_raw_time
+            self.last_raw, self.last_raw_time = value, timestamp
+            if previous is None or timestamp <= previous_time or value < previous:
+                # First sample or counter reset
+                return None
+            value = (value - previous) / (timestamp - previous_time)
+
+        self.timeseries().add(timestamp, value)
+        self.data = self.timeseries().dumps()
+        return value
+
+    # List of (timestamp, avg, min, max, count) between start and end
+    # (default: now), at the finest resolution covering start unless
+    # resolution is given
+    def points(self, start, end=None, resolution=None):
+        now = time.time()
+        return self.timeseries().points(start, end or now, now, resolution)
+
+    # (timestamp, value) of the last sample (None when empty)
+    def last(self):
+        return self.timeseries().last()
+
+    # avg, min, max, sum, count or last of the samples between start and end
+    def aggregate(self, func, start, end=None, resolution=None):
+        now = time.time()
+        return self.timeseries().aggregate(func, start, end or now, now, resolution)
+
+    # Series of a metric by name, target and field
+    @classmethod
+    def get_series(cls, metric_name, target='', field=''):
+        try:
+            return cls.objects.select_related('metric').get(
+                metric__name=metric_name, key=cls.series_key(target, field)
+            )
+        except cls.DoesNotExist:
+            raise cls.MetricSeriesException('No samples of %s for %s %s' % (metric_name, target, field))
+
+    # Stores samples of one metric, a list of (target, field, value),
+    # loading and saving every series once. Returns the list of
+    # (target, field, value) actually stored (rates for counters).
+    @classmethod
+    def record(cls, metric, samples, timestamp):
+        keys = set((target, field) for target, field, value in samples)
+        stored = []
+        with transaction.atomic():
+            existing = {}
+            for series in cls.objects.filter(metric=metric, key__in=[cls.series_key(*k) for k in keys]):
+                existing[(series.target, series.field)] = series
+
+            changed = {}
+            for target, field, value in samples:
+                series = existing.get((target, field))
+                if series is None:
+                    series = cls(metric=metric, target=target, field=field)
+                    existing[(target, field)] = series
+                # Avoids loading the metric again for every series
+                series.metric = metric
+                value = series.add(timestamp, value)
+                changed[(target, field)] = series
+                if value is not None:
+                    stored.append((target, field, value))
+
+            for series in changed.values():
+                series.save()
+        return stored
+
+    def __unicode__(self):
+        return u'%s %s %s' % (self.metric, self.target, self.field)
+
+    class MetricSeriesException(BaseModel.ModelException):
+        pass
@@ -1,12 +1,13 @@
-import base64
-import httplib
 import logging
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import fromstring, tostring
 from django.db import models
+from cloud.helpers.flexcms import FlexCMSExporter
+from cloud.helpers.monitoring_transport import MonitoringTransport, MonitoringTransportException
 from cloud.models.base_singleton_model import BaseSingletonModel
-from cloud.models.slice import Slice
+from cloud.models.job import Job
 from cloud.models.virtual_device import VirtualDevice
+from cloud.models.virtual_machine import VirtualMachine
 
 # Configure logging for the module name
 logger = logging.getLogger(__name__)
@@ -27,53 +28,63 @@ class Monitoring(BaseSingletonModel):
     username = models.CharField(max_length=100, default='')
     password = models.CharField(max_length=100, default='')
 
-    def deploy_infrastructure(self, slice):
+    def deploy_infrastructure(self, slice, changes_only=False, wait=True):
         """Deploy monitoring infrastructure for a slice
 
-        Currently deploys the whole infrastructe every time it is called. The
-        monitoring system is able to detect changes and update where necessary.
+        Sends the whole infrastructure, every cloud (slice) included, as the
+        document is the state of the platform for the monitoring system.
+        With changes_only nothing is sent when no cloud changed, was added
+        or was removed since the last document sent. The monitoring system
+        is able to detect changes and update where necessary. The document
+        is sent while it is generated (see MonitoringTransport). With
+        wait=False it is sent later by a job worker and the queued Job is
+        returned.
         """
+        if not wait:
+            return Job.enqueue('deploy_monitoring', {'changes_only': changes_only}, slice)
+
         # POST to get_flexcms_xml()
         # Full URL http://flexcms.inf.ufrgs.br/flexcms/platforms.xml
-        username = self.username
-        password = self.password
-        host = self.hostname
-        request = self.generate_flexcms_platform_xml()
-
-        #Connect to remote system
-        webservice = httplib.HTTP(host)
-        webservice.putrequest("POST", self.path)
-        if username != '' and password != '':
-            auth = base64.encodestring('%s:%s' %
-                (username, password)).replace('\n', '')
-            webservice.putheader("Authorization", "Basic %s" % auth)
-        webservice.putheader("Host", host)
-        webservice.putheader("User-Agent", "Python post")
-        webservice.putheader("Content-type", "text/xml; charset=\"UTF-8\"")
-        webservice.putheader("Content-length", "%d" % len(request))
-        webservice.endheaders()
-        webservice.send(request)
-        statuscode, statusmessage, header = webservice.getreply()
-        result = webservice.getfile().read()
+        exporter = FlexCMSExporter(self)
+        if changes_only and not exporter.changed():
+            logger.debug("Slice %s monitoring infrastructure is up to date" % str(slice))
+            return None
+
+        # Clouds written to the request (their version is known once written)
+        sent = []
+
+        # Called again by retries
+        def body():
+            del sent[:]
+
+            def sending():
+                for cloud in exporter.clouds():
+                    yield cloud
+                    cloud.fragments = None
+                    sent.append(cloud)
+
+            return exporter.document(sending())
+
+        transport = MonitoringTransport(self.hostname, self.username, self.password)
+        try:
+            response = transport.post(self.path, body)
+        except MonitoringTransportException as e:
+            raise self.MonitoringException(str(e))
+
         logger.debug("Deploying slice %s monitoring infrastructure: %s %s" %
-            (str(slice), str(statuscode), statusmessage))
-        logger.debug("Deployment result: %s " % (str(result)))
+            (str(slice), str(response.status), response.reason))
+        logger.debug("Deployment result: %s " % (str(response.body)))
+        if response.ok():
+            exporter.mark_pushed(sent)
+        return response
 
-    def generate_flexcms_platform_xml(self):
-        # Create XML object structure root for the platform
-        platform = ET.Element('platform')
-        identifier = ET.SubElement(platform, 'identifier')
-        identifier.text = 'cloud'
-        cloud_attr = ET.SubElement(platform, 'cloud_attributes',
-            attrib={'type': 'array'})
-        slices = Slice.objects.filter(state="deployed")
-        for s in slices:
-            cloud_attr.append(self.generate_flexcms_cloud_xml_obj(s))
+    # Chunks of the platform XML, generated from the fragments cached by
+    # FlexCMSExporter
+    def stream_flexcms_platform_xml(self):
+        return FlexCMSExporter(self).document()
 
-        # Includes unbound devices
-        cloud_attr.append(self.generate_flexcms_cloud_xml_obj(None))
-        xml_out = '<?xml version="1.0" encoding="UTF-8"?>'
-        return xml_out + tostring(platform)
+    def generate_flexcms_platform_xml(self):
+        return ''.join(self.stream_flexcms_platform_xml())
 
     # When slice is None generates a "cloud" of unbound devices
     def generate_flexcms_cloud_xml_obj(self, slice):
@@ -87,6 +98,10 @@ class Monitoring(BaseSingletonModel):
             identifier.text = "Unbound Devices"
             devices = VirtualDevice.objects.filter(belongs_to_slice=None)
 
+        # Reads the state of all VMs at once (one call per host)
+        devices = list(devices.select_related('virtualmachine__host', 'virtualmachine__image'))
+        VirtualMachine.states_for([dev.virtualmachine for dev in devices if dev.is_virtual_machine()])
+
         # List of Virtual Devices (actually called Slices in FlexCMS)
         slice_attr = ET.SubElement(cloud, 'slices_attributes',
             attrib={'type': 'array'})
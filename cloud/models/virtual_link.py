@@ -1,11 +1,10 @@
-import commands
 import httplib
 import json
 import logging
-import os
 import socket
-from django.conf import settings
 from django.db import models
+from cloud.helpers.ovsdb import OVSDBException
+from cloud.helpers.floodlight import FloodlightClient, FloodlightException, path_flows, path_flow_names, inventory
 from cloud.models.virtual_interface import VirtualInterface
 from cloud.models.virtual_machine import VirtualMachine
 from cloud.models.virtual_router import VirtualRouter
@@ -139,178 +138,178 @@ class VirtualLink(BaseModel):
 
     # Create the virtual link on OpenFlow Controller
     def establish_of(self):
-        # Link is already established or is set to be
-        current_state = self.current_state()
-        if current_state == 'Established' or current_state == 'Waiting':
-            return True
+        return self.establish_of_links([self])
+
+    # Deletes a virtual link on OpenFlow Controller
+    def unestablish_of(self):
+        return self.unestablish_of_links([self])
 
+    # Interfaces and hosts of a VM to VM link
+    def of_endpoints(self):
         eth1 = self.if_start.target
         eth2 = self.if_end.target
         if eth1 == "" or eth2 == "":
             raise self.VirtualLinkException("Invalid pair of interfaces (" + eth1 + "-" + eth2 + ")")
 
-        mac1 = self.if_start.mac_address
-        mac2 = self.if_end.mac_address
         vm1 = self.if_start.attached_to.virtualmachine
-        h1 = vm1.host
         vm2 = self.if_end.attached_to.virtualmachine
+        h1 = vm1.host
         h2 = vm2.host
-        br1 = h1.get_openvswitch_bridge()
-        br2 = h2.get_openvswitch_bridge()
         if h1 is None:
             raise self.VirtualLinkException("Target virtual device not deployed (" + str(vm1) + ")")
         if h2 is None:
             raise self.VirtualLinkException("Target virtual device not deployed (" + str(vm2) + ")")
 
-        # Add interfaces to host bridges
-        h1.add_openvswitch_port(eth1)
-        h2.add_openvswitch_port(eth2)
+        return eth1, eth2, h1, h2
 
-        # Update local state to waiting
-        self.state = 'waiting'
-        self.save()
-
-        # TODO: don't use curl, because we need to handle HTTP error codes
-        command = 'curl -s http://%s:8080/wm/core/controller/switches/json' % settings.SDN_CONTROLLER['ip']
-        result = os.popen(command).read()
-        parsed_result = json.loads(result)
-        logger.debug(command)
-        #logger.debug(result)
+    # Asks the controller for the route between the link interfaces and
+    # returns the flow entries of every hop
+    def route_of(self, client):
+        eth1, eth2, h1, h2 = self.of_endpoints()
 
         # Search for source and destination switches and ports
-        src_switch = src_port = dst_switch = dst_port = None
-        for sw in parsed_result:
-            for pt in sw['ports']:
-                if pt['name'] == eth1:
-                    src_port = pt['portNumber']
-                if pt['name'] == br1:
-                    src_switch = sw['dpid']
-                if pt['name'] == eth2:
-                    dst_port = pt['portNumber']
-                if pt['name'] == br2:
-                    dst_switch = sw['dpid']
-
+        src_port = inventory.port_number(eth1)
+        src_switch = inventory.dpid(h1.get_openvswitch_bridge())
+        dst_port = inventory.port_number(eth2)
+        dst_switch = inventory.dpid(h2.get_openvswitch_bridge())
 
         if src_port is None or src_switch is None or dst_port is None or dst_switch is None:
-            # Update local state to waiting
-            self.state = 'failed'
-            self.save()
             raise self.VirtualLinkException("Could not establish find switch/port in the network")
 
         # Everything found, will create circuit
         logger.debug("Creating circuit: from %s port %s -> %s port %s" % (src_switch, src_port, dst_switch, dst_port))
-        command = "curl -s http://%s:8080/wm/topology/route/%s/%s/%s/%s/json" % (settings.SDN_CONTROLLER['ip'], src_switch, src_port, dst_switch, dst_port)
-        result = os.popen(command).read()
-        parsed_result = json.loads(result)
-        logger.debug(command)
-        #logger.debug(result)
+        route = client.route(src_switch, src_port, dst_switch, dst_port)
+        if type(route) is not list or len(route) == 0:
+            raise self.VirtualLinkException("Could not find a route between %s and %s" % (eth1, eth2))
 
         # Set link path to be recorded
-        self.path = result
+        self.path = json.dumps(route)
 
-        # Result is a list of coupled switch in/out ports, every two ports (items on the list) represent a hop
-        for i in range(len(parsed_result)):
-            if i % 2 == 0:
-                dpid = parsed_result[i]['switch']
-                port1 = parsed_result[i]['port']
-            else:
-                port2 = parsed_result[i]['port']
+        return path_flows(self.id, route, self.if_start.mac_address, self.if_end.mac_address)
 
-                # IMPORTANT NOTE: current Floodlight StaticFlowEntryPusher (0.90)
-                # assumes all flow entries to have unique name across all switches
+    # Creates VM to VM links on the OpenFlow Controller. Switches and ports
+    # come from the shared inventory (fetched at most once per batch) and
+    # the flow entries of every hop of every link are pushed in a single
+    # concurrent batch
+    @classmethod
+    def establish_of_links(cls, links):
+        pending = []
+        for link in links:
+            # Link is already established or is set to be
+            current_state = link.current_state()
+            if current_state == 'Established' or current_state == 'Waiting':
+                continue
 
-                # Forward flow
-                command = 'curl -s -d \'{"switch": "%s", "name":"%slink%d.f", "src-mac":"%s", "cookie":"0", "priority":"32768", "ingress-port":"%d","active":"true", "actions":"output=%d"}\' http://%s:8080/wm/staticflowentrypusher/json' % (dpid, dpid.replace(':', ''), self.id, mac1, port1, port2, settings.SDN_CONTROLLER['ip'])
-                result = os.popen(command).read()
-                logger.debug(command)
-                #logger.debug(result)
+            eth1, eth2, h1, h2 = link.of_endpoints()
 
-                # Backward flow
-                command = 'curl -s -d \'{"switch": "%s", "name":"%slink%d.r", "src-mac":"%s", "cookie":"0", "priority":"32768", "ingress-port":"%d","active":"true", "actions":"output=%d"}\' http://%s:8080/wm/staticflowentrypusher/json' % (dpid, dpid.replace(':', ''), self.id, mac2, port2, port1, settings.SDN_CONTROLLER['ip'])
-                result = os.popen(command).read()
-                logger.debug(command)
-                #logger.debug(result)
+            # Add interfaces to host bridges
+            h1.add_openvswitch_port(eth1)
+            h2.add_openvswitch_port(eth2)
 
-        logger.info('Link established with length: %d' % (len(parsed_result)/2))
-
-        # Update local state to established
-        self.state = 'establish'
-        self.save()
-
-        return True
+            # Update local state to waiting
+            link.state = 'waiting'
+            link.save()
+            pending.append(link)
 
-    # Deletes a virtual link on OpenFlow Controller
-    def unestablish_of(self):
-        # Was not established
-        current_state = self.current_state()
-        if current_state == 'Created':
+        if len(pending) == 0:
             return True
 
-        eth1 = self.if_start.target
-        eth2 = self.if_end.target
-        if eth1 == "" or eth2 == "":
-            raise self.VirtualLinkException("Invalid pair of interfaces (" + eth1 + "-" + eth2 + ")")
+        client = FloodlightClient()
+        try:
+            entries = []
+            for link in pending:
+                entries.extend(link.route_of(client))
+            client.push_flows(entries)
+        except (FloodlightException, cls.VirtualLinkException) as e:
+            for link in pending:
+                link.state = 'failed'
+                link.save()
+            raise cls.VirtualLinkException('Could not establish link(s) on the controller: ' + str(e))
+
+        for link in pending:
+            logger.info('Link established with length: %d' % (len(json.loads(link.path)) / 2))
+
+            # Update local state to established
+            link.state = 'establish'
+            link.save()
 
-        vm1 = self.if_start.attached_to.virtualmachine
-        vm2 = self.if_end.attached_to.virtualmachine
-        h1 = vm1.host
-        h2 = vm2.host
-        br1 = h1.get_openvswitch_bridge()
-        br2 = h2.get_openvswitch_bridge()
-        if h1 is None:
-            raise self.VirtualLinkException("Target virtual device not deployed (" + str(vm1) + ")")
-        if h2 is None:
-            raise self.VirtualLinkException("Target virtual device not deployed (" + str(vm2) + ")")
-
-        # Remove interfaces from host bridges
-        h1.del_openvswitch_port(eth1)
-        h2.del_openvswitch_port(eth2)
+        return True
 
-        # No path recorded
-        if self.path is None:
-            self.state = 'failed'
-            self.save()
-            logger.warning('Path for link %s not recorded' % str(self))
-            return True
+    # Deletes VM to VM links on the OpenFlow Controller, removing the flow
+    # entries of every link in a single concurrent batch
+    @classmethod
+    def unestablish_of_links(cls, links):
+        names = []
+        removed = []
+        for link in links:
+            # Was not established
+            current_state = link.current_state()
+            if current_state == 'Created':
+                continue
+
+            eth1, eth2, h1, h2 = link.of_endpoints()
+
+            # Remove interfaces from host bridges
+            h1.del_openvswitch_port(eth1)
+            h2.del_openvswitch_port(eth2)
+
+            # No path recorded
+            if link.path is None:
+                link.state = 'failed'
+                link.save()
+                logger.warning('Path for link %s not recorded' % str(link))
+                continue
+
+            # Recover path originally established to remove every entry
+            try:
+                route = json.loads(link.path)
+                link_names = path_flow_names(link.id, route)
+            except (ValueError, TypeError, KeyError):
+                link.state = 'failed'
+                link.save()
+                logger.warning('Invalid path for link %s' % str(link))
+                continue
+
+            names.extend(link_names)
+            removed.append(link)
+
+        if len(names) > 0:
+            try:
+                FloodlightClient().delete_flows(names)
+            except FloodlightException as e:
+                raise cls.VirtualLinkException('Could not unestablish link(s) on the controller: ' + str(e))
+
+        for link in removed:
+            link.state = 'inactive'
+            link.save()
 
-        # Recover path originally established to remove every entry
-        parsed_result = json.loads(self.path)
-        if type(parsed_result) is not list:
-            self.state = 'failed'
-            self.save()
-            logger.warning('Invalid path for link %s' % str(self))
-            return True
+        return True
 
-        # Result is a list of coupled switch in/out ports, every two ports (items on the list) represent a hop
-        for i in range(len(parsed_result)):
-            if not (type(parsed_result[i]) is dict and parsed_result[i].has_key('switch') and parsed_result[i].has_key('port')):
-                self.state = 'failed'
-                self.save()
-                logger.warning('Invalid path for link %s' % str(self))
-                return True
-
-            if i % 2 == 0:
-                dpid = parsed_result[i]['switch']
-                port1 = parsed_result[i]['port']
+    # Establishes a bundle of links: VM to VM links share one batch on the
+    # controller, the others are established one by one
+    @classmethod
+    def establish_bundle(cls, links):
+        of_links = []
+        for link in links:
+            if hasattr(link.if_start.attached_to, "virtualmachine") and hasattr(link.if_end.attached_to, "virtualmachine"):
+                of_links.append(link)
             else:
-                port2 = parsed_result[i]['port']
-
-            # Forward flow
-            command = 'curl -X DELETE -d \'{"name":"%slink%d.f"}\' http://%s:8080/wm/staticflowentrypusher/json' % ( dpid.replace(':', ''), self.id, settings.SDN_CONTROLLER['ip'] )
-            result = os.popen(command).read()
-            logger.debug(command)
-            #logger.debug(result)
-    
-            # Backward flow
-            command = 'curl -X DELETE -d \'{"name":"%slink%d.r"}\' http://%s:8080/wm/staticflowentrypusher/json' % ( dpid.replace(':', ''), self.id, settings.SDN_CONTROLLER['ip'] )
-            result = os.popen(command).read()
-            logger.debug(command)
-            #logger.debug(result)
-    
-            self.state = 'inactive'
-            self.save()
-
-        return True
+                link.establish()
+        return cls.establish_of_links(of_links)
+
+    # Removes every static flow entry from the controller, VM to VM links
+    # are set as inactive so they can be established again
+    @classmethod
+    def delete_all(cls):
+        try:
+            FloodlightClient().clear_flows()
+        except FloodlightException as e:
+            raise cls.VirtualLinkException('Could not remove flow entries from the controller: ' + str(e))
+        cls.objects.filter(
+            state__in=['establish', 'waiting'],
+            if_start__attached_to__virtualmachine__isnull=False,
+            if_end__attached_to__virtualmachine__isnull=False
+        ).update(state='inactive')
 
     def establish_ovspatch(self):
         bridge1 = self.if_start.attached_to.virtualrouter.dev_name
@@ -324,19 +323,17 @@ class VirtualLink(BaseModel):
         if h2 is None:
             raise self.VirtualLinkException("Target virtual device not deployed (" + str(bridge2) + ")")
 
-        # Add patch port in bridge 1
-        cmd = 'ovs-vsctl --db=' + h1.ovsdb + ' --timeout=3 -- add-port ' + bridge1 + ' ' + port1 + ' -- set interface ' + port1 + ' type=patch options:peer=' + port2
-        out = commands.getstatusoutput(cmd)
-        if out[0] != 0:
-            logger.warning(cmd)
-            raise self.VirtualLinkException("Could not add patch (" + port1 + ") to bridges (" + bridge1 + "-" + bridge2 + "): " + out[1])
-
-        # Add patch port in bridge 2
-        cmd = 'ovs-vsctl --db=' + h2.ovsdb + ' --timeout=3 -- add-port ' + bridge2 + ' ' + port2 + ' -- set interface ' + port2 + ' type=patch options:peer=' + port1
-        out = commands.getstatusoutput(cmd)
-        if out[0] != 0:
-            logger.warning(cmd)
-            raise self.VirtualLinkException("Could not add patch (" + port2 + ") to bridges (" + bridge1 + "-" + bridge2 + "): " + out[1])
+        # Add patch ports in both bridges, in a single transaction if both
+        # routers are in the same host
+        try:
+            txn1 = h1.ovsdb_transaction()
+            txn2 = txn1 if h2.ovsdb == h1.ovsdb else h2.ovsdb_transaction()
+            txn1.add_port(bridge1, port1, type='patch', options={'peer': port2})
+            txn2.add_port(bridge2, port2, type='patch', options={'peer': port1})
+            txn1.commit()
+            txn2.commit()
+        except OVSDBException as e:
+            raise self.VirtualLinkException("Could not add patch (" + port1 + "-" + port2 + ") to bridges (" + bridge1 + "-" + bridge2 + "): " + str(e))
 
         return True
 
@@ -352,18 +349,16 @@ class VirtualLink(BaseModel):
         if h2 is None:
             raise self.VirtualLinkException("Target virtual device not deployed (" + str(bridge2) + ")")
 
-        # Remove port on source bridge
-        cmd = 'ovs-vsctl --db=' + h1.ovsdb + ' --timeout=3 -- --if-exists del-port ' + bridge1 + ' ' + port1
-        out = commands.getstatusoutput(cmd)
-        if out[0] != 0:
-            logger.warning(cmd)
-            raise self.VirtualLinkException("Could not delete patch (" + port1 + ") to bridges (" + bridge1 + "-" + bridge2 + "): " + out[1])
-        # Remove port on destination bridge
-        cmd = 'ovs-vsctl --db=' + h2.ovsdb + ' --timeout=3 -- --if-exists del-port ' + bridge2 + ' ' + port2
-        out = commands.getstatusoutput(cmd)
-        if out[0] != 0:
-            logger.warning(cmd)
-            raise self.VirtualLinkException("Could not delete patch (" + port2 + ") to bridges (" + bridge1 + "-" + bridge2 + "): " + out[1])
+        # Remove ports on source and destination bridges
+        try:
+            txn1 = h1.ovsdb_transaction()
+            txn2 = txn1 if h2.ovsdb == h1.ovsdb else h2.ovsdb_transaction()
+            txn1.del_port(bridge1, port1, if_exists=True)
+            txn2.del_port(bridge2, port2, if_exists=True)
+            txn1.commit()
+            txn2.commit()
+        except OVSDBException as e:
+            raise self.VirtualLinkException("Could not delete patch (" + port1 + "-" + port2 + ") to bridges (" + bridge1 + "-" + bridge2 + "): " + str(e))
 
         return True
 
@@ -389,15 +384,16 @@ class VirtualLink(BaseModel):
         if bridge_host is None:
             raise self.VirtualLinkException("Target virtual router not deployed (" + str(bridge) + ")")
 
-        # First remove interface from previous ovs (if it was somewhere else)
-        out = commands.getstatusoutput('ovs-vsctl --db=' + bridge_host.ovsdb + ' --timeout=3 port-to-br ' + eth)
-        if out[0] == 0:
-            # Interface was found at another switch
-            out = commands.getstatusoutput('ovs-vsctl --db=' + bridge_host.ovsdb + ' --timeout=3 del-port "' + out[1] + '" ' + eth)
-
-        out = commands.getstatusoutput('ovs-vsctl --db=' + bridge_host.ovsdb + ' --timeout=3 add-port "' + bridge + '" ' + eth)
-        if out[0] != 0:
-            raise self.VirtualLinkException("Could not add port (" + eth + ") to bridge (" + bridge + "): " + out[1])
+        try:
+            txn = bridge_host.ovsdb_transaction()
+            # First remove interface from previous ovs (if it was somewhere else)
+            current = txn.port_to_bridge(eth)
+            if current is not None:
+                txn.del_port(current, eth)
+            txn.add_port(bridge, eth)
+            txn.commit()
+        except OVSDBException as e:
+            raise self.VirtualLinkException("Could not add port (" + eth + ") to bridge (" + bridge + "): " + str(e))
 
         return True
 
@@ -423,10 +419,11 @@ class VirtualLink(BaseModel):
         if bridge_host is None:
             raise self.VirtualLinkException("Target virtual router not deployed (" + str(bridge) + ")")
 
-        out = commands.getstatusoutput('ovs-vsctl --db=' + bridge_host.ovsdb + ' --timeout=3 del-port "' + bridge + '" ' + eth)
-        if out[0] != 0:
-            logger.warning("Could not add port (" + eth + ") to bridge (" + bridge + "): " + out[1])
-            raise self.VirtualLinkException("Could not delete port (" + eth + ") to bridge (" + bridge + "): " + out[1])
+        try:
+            bridge_host.ovsdb_transaction().del_port(bridge, eth).commit()
+        except OVSDBException as e:
+            logger.warning("Could not delete port (" + eth + ") to bridge (" + bridge + "): " + str(e))
+            raise self.VirtualLinkException("Could not delete port (" + eth + ") to bridge (" + bridge + "): " + str(e))
 
         return True
 
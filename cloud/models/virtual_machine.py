@@ -1,18 +1,17 @@
-import commands
 import os
 import libvirt
 import logging
 import shutil
 import time
 import xml.etree.ElementTree as ET
-from xml.etree.ElementTree import fromstring, tostring
 from libvirt import libvirtError, VIR_DOMAIN_AFFECT_CURRENT
 from django.db import models
 from django.core.cache import cache
 from django.template.loader import render_to_string
-from xml.etree.ElementTree import fromstring
-from cloud.models.image import Image
+from cloud.models.image import Image, OVERLAY_SUFFIX
 from cloud.models.virtual_device import VirtualDevice
+from cloud.helpers.parallel import run_parallel
+from cloud.helpers.domain_description import DomainDescription
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -27,6 +26,9 @@ LIBVIRT_VM_STATES = {
     libvirt.VIR_DOMAIN_CRASHED: 'crashed',
 }
 
+# States in which a domain does not use the resources allocated to it
+INACTIVE_VM_STATES = ('shut off', 'crashed')
+
 DRIVERS = (
         (u'remote', u'Default (remote)'),
         (u'qemu', u'QEMU/KVM'),
@@ -91,6 +93,10 @@ class VirtualMachine(VirtualDevice):
         if self.host is None:
             return "not deployed"
 
+        # State already read by states_for
+        if hasattr(self, '_current_state') and not force:
+            return self._current_state
+
         # Cache state for ten seconds to avoid to many consecutive readings (use force to read it through)
         curr_state = cache.get('VM' + str(self.id) + '-State')
         if curr_state is None or force:
@@ -102,9 +108,59 @@ class VirtualMachine(VirtualDevice):
 
             # Cache the current state
             cache.set('VM' + str(self.id) + '-State', curr_state, 10)
+            if hasattr(self, '_current_state'):
+                self._current_state = curr_state
 
         return curr_state
 
+    # States of many VMs indexed by VM id. Cached states are read in one
+    # cache query and the others with one libvirt call per host (hosts in
+    # parallel), then cached for ten seconds. The states are also kept in
+    # the VM objects, so current_state() does not query the cache again.
+    @classmethod
+    def states_for(cls, vms, force=False):
+        vms = list(vms)
+        states = {}
+        keys = {}
+        for vm in vms:
+            if vm.host_id is None:
+                states[vm.id] = "not deployed"
+            else:
+                keys['VM' + str(vm.id) + '-State'] = vm
+
+        cached = {} if force else cache.get_many(keys.keys())
+        missing = {}
+        for key, vm in keys.items():
+            if key in cached:
+                states[vm.id] = cached[key]
+            else:
+                missing.setdefault(vm.host_id, []).append(vm)
+
+        if missing:
+            hosts = [host_vms[0].host for host_vms in missing.values()]
+            values = {}
+            for task in run_parallel(lambda h: h.get_domain_states(), hosts):
+                if not task.ok():
+                    logger.warning('Could not read VM states at %s: %s' % (str(task.item), str(task.error)))
+                domains = task.result or {}
+                for vm in missing[task.item.id]:
+                    states[vm.id] = domains.get(vm.name, 'Could not read state')
+                    values['VM' + str(vm.id) + '-State'] = states[vm.id]
+            cache.set_many(values, 10)
+
+        for vm in vms:
+            vm._current_state = states[vm.id]
+        return states
+
+    # Clears the cached state (when the domain changes its state), the XML
+    # description is read again too (e.g. graphics ports change)
+    def forget_state(self):
+        cache.delete('VM' + str(self.id) + '-State')
+        if hasattr(self, '_current_state'):
+            del self._current_state
+        if hasattr(self, 'XMLDesc'):
+            del self.XMLDesc
+
     def get_xml_desc(self, force=False):
         # Try to selects the VM
         try:
@@ -118,6 +174,14 @@ class VirtualMachine(VirtualDevice):
             self.XMLDesc = libvirt_dom.XMLDesc(0)
         return self.XMLDesc
 
+    # Parsed XML description of the domain (None if not available), the
+    # same XML is parsed only once
+    def get_domain_description(self, force=False):
+        xml_desc = self.get_xml_desc(force)
+        if xml_desc is False:
+            return None
+        return DomainDescription.parse(xml_desc)
+
     # Gets CPU statistics for domain
     def get_cpu_stats(self):
         # Try to selects the VM
@@ -145,52 +209,19 @@ class VirtualMachine(VirtualDevice):
         if_out = self.virtualinterface_set.all()
 
         # Get description of interfaces from XML
-        xml_desc = self.get_xml_desc()
-        if xml_desc is False:
+        description = self.get_domain_description()
+        if description is None:
             # VM is not deployed so no interface information on libvirt
             return if_out
-        else:
-            vm_element = fromstring(xml_desc)
-
-        if_elements = vm_element.findall("devices/interface")
 
         # Populate additional information
         for interface in if_out:
-            found = False
-            for if_element in if_elements:
-                if_mac = if_model = if_source = if_target = if_alias = None
-
-                mac_element = if_element.find("mac")
-                if mac_element is not None:
-                    if_mac = mac_element.attrib["address"]
-
-                alias_element = if_element.find("alias")
-                if alias_element is not None:
-                    if_alias = alias_element.attrib["name"]
-
-                # There should be only one interface matching the MAC
-                # address or the alias
-                if interface.mac_address == if_mac or interface.alias == if_alias:
-                    found = True
-
-                    model_element = if_element.find("model")
-                    if model_element is not None:
-                        if_model = model_element.attrib["type"]
-                    interface.model = if_model
-
-                    source_element = if_element.find("source")
-                    if source_element is not None:
-                        if_source = source_element.attrib
-                    interface.source = if_source
-
-                    target_element = if_element.find("target")
-                    if target_element is not None:
-                        if_target = target_element.attrib
-                    interface.target = if_target
-
-                    break
-
-            if not found:
+            if_element = description.find_interface(interface.mac_address, interface.alias)
+            if if_element is not None:
+                interface.model = if_element['model']
+                interface.source = if_element['source']
+                interface.target = if_element['target']
+            else:
                 interface.target = interface.source = interface.model = None
 
         return if_out
@@ -200,52 +231,14 @@ class VirtualMachine(VirtualDevice):
         # Output format (array of disk.id, disk.type, disk.driver,
         # disk.source, disk.target, disk.alias)
 
-        hd_out = []
+        # Get description of disks from XML
+        description = self.get_domain_description()
+        if description is None:
+            # VM is not deployed so no disk information on libvirt
+            return []
 
-        # Get description of interfaces from XML
-        xml_desc = self.get_xml_desc()
-        if xml_desc is False:
-            # VM is not deployed so no interface information on libvirt
-            return hd_out
-        else:
-            vm_element = fromstring(xml_desc)
-
-        disks = vm_element.findall("devices/disk")
-
-        i = 0
-        for disk in disks:
-            hd_type = hd_driver = hd_source = hd_target = hd_alias = None
-
-            if 'type' in disk.attrib:
-                hd_type = disk.attrib["type"]
-
-            driver_element = disk.find("driver")
-            if driver_element is not None:
-                hd_driver = driver_element.attrib
-
-            source_element = disk.find("source")
-            if source_element is not None:
-                hd_source = source_element.attrib
-
-            target_element = disk.find("target")
-            if target_element is not None:
-                hd_target = target_element.attrib
-
-            alias_element = disk.find("alias")
-            if alias_element is not None:
-                hd_alias = alias_element.attrib["name"]
-
-            hd_out.append({
-                "id": i,
-                "type": hd_type,
-                "driver": hd_driver,
-                "source": hd_source,
-                "target": hd_target,
-                "alias": hd_alias
-            })
-            i += 1
-
-        return hd_out
+        # Copies, the parsed description is shared
+        return [dict(disk) for disk in description.disks]
 
     def get_main_interface_device(self):
         if_info = self.get_interface_info()
@@ -258,16 +251,23 @@ class VirtualMachine(VirtualDevice):
         return 'vnet0'  # Default is vnet0
 
     def get_main_disk_device(self):
-        disk_info = self.get_disk_info()
-        if type(disk_info) == list and len(disk_info) > 0:
-            return disk_info[0]['target']['dev']
+        description = self.get_domain_description()
+        if description is not None:
+            main_disk = description.main_disk()
+            if main_disk is not None and main_disk['target'] is not None and 'dev' in main_disk['target']:
+                return main_disk['target']['dev']
         return 'hda'  # Default is hda
 
     def get_main_disk_size(self):
-        disk_info = self.get_disk_info()
-        if type(disk_info) == list and len(disk_info) > 0:
-            main_disk = disk_info[0]
-            info = self.libvirt_domain.blockInfo(main_disk['target']['dev'], 0)
+        main_disk = self.get_main_disk_device()
+        description = self.get_domain_description()
+        if description is not None and description.main_disk() is not None:
+            try:
+                info = self.get_libvirt_domain().blockInfo(main_disk, 0)
+            except (libvirtError, self.VirtualMachineException) as e:
+                logger.warning('Could not read disk size of VM %s: %s' % (self.name, str(e)))
+                return 0
+            # info [capacity, allocation, physical]
             return info[0]
         return 0
 
@@ -277,26 +277,23 @@ class VirtualMachine(VirtualDevice):
         # port number 'port')
 
         # Get video info from XML
-        xml_desc = self.get_xml_desc()
-        if xml_desc is False:
+        description = self.get_domain_description()
+        if description is None:
             # VM is not deployed so no interface information on libvirt
             raise self.VirtualMachineException(
                 'Could not get XML info for VM %s' % self.name
             )
-        else:
-            vm_element = fromstring(xml_desc)
 
-        video = vm_element.find("devices/graphics")
+        video = description.main_graphics()
 
         if video is not None:
-            if ('type' in video.attrib
-                and video.attrib['type'] == "vnc"
-                and 'port' in video.attrib
-                and video.attrib["port"] != "-1"
+            if (video.get('type') == "vnc"
+                and 'port' in video
+                and video["port"] != "-1"
             ):
                 return {
                     'host': self.host.hostname,
-                    'port': video.attrib["port"]
+                    'port': video["port"]
                 }
             else:
                 raise self.VirtualMachineException(
@@ -321,7 +318,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     def stop(self):
@@ -337,7 +334,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     def shutdown(self):
@@ -353,7 +350,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     def resume(self):
@@ -369,7 +366,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     def suspend(self):
@@ -385,7 +382,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     # Defines new VM based on an XML description
@@ -419,7 +416,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     def migrate(self, dest):
@@ -428,9 +425,11 @@ class VirtualMachine(VirtualDevice):
         libvirt_dom = self.get_libvirt_domain(force_tcp=True)
 
         try:
-            # Migration is not allowed over TLS connection
+            # Migration is not allowed over TLS connection (the TCP
+            # connection is pooled by the host, so it is reused by the
+            # next migrations to the same destination)
             dest_conn = dest.libvirt_connect(force_tcp=True)
-        except libvirtError as e:
+        except (libvirtError, dest.HostException) as e:
             logger.error(
                 'Could not connect to destination host when migrating VM'
             )
@@ -455,7 +454,7 @@ class VirtualMachine(VirtualDevice):
         self.host = dest
         self.save()
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         
         # If this machine was connected to virtual links they need to migrate too
         for interface in self.virtualinterface_set.all():
@@ -501,6 +500,12 @@ class VirtualMachine(VirtualDevice):
 
         return {"copy_time": copy_time, "define_time": define_time}
 
+    # Format of the disk (copy-on-write overlays are always qcow2)
+    def get_disk_format(self):
+        if self.disk_path and self.disk_path.endswith(OVERLAY_SUFFIX):
+            return 'qcow2'
+        return self.image.file_format
+
     # Undo the generic deployment operation within libvirt
     def undeploy(self):
         try:
@@ -512,10 +517,7 @@ class VirtualMachine(VirtualDevice):
                 self.undefine()
                 logger.debug('Virtual machine undefined: ' + self.name)
             if self.disk_path is not None and self.disk_path != "":
-                out = commands.getstatusoutput(
-                    'ssh root@' + self.host.hostname + ' ' +
-                    '"rm -f ' + self.disk_path + '"'
-                )
+                out = self.host.run_command('rm -f ' + self.disk_path)
                 if out[0] != 0:
                     raise self.VirtualMachineException(
                         "Could not remove image: " + out[1]
@@ -530,7 +532,7 @@ class VirtualMachine(VirtualDevice):
             )
 
         # Clear cached state
-        cache.delete('VM' + str(self.id) + '-State')
+        self.forget_state()
         return True
 
     def get_libvirt_connection(self, force_tcp=False):
@@ -540,7 +542,8 @@ class VirtualMachine(VirtualDevice):
                 "VM is not attached to any host"
             )
         else:
-            # Tries to connect to libvirt (might raise an exception)
+            # Tries to get a pooled connection to libvirt (might raise an
+            # exception)
             return self.host.libvirt_connect(force_tcp=force_tcp)
 
     def get_libvirt_domain(self, force_tcp=False):
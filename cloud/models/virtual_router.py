@@ -1,9 +1,9 @@
-import commands
 import logging
 import socket
 import time
 from django.db import models
 from cloud.models.virtual_device import VirtualDevice
+from cloud.helpers.ovsdb import OVSDBException
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -37,40 +37,67 @@ class VirtualRouter(VirtualDevice):
     dev_name = models.CharField(max_length=15, db_index=True)
 
     def current_state(self):
+        # State already read by states_for
+        if hasattr(self, '_current_state'):
+            return self._current_state
 
         if self.host == None:
             return "Not Deployed"
         else:
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.host.ovsdb + ' --timeout=3 br-exists "' + self.dev_name + '"')
-            if out[0] != 0:
-                return "Not Found"
+            return self.state_from_bridges(self.host.get_openvswitch_bridges())
+
+    def state_from_bridges(self, bridges):
+        if bridges is None or self.dev_name not in bridges:
+            return "Not Found"
+        else:
+            return "Active"
+
+    # States of many routers reading the bridges of each host only once,
+    # the states are kept in the router objects (e.g. for templates)
+    @classmethod
+    def states_for(cls, routers):
+        # Imported here because the Host model imports the virtual devices
+        from cloud.models.host import Host
+
+        routers = list(routers)
+        hosts = {}
+        for vr in routers:
+            if vr.host_id is not None and vr.host_id not in hosts:
+                hosts[vr.host_id] = vr.host
+        bridges = Host.get_openvswitch_bridges_for(hosts.values())
+
+        states = {}
+        for vr in routers:
+            if vr.host_id is None:
+                vr._current_state = "Not Deployed"
             else:
-                return "Active"
+                vr._current_state = vr.state_from_bridges(bridges[vr.host_id])
+            states[vr.id] = vr._current_state
+        return states
 
     def deploy(self):
         # Details of deployment times
         t0 = time.time()
 
-        state = self.current_state()
-        
-        if state == "Not Deployed" or state == "Not Found":
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.host.ovsdb + ' --timeout=3 add-br "' + self.dev_name + '"')
-            if out[0] != 0:
-                raise self.VirtualRouterException('Could not deploy Virtual Router: %s %s' % (self.dev_name, out[1]))
-
         # Configures controllers
-        c_str = ""
+        c_list = []
         if self.cp_routing_protocol == "openflow":
             controllers = self.remotecontroller_set.order_by("controller_type")
-            if controllers:
-                for c in controllers:
-                    # Generates a space separated list of controllers (the connection is already formatted by the __unicode__ of the controller object)
-                    c_str += " " + str(c)
-
-        # Allways update the list of controllers, which may be empty
-        out = commands.getstatusoutput('ovs-vsctl --db=' + self.host.ovsdb + ' set-controller "' + self.dev_name + '" ' + c_str)
-        if out[0] != 0:
-            raise self.VirtualRouterException('Could not set controllers for: %s %s' % (self.dev_name, out[1]))
+            for c in controllers:
+                # The connection is already formatted by the __unicode__ of the controller object
+                c_list.append(str(c))
+
+        # Creates the bridge (if needed) and allways updates the list of
+        # controllers, which may be empty, in a single transaction
+        try:
+            txn = self.host.ovsdb_transaction()
+            txn.add_bridge(self.dev_name, may_exist=True)
+            txn.set_controller(self.dev_name, c_list)
+            txn.commit()
+        except OVSDBException as e:
+            raise self.VirtualRouterException('Could not deploy Virtual Router: %s %s' % (self.dev_name, str(e)))
+        finally:
+            self.forget_state()
 
         # Time spent defining and saving
         define_time = time.time() - t0
@@ -79,12 +106,20 @@ class VirtualRouter(VirtualDevice):
 
     def undeploy(self):
         if self.current_state() == "Active":
-            out = commands.getstatusoutput('ovs-vsctl --db=' + self.host.ovsdb + ' --timeout=3 del-br "' + self.dev_name + '"')
-            if out[0] != 0:
-                raise self.VirtualRouterException('Could not undeploy Virtual Router: %s %s' % (self.dev_name, out[1]))
+            try:
+                self.host.ovsdb_transaction().del_bridge(self.dev_name, if_exists=True).commit()
+            except OVSDBException as e:
+                raise self.VirtualRouterException('Could not undeploy Virtual Router: %s %s' % (self.dev_name, str(e)))
+            finally:
+                self.forget_state()
 
         return True
 
+    # Bridges of the host changed, the state has to be read again
+    def forget_state(self):
+        if hasattr(self, '_current_state'):
+            del self._current_state
+
     # If a Switch belongs to a slice it should have the slice name as suffix
     def save(self, *args, **kwargs):
         if self.belongs_to_slice != None:
@@ -4,7 +4,9 @@ import logging
 
 from random import randint
 
-from cloud.programs.deployment_program import DeploymentProgram
+from cloud.programs.deployment_program import DeploymentProgram, DeploymentPipeline
+from cloud.programs.capacity_snapshot import CapacitySnapshot
+from cloud.helpers.topology import topology
 from cloud.models.host import Host
 from cloud.models.switch import Switch
 from cloud.models.base_model import BaseModel
@@ -34,6 +36,9 @@ class DeployBalanced(DeploymentProgram):
         if len(vms) < 1:
             raise self.DeploymentException('No virtual machines in the slice')
 
+        # Capacity of hosts is read once and updated as VMs are placed
+        self.capacity = CapacitySnapshot(hs)
+
         # List of Links to deploy
         links = VirtualLink.objects.filter(belongs_to_slice=slice_obj)
 
@@ -108,53 +113,15 @@ class DeployBalanced(DeploymentProgram):
 
         total_reason_time = time.time() - t0
 
-        total_copy_time = 0
-        total_define_time = 0
-        total_start_time = 0
-        # Create VMs
-        for vm in vms:
-            # Deploy each VM individually
-            try:
-                stats = vm.deploy()
-                total_copy_time += stats["copy_time"]
-                total_define_time += stats["define_time"]
-                logger.info("Image copy time: %.3f" % stats["copy_time"])
-                logger.info("VM define time: %.3f" % stats["define_time"])
-
-            except BaseModel.ModelException as e:
-                raise self.DeploymentException('Unable to deploy VM ' + str(vm) + ': ' + str(e))
-
-        # Start VMs
-        t0 = time.time()
-        for vm in vms:
-            try:
-                t1 = time.time()
-                vm.start()
-                start_time = time.time() - t1
-                logger.info("VM start time: %.3f" % start_time)
-
-            except BaseModel.ModelException as e:
-                raise self.DeploymentException('Unable to start VM ' + str(vm) + ': ' + str(e))
-
-        total_start_time = time.time() - t0
+        # Deploy and start VMs concurrently, links are established as soon as both ends are running
+        stats = DeploymentPipeline(vms, [], links).run()
 
-        logger.info("Total image copy time: %.3f" % total_copy_time)
-        logger.info("Total VM define time: %.3f" % total_define_time)
-        logger.info("Total VM start time: %.3f" % total_start_time)
+        logger.info("Total image copy time: %.3f" % stats["copy_time"])
+        logger.info("Total VM define time: %.3f" % stats["define_time"])
+        logger.info("Total VM start time: %.3f" % stats["start_time"])
         logger.info("Total reasoning time: %.3f" % total_reason_time)
+        logger.info("Total link establishment time: %.3f" % stats["establish_time"])
 
-        # Create Links
-        t0 = time.time()
-        for link in links:
-            t1 = time.time()
-            link.establish()
-            establish_time = time.time() - t1
-            logger.info("Link establishment time: %.3f" % establish_time)
-
-        total_establish_time = time.time() - t0
-
-        logger.info("Total link establishment time: %.3f" % total_establish_time)
-        
         total_time = time.time() - t_initial
         logger.info("Total slice deployment time: %.3f" % total_time)
         return True
@@ -176,17 +143,17 @@ class DeployBalanced(DeploymentProgram):
         candidate_hosts = []
         for host in hosts:
             # Host must be active
-            cs = host.current_state()
-            if cs != "Active":
+            capacity = self.capacity.get(host)
+            if not capacity.active:
                 continue
 
             # Checks current allocation of memory and CPU
-            mem_allocation = host.get_memory_allocation()['total']
-            cpu_allocation = host.get_cpu_allocation()['total']
-            
+            mem_allocation = capacity.memory_allocated
+            cpu_allocation = capacity.cpu_allocated
+
             # Divide the total capacity of a host because this is an emulated datacenter
-            mem_total = host.get_memory_stats()['total'] / len(hosts) 
-            cpu_total = host.get_info()['cores'] / len(hosts) * 8 # Overprovision a bit ;)
+            mem_total = capacity.memory_total / len(hosts)
+            cpu_total = capacity.cores / len(hosts) * 8 # Overprovision a bit ;)
 
             # Host must have enough memory
             mem_free = mem_total - mem_allocation 
@@ -247,6 +214,7 @@ class DeployBalanced(DeploymentProgram):
         # Save VM to update host information
         vm.host = final_host["object"]
         vm.save()
+        self.capacity.allocate(vm, vm.host)
 
     # Calculates a fuzzy resource allocation coefficient. The smaller the coefficient less resources are left
     def resource_allocation_coefficient(self, free_cpu, total_cpu, free_memory, total_memory):
@@ -258,18 +226,5 @@ class DeployBalanced(DeploymentProgram):
         return host_list[pos]
 
     def calculate_distances(self, host, hosts):
-        # Find this host in the topology
-        output = {}
-        for h in hosts:
-            if h == host: # Own host, distance equals 1
-                distance = 1
-            else:
-                path = host.path_to(h)
-                if path is None:
-                    distance = 42 # Invalid distance
-                else:
-                    distance = len(path) / 2 # Path describes in and out ports for every hop
-
-            output[h.name] = distance
-
-        return output
+        # Distances come from the all-pairs matrix of the topology (own host equals 1, unreachable 42)
+        return topology.distances_from(host, hosts)
@@ -3,7 +3,8 @@ import logging
 
 from random import shuffle
 
-from cloud.programs.deployment_program import DeploymentProgram
+from cloud.programs.deployment_program import DeploymentProgram, DeploymentPipeline
+from cloud.programs.capacity_snapshot import CapacitySnapshot
 from cloud.models.host import Host
 from cloud.models.base_model import BaseModel
 from cloud.models.virtual_machine import VirtualMachine
@@ -27,6 +28,9 @@ class DeployRandom(DeploymentProgram):
         if len(hs) < 1:
             raise self.DeploymentException('No hosts available for deployment')
 
+        # Capacity of hosts is read once and updated as VMs are placed
+        self.capacity = CapacitySnapshot(hs)
+
         # List of VMs to deploy
         vms = VirtualMachine.objects.filter(belongs_to_slice=slice_obj)
 
@@ -41,11 +45,9 @@ class DeployRandom(DeploymentProgram):
         gather_info_time = time.time() - t0
         logger.info("Information gathering time: %.3f" % gather_info_time)
 
-        total_copy_time = 0
-        total_define_time = 0
         total_reason_time = 0
 
-        # Create VMs
+        # Choose hosts
         for vm in vms:
             # Deploy on random host with enough resources
             t0 = time.time()
@@ -58,55 +60,20 @@ class DeployRandom(DeploymentProgram):
                 raise self.DeploymentException('No hosts with the resources available for deployment')
 
             vm.host = h
-
-            # Deploy each VM
-            try:
-                stats = vm.deploy()
-                total_copy_time += stats["copy_time"]
-                total_define_time += stats["define_time"]
-                logger.info("Image copy time: %.3f" % stats["copy_time"])
-                logger.info("VM define time: %.3f" % stats["define_time"])
-
-            except BaseModel.ModelException as e:
-                raise self.DeploymentException('Unable to deploy VM ' + str(vm) + ': ' + str(e))
+            self.capacity.allocate(vm, h)
 
             # Save VM to update host information
             vm.save()
 
-        # Start VMs
-        t0 = time.time()
-        for vm in vms:
-            try:
-                t1 = time.time()
-                vm.start()
-                start_time = time.time() - t1
-                logger.info("VM start time: %.3f" % start_time)
-            except BaseModel.ModelException as e:
-                raise self.DeploymentException('Unable to start VM ' + str(vm) + ': ' + str(e))
-
-        total_start_time = time.time() - t0
-
-        logger.info("Total image copy time: %.3f" % total_copy_time)
-        logger.info("Total VM define time: %.3f" % total_define_time)
-        logger.info("Total VM start time: %.3f" % total_start_time)
-        logger.info("Total reasoning time: %.3f" % total_reason_time)
-
-        total_define_time = 0
-
-        # Whait so the controller recognizes the VMs (workarround)
-        time.sleep(5)
-
-        # Create Links
-        t0 = time.time()
-        for link in links:
-            t1 = time.time()
-            link.establish()
-            establish_time = time.time() - t1
-            logger.info("Link establishment time: %.3f" % establish_time)
-
-        total_establish_time = time.time() - t0
+        # Deploy and start VMs concurrently. Links wait 5 seconds after both
+        # ends are running so the controller recognizes the VMs (workarround)
+        stats = DeploymentPipeline(vms, [], links, link_delay=5).run()
 
-        logger.info("Total link establishment time: %.3f" % total_establish_time)
+        logger.info("Total image copy time: %.3f" % stats["copy_time"])
+        logger.info("Total VM define time: %.3f" % stats["define_time"])
+        logger.info("Total VM start time: %.3f" % stats["start_time"])
+        logger.info("Total reasoning time: %.3f" % total_reason_time)
+        logger.info("Total link establishment time: %.3f" % stats["establish_time"])
 
         return True
 
@@ -117,9 +84,12 @@ class DeployRandom(DeploymentProgram):
         shuffle(r_list)
         for i in r_list:
             candidate = host_list[i]
+            capacity = self.capacity.get(candidate)
+            if not capacity.active:
+                continue
             # Memory
-            mem_capacity = candidate.get_memory_stats()['total'] / len(host_list) # Divide the total memory of a host because this is an emulated datacenter
-            mem_allocation = candidate.get_memory_allocation()['total']
+            mem_capacity = capacity.memory_total / len(host_list) # Divide the total memory of a host because this is an emulated datacenter
+            mem_allocation = capacity.memory_allocated
             # CPU
             # cpu_capacity = candidate.get_info()['cores'] / len(host_list)
             # cpu_allocation = candidate.get_cpu_allocation()
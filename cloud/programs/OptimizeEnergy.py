@@ -1,6 +1,7 @@
 import logging
 import time
 from cloud.programs.optimization_program import OptimizationProgram
+from cloud.programs.capacity_snapshot import CapacitySnapshot
 from cloud.models.host import Host
 from cloud.models.base_model import BaseModel
 from cloud.models.virtual_machine import VirtualMachine
@@ -22,14 +23,18 @@ class OptimizeEnergy(OptimizationProgram):
         if len(hs) < 1:
             raise self.OptimizationException('No hosts available')
 
+        # Capacity of hosts is read once and updated as VMs are migrated
+        self.capacity = CapacitySnapshot(hs)
+
         # List of VMs
         vms = VirtualMachine.objects.all()
+        states = VirtualMachine.states_for(vms)
 
         # Reorganize VMs
         migrations = 0
         for vm in vms:  
             # Skip not deployed VMs
-            if vm.current_state() != "running":
+            if states[vm.id] != "running":
                 continue
 
             #logger.debug("Checking VM: %s" % vm.name)
@@ -40,7 +45,9 @@ class OptimizeEnergy(OptimizationProgram):
             if h != None and h != vm.host:
                 logger.info("Migrate VM %s (%s -> %s)" % (vm.name, vm.host.name, h.name))
                 try:
+                    source = vm.host
                     vm.migrate(h)
+                    self.capacity.move(vm, source, h)
                     migrations += 1
                 except BaseModel.ModelException as e:
                     raise self.OptimizationException('Unable to migrate VM ' + str(vm) + ': ' + str(e))
@@ -56,8 +63,9 @@ class OptimizeEnergy(OptimizationProgram):
         requested_mem = vm.memory
 
         # Divide the total memory of a host because this is an emulated datacenter
-        mem_capacity = vm.host.get_memory_stats()['total'] / 32 # len(host_list) Hard-coded so that the total memory of a host doesnt change
-        mem_allocation = vm.host.get_memory_allocation()['total']
+        capacity = self.capacity.get(vm.host)
+        mem_capacity = capacity.memory_total / 32 # len(host_list) Hard-coded so that the total memory of a host doesnt change
+        mem_allocation = capacity.memory_allocated
         # Initial lowest residual capacity is the capacity of the origin host 
         lowest_residual_capacity = mem_capacity - mem_allocation
  
@@ -65,8 +73,11 @@ class OptimizeEnergy(OptimizationProgram):
         new_candidate = None
         for candidate in host_list:
             # Divide the total memory of a host because this is an emulated datacenter
-            mem_capacity = candidate.get_memory_stats()['total'] / 32 # len(host_list) Hard-coded so that the total memory of a host doesnt change
-            mem_allocation = candidate.get_memory_allocation()['total']
+            capacity = self.capacity.get(candidate)
+            if not capacity.active:
+                continue
+            mem_capacity = capacity.memory_total / 32 # len(host_list) Hard-coded so that the total memory of a host doesnt change
+            mem_allocation = capacity.memory_allocated
             free_mem_capacity = mem_capacity - mem_allocation - requested_mem
             test1 = free_mem_capacity < lowest_residual_capacity
             test2 = free_mem_capacity >= 0
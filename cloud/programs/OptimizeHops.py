@@ -3,6 +3,8 @@ import time
 import logging
 from random import randint
 from cloud.programs.optimization_program import OptimizationProgram
+from cloud.programs.capacity_snapshot import CapacitySnapshot
+from cloud.helpers.topology import topology
 from cloud.models.host import Host
 from cloud.models.switch import Switch
 from cloud.models.base_model import BaseModel
@@ -25,6 +27,9 @@ class OptimizeHops(OptimizationProgram):
         #logger.debug("hs %s" % str(hs))
         if len(hs) < 1:
             raise self.OptimizationException('No hosts available')
+
+        # Capacity of hosts is read once and updated as VMs are migrated
+        self.capacity = CapacitySnapshot(hs)
         
         # List of Links 
         links = VirtualLink.objects.all()
@@ -60,6 +65,9 @@ class OptimizeHops(OptimizationProgram):
             logger.debug("No links to optimize")
             return True
 
+        # States of all VMs in the pairs, read once per host
+        states = VirtualMachine.states_for([p['start'] for p in optimization_pairs] + [p['end'] for p in optimization_pairs])
+
         # Reasoning part: decides where to place pairs of VMs based on the links between them
         migrated = []
         pivots = []
@@ -72,7 +80,7 @@ class OptimizeHops(OptimizationProgram):
             pair['distance'] = host_hops[pair['start'].host.name][pair['end'].host.name] # Assume fully connected infrastructure
 
             # Skip VMs not running
-            if pair['start'].current_state() != "running" or pair['end'].current_state() != "running":
+            if states[pair['start'].id] != "running" or states[pair['end'].id] != "running":
                 continue
 
             # The pivot is the VM with more links (minimize migrations)
@@ -146,7 +154,9 @@ class OptimizeHops(OptimizationProgram):
             if best_distances < original_distances or (best_distances == original_distances and best_longest_link < original_longest_link):
                 logger.info("Migrate VM %s (%s -> %s) - Distances: (Orig %d:%d, Best: %d:%d)" % (free.name, free.host.name, best_host.name, original_distances, original_longest_link, best_distances, best_longest_link))
                 try:
+                    source = free.host
                     free.migrate(best_host)
+                    self.capacity.move(free, source, best_host)
                     migrated.append(free.name)
                     pivots.append(pivot.name)
                     migrations += 1
@@ -163,15 +173,15 @@ class OptimizeHops(OptimizationProgram):
         candidate_hosts = []
         for host in hosts:
             # Host must be active
-            cs = host.current_state()
-            if cs != "Active":
+            capacity = self.capacity.get(host)
+            if not capacity.active:
                 continue
             # The original host of VM free should not be on the list
             if host.name == vm_free.host.name:
                 continue
             # Checks current allocation of memory and CPU 
-            mem_allocation = host.get_memory_allocation()['total']
-            mem_total = host.get_memory_stats()['total'] / 32 # len(host_list) Hard-coded so that the total memory of a host doesnt change
+            mem_allocation = capacity.memory_allocated
+            mem_total = capacity.memory_total / 32 # len(host_list) Hard-coded so that the total memory of a host doesnt change
             
             # Host must have enough memory
             mem_free = mem_total - mem_allocation
@@ -203,18 +213,5 @@ class OptimizeHops(OptimizationProgram):
         return final_list
 
     def calculate_distances(self, host, hosts):
-        # Find this host in the topology
-        output = {}
-        for h in hosts:
-            if h == host: # Own host, distance equals 1
-                distance = 1
-            else:
-                path = host.path_to(h)
-                if path is None:
-                    distance = 42 # Invalid distance
-                else:
-                    distance = len(path) / 2 # Path describes in and out ports for every hop
-
-            output[h.name] = distance
-
-        return output
+        # Distances come from the all-pairs matrix of the topology (own host equals 1, unreachable 42)
+        return topology.distances_from(host, hosts)
@@ -0,0 +1,99 @@
+# Capacity of hosts shared by deployment and optimization programs
+import libvirt
+import logging
+from cloud.helpers.host_sync import run_on_hosts
+from cloud.models.host import Host
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+
+# Capacity and allocation of a single host
+class HostCapacity(object):
+    def __init__(self, host):
+        self.host = host
+        # Whether the hypervisor could be reached when the snapshot was built
+        self.active = False
+        # Total memory (KiB) as reported by getMemoryStats()
+        self.memory_total = 0
+        # Cores per socket from the host facts (same as get_info()['cores'])
+        self.cores = 0
+        # Sum of memory (KiB) and vCPUs of the VMs placed on this host
+        self.memory_allocated = 0
+        self.cpu_allocated = 0
+        self.vms = 0
+
+    def __repr__(self):
+        return '<HostCapacity %s: mem %d/%d cpu %d/%d%s>' % (
+            self.host.name, self.memory_allocated, self.memory_total,
+            self.cpu_allocated, self.cores, '' if self.active else ' off-line'
+        )
+
+
+class CapacitySnapshot(object):
+    """Capacity of all hosts read once per program run
+
+    Allocations come from a single aggregated query and hypervisor stats
+    from one call per host (made in parallel). Programs read the snapshot
+    instead of asking every host for every VM and keep it up to date with
+    allocate(), release() and move() as they place or migrate VMs.
+    """
+
+    def __init__(self, hosts):
+        self.hosts = list(hosts)
+        self.capacities = {}
+        self.refresh()
+
+    def refresh(self):
+        self.capacities = {}
+        for host in self.hosts:
+            self.capacities[host.id] = HostCapacity(host)
+
+        # Allocations of all hosts in one GROUP BY query
+        for host_id, allocation in Host.get_allocations(self.hosts).items():
+            capacity = self.capacities[host_id]
+            capacity.memory_allocated = allocation['memory']['total']
+            capacity.cpu_allocated = allocation['cpu']['total']
+            capacity.vms = allocation['vms']
+
+        # Hypervisor information of all hosts in parallel
+        for entry in run_on_hosts(self._read_host, self.hosts):
+            capacity = self.capacities[entry['host'].id]
+            if entry['ok']:
+                capacity.active = True
+                capacity.memory_total, capacity.cores = entry['result']
+            else:
+                logger.warning('Host %s not available for placement: %s' % (entry['host'].name, entry['error']))
+
+    def _read_host(self, host):
+        lv_conn = host.libvirt_connect()
+        memory = lv_conn.getMemoryStats(libvirt.VIR_NODE_MEMORY_STATS_ALL_CELLS, 0)['total']
+        facts = host.get_facts()
+        cores = facts.cores if facts is not None else lv_conn.getInfo()[6]
+        return memory, cores
+
+    def get(self, host):
+        return self.capacities[host.id]
+
+    def active_hosts(self):
+        return [h for h in self.hosts if self.capacities[h.id].active]
+
+    # Accounts a VM placed on host
+    def allocate(self, vm, host):
+        capacity = self.capacities[host.id]
+        capacity.memory_allocated += vm.memory
+        capacity.cpu_allocated += vm.vcpu
+        capacity.vms += 1
+
+    # Accounts a VM removed from host
+    def release(self, vm, host):
+        capacity = self.capacities[host.id]
+        capacity.memory_allocated -= vm.memory
+        capacity.cpu_allocated -= vm.vcpu
+        capacity.vms -= 1
+
+    # Accounts a VM migrated between hosts
+    def move(self, vm, source, dest):
+        if source is not None:
+            self.release(vm, source)
+        self.allocate(vm, dest)
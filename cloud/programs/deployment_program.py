@@ -1,5 +1,14 @@
 #Base class for deployment programs
+import logging
+import threading
+import time
+import Queue
 from abc import ABCMeta
+from django.conf import settings
+from django.db import connection
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
 
 class DeploymentProgram():
     # Prevents instantiation of this class (abstract)
@@ -16,3 +25,196 @@ class DeploymentProgram():
             self.msg = msg
         def __str__(self):
             return repr(self.msg)
+
+
+class DeploymentPipeline(object):
+    """Deploys virtual machines, routers and links concurrently
+
+    Every VM is deployed (image copy and define) and started in its own
+    task, every router is deployed in its own task, and at most
+    settings.DEPLOYMENT['per_host'] of these tasks run on the same host at a
+    time. A link is established as soon as both of its endpoints are
+    running (and link_delay seconds have passed, so the controller can see
+    the new interfaces). Hosts must be assigned to the devices beforehand.
+
+    run() returns the aggregated times (sums over all devices) and the wall
+    clock time of the whole pipeline, and raises
+    DeploymentProgram.DeploymentException if any task failed.
+    """
+
+    def __init__(self, vms=(), routers=(), links=(), max_workers=None, per_host=None, link_delay=0):
+        self.vms = list(vms)
+        self.routers = list(routers)
+        self.links = list(links)
+        self.max_workers = max_workers or settings.DEPLOYMENT['max_workers']
+        self.per_host = per_host or settings.DEPLOYMENT['per_host']
+        self.link_delay = link_delay
+
+        self.lock = threading.Lock()
+        self.host_slots = {}
+        self.queue = Queue.Queue()
+        self.pending = 0
+        self.all_done = threading.Event()
+        self.errors = []
+        # Time each device became ready, indexed by virtual device id
+        self.ready = {}
+        self.stats = {
+            'copy_time': 0.0,
+            'define_time': 0.0,
+            'start_time': 0.0,
+            'establish_time': 0.0,
+            'router_define_time': 0.0,
+            'total_time': 0.0,
+        }
+
+    def run(self):
+        t0 = time.time()
+
+        # Links wait for the endpoints deployed by this pipeline, the others
+        # are assumed to be running already
+        deployed = set([vm.id for vm in self.vms] + [vr.id for vr in self.routers])
+        self.waiting_links = []
+        for link in self.links:
+            endpoints = set([link.if_start.attached_to_id, link.if_end.attached_to_id]) & deployed
+            self.waiting_links.append((link, endpoints))
+
+        for vm in self.vms:
+            self.submit(self.deploy_vm, vm)
+        for vr in self.routers:
+            self.submit(self.deploy_router, vr)
+        self.schedule_links()
+
+        workers = []
+        for i in range(max(1, self.max_workers)):
+            w = threading.Thread(target=self.worker)
+            w.daemon = True
+            w.start()
+            workers.append(w)
+
+        # Nothing was submitted
+        with self.lock:
+            if self.pending == 0:
+                self.all_done.set()
+
+        self.all_done.wait()
+        for w in workers:
+            self.queue.put(None)
+        for w in workers:
+            w.join()
+
+        self.stats['total_time'] = time.time() - t0
+
+        if self.errors:
+            raise DeploymentProgram.DeploymentException('; '.join(self.errors))
+
+        return self.stats
+
+    def submit(self, func, obj):
+        with self.lock:
+            self.pending += 1
+        self.queue.put((func, obj))
+
+    def worker(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            func, obj = task
+            try:
+                # Once something failed the remaining tasks are skipped
+                if not self.errors:
+                    func(obj)
+            except Exception as e:
+                with self.lock:
+                    self.errors.append(str(e))
+                logger.error('Deployment task failed for %s: %s' % (str(obj), str(e)))
+            finally:
+                with self.lock:
+                    self.pending -= 1
+                    if self.pending == 0:
+                        self.all_done.set()
+        # Every thread gets its own database connection from Django
+        connection.close()
+
+    def host_slot(self, host):
+        with self.lock:
+            if host.id not in self.host_slots:
+                self.host_slots[host.id] = threading.Semaphore(self.per_host)
+            return self.host_slots[host.id]
+
+    def deploy_vm(self, vm):
+        if vm.host is None:
+            raise DeploymentProgram.DeploymentException('VM ' + str(vm) + ' has no host assigned')
+
+        slot = self.host_slot(vm.host)
+        with slot:
+            try:
+                stats = vm.deploy()
+            except Exception as e:
+                raise DeploymentProgram.DeploymentException('Unable to deploy VM ' + str(vm) + ': ' + str(e))
+            logger.info("Image copy time: %.3f" % stats["copy_time"])
+            logger.info("VM define time: %.3f" % stats["define_time"])
+
+            t0 = time.time()
+            try:
+                vm.start()
+            except Exception as e:
+                raise DeploymentProgram.DeploymentException('Unable to start VM ' + str(vm) + ': ' + str(e))
+            start_time = time.time() - t0
+            logger.info("VM start time: %.3f" % start_time)
+
+        with self.lock:
+            self.stats['copy_time'] += stats["copy_time"]
+            self.stats['define_time'] += stats["define_time"]
+            self.stats['start_time'] += start_time
+            self.ready[vm.id] = time.time()
+        self.schedule_links()
+
+    def deploy_router(self, vr):
+        if vr.host is None:
+            raise DeploymentProgram.DeploymentException('Virtual Router ' + str(vr) + ' has no host assigned')
+
+        slot = self.host_slot(vr.host)
+        with slot:
+            try:
+                stats = vr.deploy()
+            except Exception as e:
+                raise DeploymentProgram.DeploymentException('Unable to deploy Virtual Router ' + str(vr) + ': ' + str(e))
+            # Save Virtual Router to update host information
+            vr.save()
+
+        with self.lock:
+            self.stats['router_define_time'] += stats["define_time"]
+            self.ready[vr.id] = time.time()
+        self.schedule_links()
+
+    # Submits the links whose endpoints are all ready
+    def schedule_links(self):
+        runnable = []
+        with self.lock:
+            for entry in list(self.waiting_links):
+                link, endpoints = entry
+                if all(e in self.ready for e in endpoints):
+                    self.waiting_links.remove(entry)
+                    ready_at = max([self.ready[e] for e in endpoints] or [0])
+                    runnable.append((link, ready_at))
+        for link, ready_at in runnable:
+            self.submit(self.establish_link, (link, ready_at))
+
+    def establish_link(self, task):
+        link, ready_at = task
+        # Gives the controller some time to recognize the new interfaces
+        wait = ready_at + self.link_delay - time.time()
+        if ready_at and wait > 0:
+            time.sleep(wait)
+
+        t0 = time.time()
+        try:
+            link.establish()
+        except Exception as e:
+            raise DeploymentProgram.DeploymentException('Unable to establish link ' + str(link) + ': ' + str(e))
+        establish_time = time.time() - t0
+        logger.info("Link establishment time: %.3f" % establish_time)
+
+        with self.lock:
+            self.stats['establish_time'] += establish_time
@@ -151,6 +151,10 @@ urlpatterns = patterns('cloud.views',
     url(r'^events/(?P<event_id>\d+)/$', 'events.detail'),
     url(r'^events/(?P<event_id>\d+)/delete/$', 'events.delete'),
 
+    #Jobs (only webservices)
+    url(r'^jobs/$', 'jobs.index'),  # Webservice
+    url(r'^jobs/(?P<job_id>\d+)/$', 'jobs.status'),  # Webservice
+
     #Monitoring
     url(r'^monitoring/settings/$', 'monitoring.settings',
         name='cloud-monitoring-settings'),
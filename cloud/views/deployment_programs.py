@@ -10,6 +10,7 @@ from django.template.context import RequestContext
 from cloud.models.program import PROGRAM_STATES
 from cloud.models.deployment_program import DeploymentProgram
 from cloud.helpers import session_flash, paginate
+from cloud.helpers.programs import registry as program_registry, ProgramLoadError
 
 # Configure logging for the module name
 logger = logging.getLogger(__name__)
@@ -103,12 +104,17 @@ def new(request):
             alg.state = form.cleaned_data['state']
             #Save the contents in a file
             filename = form.cleaned_data['filename']
-            alg.file.save(filename, ContentFile(form.cleaned_data['file']))
-
-            alg.save()
-
-            session_flash.set_flash(request, "New Deployment Program successfully created")
-            return redirect('cloud-deployment-programs-index') # Redirect after POST
+            # Loading problems are reported now instead of when it runs
+            try:
+                elapsed = program_registry.validate('deployment', filename[0:-3], form.cleaned_data['file'])
+            except ProgramLoadError as e:
+                form.add_error('file', str(e))
+            else:
+                alg.file.save(filename, ContentFile(form.cleaned_data['file']))
+                alg.save()
+
+                session_flash.set_flash(request, "New Deployment Program successfully created (loaded in %.3f seconds)" % elapsed)
+                return redirect('cloud-deployment-programs-index') # Redirect after POST
     else:
         form = DeploymentProgramForm() # An unbound form
 
@@ -137,6 +143,7 @@ def delete(request, deployment_program_id):
         raise Http404
 
     # Delete saved file
+    program_registry.forget(alg)
     try:
         alg.file.delete()
         session_flash.set_flash(request, "Deployment Program %s was successfully deleted!" % str(alg))
@@ -9,7 +9,7 @@ from django.http import HttpResponse, Http404
 from django.shortcuts import render_to_response, redirect
 from django.template import Context, loader
 from django.template.context import RequestContext
-from cloud.models.event import Event, EVENT_STATES, RELATIONAL_OPERATION
+from cloud.models.event import Event, EVENT_STATES, RELATIONAL_OPERATION, EVENT_AGGREGATES
 from cloud.models.metric import Metric
 from cloud.models.slice import Slice
 from cloud.models.optimization_program import OptimizationProgram
@@ -98,7 +98,12 @@ class EventForm(forms.Form):
     belongs_to_slice = forms.ModelChoiceField(queryset=Slice.objects.all(), required=False)
     metric = forms.ModelChoiceField(queryset=Metric.objects.all())
     relational_operation = forms.ChoiceField(choices=RELATIONAL_OPERATION)
-    value = forms.CharField(max_length=200)
+    field = forms.CharField(max_length=200, required=False, help_text='Field of the metric result (empty for metrics returning a number)')
+    value = forms.FloatField()
+    aggregate = forms.ChoiceField(choices=EVENT_AGGREGATES)
+    window = forms.IntegerField(min_value=0, initial=0, help_text='Seconds of samples aggregated (0 compares every sample)')
+    hysteresis = forms.FloatField(min_value=0, initial=0)
+    cooldown = forms.IntegerField(min_value=0, initial=300, help_text='Minimum seconds between two program runs')
     program = forms.ModelChoiceField(queryset=OptimizationProgram.objects.all())
     
 @login_required
@@ -118,6 +123,11 @@ def new(request):
             event.relational_operation = form.cleaned_data['relational_operation']
             event.value = form.cleaned_data['value']
             event.program = form.cleaned_data['program']
+            event.field = form.cleaned_data['field']
+            event.aggregate = form.cleaned_data['aggregate']
+            event.window = form.cleaned_data['window']
+            event.hysteresis = form.cleaned_data['hysteresis']
+            event.cooldown = form.cleaned_data['cooldown']
             
             # TODO: Configure monitoring system for this event
             event.save()
@@ -8,6 +8,8 @@ from django.shortcuts import render_to_response, redirect
 from django.template import Context, RequestContext, loader
 from libvirt import libvirtError
 from cloud.helpers import session_flash, paginate
+from cloud.helpers.host_sync import run_on_hosts
+from cloud.helpers.topology import topology
 from cloud.models.host import Host, DRIVERS, TRANSPORTS
 from cloud.models.interface import Interface, INTERFACE_TYPES, INTERFACE_DUPLEX_TYPE
 from cloud.models.virtual_machine import VirtualMachine
@@ -248,6 +250,14 @@ def new_interface(request, host_id):
     })
     return render_to_response('base-form.html', c)
 
+# Names of all domains (active or not) defined in a host
+def _list_domain_names(host):
+    lv_conn = host.libvirt_connect()
+    try:
+        return [dom.name() for dom in lv_conn.listAllDomains(0)]
+    except libvirtError as e:
+        raise host.HostException('Failed to read domains from hypervisor: ' + str(lv_conn) + ' ' + str(e))
+
 @login_required
 def list_infrastructure(request):
     ''' Temporary just to keep the infrastructure consistent '''
@@ -255,65 +265,49 @@ def list_infrastructure(request):
 
     all_domains = {}
 
-    for h in hosts:
-        lv_conn = h.libvirt_connect()
-        all_domains[h.name] = []
-        try:
-            def_domains = lv_conn.listDefinedDomains()
-            active_domains = lv_conn.listDomainsID()
-        except libvirtError as e:
-            logger.error('Failed to read domains from hypervisor: ' + lv_conn + ' ' + str(e))
-            session_flash.set_flash(request, 'Failed to read domains from hypervisor: ' + lv_conn + ' ' + str(e), 'danger')
-        for dom_id in active_domains:
-            # Get domain info from libvirt
-            try:
-                dom = lv_conn.lookupByID(dom_id)
-                dom_name = dom.name()
-                vms = VirtualMachine.objects.filter(name=dom_name)
-                if len(vms) > 0 and vms[0].host == h:
-                    dom_name += " (OK)"
-                elif len(vms) == 0:
-                    dom_name += " (not found in DB)"
-                else:
-                    vms[0].host = h
-                    vms[0].save()
-                    dom_name += " (Fixed DB)"
-                all_domains[h.name].append(dom_name)
+    # Hypervisors are read in parallel, database fixes are applied here
+    report = run_on_hosts(_list_domain_names, hosts)
+    names = []
+    for entry in report:
+        if entry['ok']:
+            names += entry['result']
 
-            except libvirtError as e:
-                logger.error('Failed to read domain info from hypervisor: ' + lv_conn + ' ' + str(e))
-                session_flash.set_flash(request, 'Failed to read domains from hypervisor: ' + lv_conn + ' ' + str(e), 'danger')
+    vms_by_name = {}
+    for vm in VirtualMachine.objects.filter(name__in=names).order_by('id'):
+        vms_by_name.setdefault(vm.name, vm)
 
-        for dom_name in def_domains:
-            # Get domain info from libvirt
-            try:
-                dom = lv_conn.lookupByName(dom_name)
-                vms = VirtualMachine.objects.filter(name=dom_name)
-                if len(vms) > 0 and vms[0].host == h:
-                    dom_name += " (OK)"
-                elif len(vms) == 0:
-                    dom_name += " (not found in DB)"
-                else:
-                    vms[0].host = h
-                    vms[0].save()
-                    dom_name += " (Fixed DB)"
-                all_domains[h.name].append(dom_name)
+    for entry in report:
+        h = entry['host']
+        all_domains[h.name] = []
+        if not entry['ok']:
+            logger.error('Failed to read domains from hypervisor: ' + str(h) + ' ' + entry['error'])
+            session_flash.set_flash(request, 'Failed to read domains from hypervisor: ' + str(h) + ' ' + entry['error'], 'danger')
+            continue
 
-            except libvirtError as e:
-                logger.error('Failed to read domain info from hypervisor: ' + lv_conn + ' ' + str(e))
-                session_flash.set_flash(request, 'Failed to read domains from hypervisor: ' + lv_conn + ' ' + str(e), 'danger')
+        for dom_name in entry['result']:
+            vm = vms_by_name.get(dom_name)
+            if vm is not None and vm.host_id == h.id:
+                dom_name += " (OK)"
+            elif vm is None:
+                dom_name += " (not found in DB)"
+            else:
+                vm.host = h
+                vm.save()
+                dom_name += " (Fixed DB)"
+            all_domains[h.name].append(dom_name)
 
     return HttpResponse("<pre>" + json.dumps(all_domains, sort_keys=True, indent=2, separators=(',', ': ')) + "</pre>")
 
 @login_required
 def list_allocations(request):
     ''' Temporary just to keep the infrastructure consistent '''
-    hosts = Host.objects.all()
+    hosts = Host.objects.select_related('facts')
+    host_allocations = Host.get_allocations(hosts)
 
     allocations = 'host;cpu_allocation;memory_allocation;vms;cpu_total;memory_total\n'
     for h in hosts:
-        cpu = h.get_cpu_allocation()['total']
-        mem = h.get_memory_allocation()['total']
+        cpu = host_allocations[h.id]['cpu']['total']
+        mem = host_allocations[h.id]['memory']['total']
         vms = h.get_num_of_vms()
         tcpu = h.get_info()['cores']
         tmem = h.get_memory_stats()['total']
@@ -325,15 +319,16 @@ def list_allocations(request):
 def list_distances(request):
     ''' Temporary just to keep the infrastructure consistent '''
     links = VirtualLink.objects.all()
+    states = VirtualMachine.states_for(VirtualMachine.objects.all())
 
     allocations = 'link;dev_start;dev_end;distance\n'
     for link in links:
         if link.if_start.attached_to.is_virtual_machine() and link.if_end.attached_to.is_virtual_machine():
             dev_start = link.if_start.attached_to.virtualmachine
             dev_end = link.if_end.attached_to.virtualmachine
-            if dev_start.current_state() != 'running' or dev_end.current_state() != 'running':
+            if states[dev_start.id] != 'running' or states[dev_end.id] != 'running':
                 continue
-            distance = len(dev_start.host.path_to(dev_end.host))/2
+            distance = topology.distance(dev_start.host, dev_end.host)
         
             allocations += '%s;%s;%s;%d\n' % (str(link), str(dev_start), str(dev_end), distance)
     return HttpResponse("<pre>" + allocations + "</pre>")
@@ -0,0 +1,35 @@
+import json
+import logging
+from django.http import HttpResponse, Http404
+from cloud.models.job import Job, JOB_STATES
+
+# Configure logging for the module name
+logger = logging.getLogger(__name__)
+
+# Webservice to list the most recent jobs (optionally filtered by state or slice)
+# TODO: Authenticate the remote system
+def index(request):
+    jobs = Job.objects.order_by('-id')
+    if request.GET.get('state') in dict(JOB_STATES):
+        jobs = jobs.filter(state=request.GET['state'])
+    if request.GET.get('slice', '').isdigit():
+        jobs = jobs.filter(slice=request.GET['slice'])
+
+    output = []
+    for job in jobs[:50]:
+        entry = job.as_dict()
+        # Logs can be long, ask for a single job to read it
+        del entry['log']
+        output.append(entry)
+
+    return HttpResponse(json.dumps(output), content_type='application/json')
+
+# Webservice to poll the status of a job
+# TODO: Authenticate the remote system
+def status(request, job_id):
+    try:
+        job = Job.objects.get(pk=job_id)
+    except Job.DoesNotExist:
+        raise Http404
+
+    return HttpResponse(json.dumps(job.as_dict()), content_type='application/json')
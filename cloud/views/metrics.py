@@ -10,6 +10,7 @@ from django.template import Context, loader
 from django.template.context import RequestContext
 from cloud.models.metric import Metric, METRIC_SCOPES, METRIC_STATES, RETURN_DATA_TYPE
 from cloud.helpers import session_flash, paginate
+from cloud.helpers.programs import registry as program_registry, ProgramLoadError
 
 # Configure logging for the module name
 logger = logging.getLogger(__name__)
@@ -70,6 +71,8 @@ class MetricForm(forms.Form):
     returns = forms.ChoiceField(choices=RETURN_DATA_TYPE)
     scope = forms.ChoiceField(choices=METRIC_SCOPES)
     state = forms.ChoiceField(choices=METRIC_STATES)
+    interval = forms.IntegerField(min_value=1, initial=60, help_text='Seconds between collections')
+    timeout = forms.IntegerField(min_value=1, initial=10, help_text='Seconds to wait for each collection')
     file = forms.CharField(widget=forms.Textarea)
     
     def clean(self):
@@ -104,14 +107,21 @@ def new(request):
             metr.returns = form.cleaned_data['returns']
             metr.scope = form.cleaned_data['scope']
             metr.state = form.cleaned_data['state']
+            metr.interval = form.cleaned_data['interval']
+            metr.timeout = form.cleaned_data['timeout']
             #Save the contents in a file
             filename = form.cleaned_data['filename']
-            metr.file.save(filename, ContentFile(form.cleaned_data['file']))
-            
-            metr.save()
-            
-            session_flash.set_flash(request, "New Metric successfully created")
-            return redirect('cloud-metrics-index') # Redirect after POST
+            # Loading problems are reported now instead of when it runs
+            try:
+                elapsed = program_registry.validate('metric', filename[0:-3], form.cleaned_data['file'])
+            except ProgramLoadError as e:
+                form.add_error('file', str(e))
+            else:
+                metr.file.save(filename, ContentFile(form.cleaned_data['file']))
+                metr.save()
+
+                session_flash.set_flash(request, "New Metric successfully created (loaded in %.3f seconds)" % elapsed)
+                return redirect('cloud-metrics-index') # Redirect after POST
     else:
         form = MetricForm() # An unbound form
     
@@ -140,6 +150,7 @@ def delete(request, metric_id):
         raise Http404
     
     # Delete saved file
+    program_registry.forget(metr)
     try:
         metr.file.delete()
         session_flash.set_flash(request, "Metric %s was successfully deleted!" % str(metr))
@@ -159,20 +170,11 @@ def web_services(request, metric_name):
     except Metric.DoesNotExist:
         raise Http404
 
-    # File name without the '.py' and with '/' replaced by '.'
-    file_path = metric.file.name[0:-3].replace("/", ".")
-    # Generata a list to extract the classname
-    metric_classname = file_path.split(".")[-1]
-    metric_path = 'cloud.' + file_path
     try:
-        metric_module = __import__(metric_path, fromlist=[metric_classname])
-        metric_class = getattr(metric_module, metric_classname)
-    except (ImportError, NotImplementedError) as e:
+        metric_class = program_registry.get(metric)
+    except ProgramLoadError as e:
         logger.error("Problems loading metric: " + str(e))
-        return HttpResponse("Problems loading metric: " + str(e) + " - " + metric_path + " - " + metric_classname)
-    except AttributeError as e:
-        logger.error("Must implement main class: " + str(e))
-        return HttpResponse("Must implement main class: " + str(e))
+        return HttpResponse("Problems loading metric: " + str(e))
 
     try:
         metric = metric_class()
@@ -188,7 +190,7 @@ def web_services(request, metric_name):
             result = metric.collect()
 
         collecting_time = time.time() - t0
-        logger.info("Metric %s successfully collected in %d seconds" % (metric_classname, round(collecting_time, 2)))
+        logger.info("Metric %s successfully collected in %d seconds" % (metric_class.__name__, round(collecting_time, 2)))
     except TypeError as e:
         logger.error("Wrong parameters: %s" % str(e))
         return HttpResponse("Wrong parameters: %s" % str(e))
@@ -11,6 +11,8 @@ from django.template.context import RequestContext
 from cloud.models.program import PROGRAM_STATES
 from cloud.models.optimization_program import OptimizationProgram, OPTMIZATION_SCOPES
 from cloud.helpers import session_flash, paginate
+from cloud.helpers.programs import registry as program_registry, ProgramLoadError
+from cloud.models.job import Job
 
 # Configure logging for the module name
 logger = logging.getLogger(__name__)
@@ -106,12 +108,17 @@ def new(request):
             alg.state = form.cleaned_data['state']
             #Save the contents in a file
             filename = form.cleaned_data['filename']
-            alg.file.save(filename, ContentFile(form.cleaned_data['file']))
-
-            alg.save()
-
-            session_flash.set_flash(request, "New Optimization Program successfully created")
-            return redirect('cloud-optimization-programs-index') # Redirect after POST
+            # Loading problems are reported now instead of when it runs
+            try:
+                elapsed = program_registry.validate('optimization', filename[0:-3], form.cleaned_data['file'])
+            except ProgramLoadError as e:
+                form.add_error('file', str(e))
+            else:
+                alg.file.save(filename, ContentFile(form.cleaned_data['file']))
+                alg.save()
+
+                session_flash.set_flash(request, "New Optimization Program successfully created (loaded in %.3f seconds)" % elapsed)
+                return redirect('cloud-optimization-programs-index') # Redirect after POST
     else:
         form = OptimizationProgramForm() # An unbound form
 
@@ -140,6 +147,7 @@ def delete(request, optimization_program_id):
         raise Http404
 
     # Delete saved file
+    program_registry.forget(alg)
     try:
         alg.file.delete()
         session_flash.set_flash(request, "Optimization Program %s was successfully deleted!" % str(alg))
@@ -159,32 +167,12 @@ def web_services(request, program_name):
     except OptimizationProgram.DoesNotExist:
         raise Http404
 
-    # File name without the '.py' and with '/' replaced by '.'
-    file_path = program.file.name[0:-3].replace("/", ".")
-    # Generata a list to extract the classname
-    program_classname = file_path.split(".")[-1]
-    program_path = 'cloud.' + file_path
-    try:
-        program_module = __import__(program_path, fromlist=[program_classname])
-        program_class = getattr(program_module, program_classname)
-    except (ImportError, NotImplementedError) as e:
-        logger.error("Problems loading program: " + str(e))
-        return HttpResponse("Problems loading program: " + str(e))
-    except AttributeError as e:
-        logger.error("Must implement main class: " + str(e))
-        return HttpResponse("Must implement main class: " + str(e))
+    # Program runs in background (see job_worker command)
+    job = Job.enqueue('optimize', {'program_id': program.id})
+    logger.info("Optimization %s queued (job %d)" % (program.name, job.id))
 
-    try:
-        algo = program_class()
-        # Will record optimization time
-        t0 = time.time()
-        if algo.optimize():
-            optimization_time = time.time() - t0
-            logger.info("Optimization successfully executed in " + str(round(optimization_time, 2)) + " seconds")
-    except algo.OptimizationException as e:
-        logger.error("Problems executing optimization: " + str(e))
-        return HttpResponse("Problems executing optimization: " + str(e))
-
-    return HttpResponse("OK")
+    response = HttpResponse("OK")
+    response['X-Job-Id'] = str(job.id)
+    return response
 
 
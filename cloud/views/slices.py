@@ -1,5 +1,4 @@
 import base64
-import time
 import httplib
 import logging
 import xml.etree.ElementTree as ET
@@ -7,16 +6,16 @@ from xml.etree.ElementTree import fromstring, tostring
 from django import forms
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render_to_response, redirect
 from django.template import Context, RequestContext
 from django.template.loader import get_template
 from django.views.decorators.csrf import csrf_exempt
 from cloud.helpers import session_flash 
+from cloud.models.job import Job
 from cloud.models.slice import Slice
 from cloud.models.monitoring import Monitoring
 from cloud.models.virtual_machine import VirtualMachine
-from cloud.models.virtual_link import VirtualLink
 from cloud.models.virtual_router import VirtualRouter
 from cloud.models.deployment_program import DeploymentProgram
 from cloud.models.optimization_program import OptimizationProgram
@@ -78,8 +77,10 @@ def detail(request, slice_id):
             'url': "/Aurora/cloud/slices/" + str(slc.id) + "/deploy/"
         })
 
-    vm_list = VirtualMachine.objects.filter(belongs_to_slice=slc)
-    vr_list = VirtualRouter.objects.filter(belongs_to_slice=slc)
+    vm_list = list(VirtualMachine.objects.filter(belongs_to_slice=slc).select_related('host'))
+    VirtualMachine.states_for(vm_list)
+    vr_list = list(VirtualRouter.objects.filter(belongs_to_slice=slc).select_related('host'))
+    VirtualRouter.states_for(vr_list)
     link_list = slc.virtuallink_set.all()
     optimized_by_list = slc.optimizesslice_set.order_by('priority')
     
@@ -114,8 +115,8 @@ def new(request):
             s.name = form.cleaned_data['name']
 
             if request.FILES and request.FILES.has_key('vxdl_file'):
-                # Get VXDL description for slice
-                vxdl = request.FILES['vxdl_file'].read()
+                # Get VXDL description for slice (read while parsing)
+                vxdl = request.FILES['vxdl_file']
             
                 # Save slice using uploaded VXDL description
                 try:
@@ -173,29 +174,31 @@ def new_remote(request):
     
         # Save slice using uploaded VXDL description
         try:
-            # Deploy slice with specific program
-            from cloud.programs.DeployProvinet import DeployProvinet
-            program = DeployProvinet()
             s.save_from_vxdl(vxdl)
-            if program.deploy(s):
-                s.state = "deployed"
-                s.deployed_with = deployed_with
-                s.save()
-                message = "OK" 
-                logger.info("Slice deployed remotely %s!" % (str(s)))
-        except Exception as e:
-            message = "ERROR: " + str(e)
-            logger.warning("Error deploying remotely %s: %s!" % (str(s), str(e)))
         except Slice.VXDLException as e:
             message = "ERROR: Problems creating slice from VXDL: " + str(e)
             logger.warning("Error deploying remotely %s: Problems creating slice from VXDL %s!" % (str(s), str(e)))
-        except program.DeploymentException as e:
-            message = "ERROR: Problems deploying slice: " + str(e)
-            logger.warning("Error deploying remotely %s: Problems deploying slice %s!" % (str(s), str(e)))
+            return HttpResponse(message)
+        except Exception as e:
+            message = "ERROR: " + str(e)
+            logger.warning("Error deploying remotely %s: %s!" % (str(s), str(e)))
+            return HttpResponse(message)
+
+        # Deploy slice with specific program in background
+        s.state = "deploying"
+        s.save()
+        job = Job.enqueue('deploy_slice', {'program_id': deployed_with.id}, s)
+        message = "OK"
+        logger.info("Slice deployment queued remotely %s (job %d)!" % (str(s), job.id))
+
+        response = HttpResponse(message)
+        # Remote systems poll /Aurora/cloud/jobs/<id>/ for the deployment status
+        response['X-Job-Id'] = str(job.id)
+        return response
 
     else:
         message = "ERROR: Only POST method is allowed"
-        logger.warning("Error deploying remotely %s: Only POST method is allowed!" % (str(s)))
+        logger.warning("Error deploying remotely: Only POST method is allowed!")
     
     return HttpResponse(message)
 
@@ -209,39 +212,13 @@ def delete_remote(request, slice_name):
         logger.info("Attempt to delete slice %s!" % (slice_name))
         raise Http404
     
-    message = None
-    #TODO: Slice deployment is undone hardcoded here. Possibly in the future there should be undeploy programs.
-    # List of Links to delete 
-    links = slc.virtuallink_set.all()
-    for link in links:
-        try:
-            link.unestablish()
-        except link.VirtualLinkException as e:
-            message = "Problems unestablishing a virtual link: " + str(e)
-
-    # List of VMs to delete 
-    vms = VirtualMachine.objects.filter(belongs_to_slice=slc)
-    for vm in vms:
-        try:
-            vm.undeploy()
-            logger.info("VM %s was undeployed!" % str( vm ))
-        except vm.VirtualMachineException as e:
-            message = "Problems undeploying a virtual machine: " + str(e)
-
-    # Virtual Routers to undeploy
-    vrs = VirtualRouter.objects.filter(belongs_to_slice=slc)
-    for vr in vrs:
-        try:
-            vr.undeploy()
-        except vm.VirtualRouterException as e:
-            message = "Problems undeploying a virtual router: " + str(e)
+    # Links, VMs and routers are undeployed in background before the slice is deleted
+    job = Job.enqueue('undeploy_slice', {'delete': True}, slc)
+    logger.info("Slice %s deletion queued (job %d)!" % (str(slc), job.id))
 
-    slc.delete()
-    if message is None:
-        message = "OK"
-    logger.info("Slice %s was successfully deleted!" % str( slc ))
-    
-    return HttpResponse(message)
+    response = HttpResponse("OK")
+    response['X-Job-Id'] = str(job.id)
+    return response
 
 
 #Form for new Slice creation
@@ -265,34 +242,13 @@ def deploy(request, slice_id):
         if form.is_valid(): # All validation rules pass
             # Process the data in form.cleaned_data
             
-            # Load program and run
+            # Program runs in background (see job_worker command), the
+            # monitoring system is updated once the slice is deployed
             program = form.cleaned_data['program']
-            # File name without the '.py' and with '/' replaced by '.'
-            file_path = program.file.name[0:-3].replace("/", ".")
-            # Generata a list to extract the classname
-            program_classname = file_path.split(".")[-1]
-            program_path = 'cloud.' + file_path
-            try:
-                program_module = __import__(program_path, fromlist=[program_classname])
-                program_class = getattr(program_module, program_classname)
-            except (ImportError, NotImplementedError) as e:
-                session_flash.set_flash(request, "Problems loading program: " + str(e), "danger")
-
-            try:
-                algo = program_class()
-                # Will record deployment time
-                t0 = time.time()
-                if algo.deploy(s):
-                    deployment_time = time.time() - t0
-                    s.state = "deployed"
-                    s.deployed_with = program
-                    s.save()
-                    session_flash.set_flash(request, "Slice successfully deployed in " + str(round(deployment_time, 2)) + " seconds")
-            except algo.DeploymentException as e:
-                session_flash.set_flash(request, "Problems deploying slice: " + str(e), "danger")
-            
-            # Send new slice information to monitoring system
-            #Monitoring.load().deploy_infrastructure(s)
+            s.state = "deploying"
+            s.save()
+            job = Job.enqueue('deploy_slice', {'program_id': program.id}, s)
+            session_flash.set_flash(request, "Slice deployment queued (job " + str(job.id) + ")")
 
             return redirect('cloud-slices-index') # Redirect after POST
 
@@ -326,37 +282,11 @@ def delete(request, slice_id):
     except Slice.DoesNotExist:
         raise Http404
     
-    #TODO: Slice deployment is undone hardcoded here. Possibly in the future there should be undeploy programs.
-    # List of Links to delete 
-    links = VirtualLink.objects.filter(belongs_to_slice=slc)
-    for link in links:
-        try:
-            link.unestablish()
-        except link.VirtualLinkException as e:
-            session_flash.set_flash(request, "Problems unestablishing a virtual link: " + str(e), "warning")
+    # Links, VMs and routers are undeployed in background before the slice is deleted
+    job = Job.enqueue('undeploy_slice', {'delete': True}, slc)
+    session_flash.set_flash(request, "Slice %s deletion queued (job %d)" % (str(slc), job.id))
+    logger.info("Slice %s deletion queued (job %d)!" % (str(slc), job.id))
 
-    # List of VMs to delete 
-    vms = VirtualMachine.objects.filter(belongs_to_slice=slc)
-    for vm in vms:
-        try:
-            vm.undeploy()
-            logger.debug("Virtual Machine %s was undeployed!" % str( vm ))
-        except vm.VirtualMachineException as e:
-            session_flash.set_flash(request, "Problems undeploying a virtual machine: " + str(e), "warning")
-
-    # Virtual Routers to undeploy
-    vrs = VirtualRouter.objects.filter(belongs_to_slice=slc)
-    for vr in vrs:
-        try:
-            vr.undeploy()
-            logger.debug("Virtual Router %s was undeployed!" % str( vm ))
-        except vm.VirtualRouterException as e:
-            session_flash.set_flash(request, "Problems undeploying a virtual router: " + str(e), "warning")
-
-    slc.delete()
-    session_flash.set_flash(request, "Slice %s was successfully deleted!" % str( slc ))
-    logger.info("Slice %s was successfully deleted!" % str( slc ))
-    
     return redirect('cloud-slices-index')
 
 #Form for adding Optimization Program
@@ -432,6 +362,6 @@ def remove_optimization_program(request, slice_id, optimizes_id):
     return redirect(request.META['HTTP_REFERER'])
 
 def export_all_flexcms(request):
-    #Only calls the flexcms export function
-    return HttpResponse(Monitoring.load().generate_flexcms_platform_xml())
+    #Only calls the flexcms export function, the document is sent while it is generated
+    return StreamingHttpResponse(Monitoring.load().stream_flexcms_platform_xml(), content_type='text/xml')
 
@@ -9,6 +9,7 @@ from django.shortcuts import render_to_response, redirect
 from django.template import Context, RequestContext
 from django.template.loader import get_template
 from cloud.helpers import session_flash, paginate
+from cloud.helpers.host_sync import sync_hosts
 from cloud.models.virtual_machine import VirtualMachine
 from cloud.models.host import Host
 from cloud.models.image import Image
@@ -50,13 +51,15 @@ def index(request):
             # Search for unbound Virtual Machines
             if s == '-1':
                 s = None
-            vms = VirtualMachine.objects.filter(belongs_to_slice=s)
+            vms = VirtualMachine.objects.filter(belongs_to_slice=s).select_related('host')
         else:
-            vms = VirtualMachine.objects.all()
+            vms = VirtualMachine.objects.all().select_related('host')
     else:
         vms = []
 
     vm_list = paginate.paginate(vms, request)
+    # Reads the state of the VMs of the page with one call per host
+    VirtualMachine.states_for(vm_list.object_list)
 
     t = get_template('virtual-machines-index.html')
     view_vars.update({
@@ -276,20 +279,21 @@ def suspend(request, virtual_machine_id):
 @login_required
 def sync(request):
     try:
-        hosts = Host.objects.all()
+        hosts = list(Host.objects.all())
     except:
         session_flash.set_flash(request, "Problems loading hosts", "danger")
-        raise redirect('cloud-virtual-machines-index')
-
-    for h in hosts:
-        # Sync physical host current status with the database
-        try:
-            h.sync()
-        except h.HostException as e:
-            session_flash.set_flash(request, 'Problems synchronizing host "' + str(h) + '": ' + str(e), "danger")
-            return redirect('cloud-virtual-machines-index')
+        return redirect('cloud-virtual-machines-index')
+
+    # Sync physical hosts current status with the database (in parallel)
+    failed = 0
+    for entry in sync_hosts(hosts):
+        if not entry['ok']:
+            failed += 1
+            session_flash.set_flash(request, 'Problems synchronizing host "' + str(entry['host']) + '": ' + entry['error'], "danger")
+        else:
+            logger.debug(str(entry['result']))
 
-    session_flash.set_flash(request, "Synchronization finished")
+    session_flash.set_flash(request, "Synchronization finished (%d of %d hosts synchronized)" % (len(hosts) - failed, len(hosts)))
 
     return redirect('cloud-virtual-machines-index')
 
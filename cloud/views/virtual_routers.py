@@ -47,13 +47,15 @@ def index(request):
             # Search for unbound Virtual Routers
             if s == '-1':
                 s = None
-            vrs = VirtualRouter.objects.filter(belongs_to_slice=s)
+            vrs = VirtualRouter.objects.filter(belongs_to_slice=s).select_related('host')
         else:
-            vrs = VirtualRouter.objects.all()
+            vrs = VirtualRouter.objects.all().select_related('host')
     else:
         vrs = []
     
     vr_list = paginate.paginate(vrs, request)
+    # Reads the state of the routers of the page with one query per host
+    VirtualRouter.states_for(vr_list.object_list)
 
     t = get_template('virtual-routers-index.html')
     view_vars.update({
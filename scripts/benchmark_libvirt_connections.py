@@ -0,0 +1,57 @@
+# Compares pooled libvirt connections with opening one connection per call
+# using the libvirt test driver (test:///default), so no hypervisor is needed
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.benchmark_libvirt_connections import benchmark
+# benchmark()
+
+import threading
+import time
+
+import libvirt
+
+from cloud.models.host import Host
+from cloud.helpers.libvirt_connections import LibvirtConnectionManager
+
+
+def run_threads(target, threads, calls):
+    workers = []
+    t0 = time.time()
+    for i in range(threads):
+        w = threading.Thread(target=target, args=(calls,))
+        workers.append(w)
+        w.start()
+    for w in workers:
+        w.join()
+    return time.time() - t0
+
+
+def benchmark(threads=8, calls=200):
+    # Unsaved host pointing to the test driver
+    host = Host(id=1, name='test', driver='test', transport='local', path='default', extraparameters='')
+    uri = host.get_libvirt_uri()
+    manager = LibvirtConnectionManager()
+
+    # Old behaviour of force_tcp: a brand new connection for every call
+    def unpooled(n):
+        for i in range(n):
+            conn = libvirt.open(uri)
+            conn.listAllDomains(0)
+            conn.close()
+
+    # Every call reuses the same healthy connection
+    def pooled(n):
+        for i in range(n):
+            conn = manager.get(host)
+            conn.listAllDomains(0)
+
+    total = threads * calls
+    elapsed = run_threads(unpooled, threads, calls)
+    print 'Unpooled: %d calls in %.3f s (%.3f ms/call)' % (total, elapsed, elapsed * 1000 / total)
+
+    elapsed = run_threads(pooled, threads, calls)
+    print 'Pooled:   %d calls in %.3f s (%.3f ms/call)' % (total, elapsed, elapsed * 1000 / total)
+    print 'Pool stats: %s' % str(manager.stats())
+
+    manager.close_all()
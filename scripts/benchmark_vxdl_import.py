@@ -0,0 +1,59 @@
+# Imports the VXDL examples of cloud/templates/xml and shows the number of
+# queries and the time taken by each one. Images missing in the database
+# are created for the test and all the changes are rolled back.
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.benchmark_vxdl_import import benchmark
+# benchmark()
+
+import glob
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from cloud.helpers.vxdl import parse_vxdl
+from cloud.models.image import Image
+from cloud.models.slice import Slice
+
+
+class Rollback(Exception):
+    pass
+
+
+def benchmark(pattern='vxdl_*.xml', rounds=3):
+    files = sorted(glob.glob(os.path.join(settings.BASE_DIR, 'cloud', 'templates', 'xml', pattern)))
+    print '%-30s %5s %5s %8s %10s' % ('File', 'VMs', 'Links', 'Queries', 'Time (ms)')
+    for path in files:
+        with open(path) as f:
+            vxdl = f.read()
+        graph = parse_vxdl(vxdl)
+        try:
+            with transaction.atomic():
+                owner = User.objects.all()[0]
+                existing = set(Image.objects.filter(name__in=graph.image_names()).values_list('name', flat=True))
+                Image.objects.bulk_create([
+                    Image(name=name, file_format='raw', image_file='images/benchmark.img')
+                    for name in graph.image_names() - existing
+                ])
+
+                best = None
+                for i in range(rounds):
+                    s = Slice(name='benchmark%d' % i, owner=owner)
+                    with CaptureQueriesContext(connection) as queries:
+                        t0 = time.time()
+                        s.save_from_vxdl(vxdl)
+                        elapsed = time.time() - t0
+                    if best is None or elapsed < best:
+                        best = elapsed
+                raise Rollback()
+        except Rollback:
+            pass
+
+        print '%-30s %5d %5d %8d %10.1f' % (
+            os.path.basename(path), len(graph.nodes), len(graph.links), len(queries), best * 1000
+        )
@@ -0,0 +1,84 @@
+# Checks image staging with a host using the 'local' transport, so base
+# images and overlays are created in a temporary directory of this machine
+# (qemu-img must be installed). Database changes are rolled back.
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.check_image_staging import check
+# check()
+
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test.utils import override_settings
+
+from cloud.models.host import Host
+from cloud.models.image import Image
+from cloud.models.image_replica import ImageReplica
+from cloud.models.virtual_machine import VirtualMachine
+
+
+class Rollback(Exception):
+    pass
+
+
+def check():
+    remote = tempfile.mkdtemp() + '/'
+    media = tempfile.mkdtemp()
+    try:
+        with override_settings(REMOTE_IMAGE_PATH=remote, MEDIA_ROOT=media):
+            with transaction.atomic():
+                run()
+                raise Rollback()
+    except Rollback:
+        pass
+    finally:
+        shutil.rmtree(remote)
+        shutil.rmtree(media)
+
+
+def run():
+    host = Host.objects.create(name='staging-test', hostname='localhost', transport='local')
+    image = Image(name='staging-test', file_format='raw')
+    image.image_file.save('staging-test.img', ContentFile('\0' * 1024 * 1024), save=False)
+    image.save()
+    print 'Image checksum: %s' % image.checksum
+
+    vms = []
+    for i in range(3):
+        vm = VirtualMachine.objects.create(name='staging-test-%d' % i, memory=65536, vcpu=1, image=image, host=host)
+        vm.disk_path = image.deploy(vm)
+        vms.append(vm)
+        assert os.path.exists(vm.disk_path)
+        assert vm.get_disk_format() == 'qcow2'
+
+    # Base image was copied only once
+    replicas = ImageReplica.objects.filter(host=host)
+    assert replicas.count() == 1
+    base_path = replicas[0].path
+    print 'Base image: %s' % base_path
+    print 'Overlays: %s' % ', '.join(vm.disk_path for vm in vms)
+
+    # Replicas in use are never evicted
+    assert ImageReplica.evict(host, max_per_host=0) == []
+
+    # Nor while overlays of VMs moved to another host still exist
+    for vm in vms:
+        vm.host = None
+        vm.save()
+    assert ImageReplica.evict(host, max_per_host=0) == []
+
+    # Staging again when the inventory lost the replica reuses the path
+    ImageReplica.objects.filter(host=host).delete()
+    replica = image.stage(host)
+    assert replica.path == base_path and os.path.exists(base_path)
+    assert not [f for f in os.listdir(os.path.dirname(base_path)) if f.endswith('.part')]
+
+    for vm in vms:
+        vm.delete()
+    assert len(ImageReplica.evict(host, max_per_host=0)) == 1
+    assert not os.path.exists(base_path)
+    print 'OK'
@@ -0,0 +1,124 @@
+# Checks the monitoring system client against a small in-process HTTP stub
+# that decodes chunked and gzip compressed requests, counts the connections
+# opened and replies with a scripted list of status codes.
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.check_monitoring_transport import check
+# check()
+
+import threading
+import zlib
+from BaseHTTPServer import BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn, TCPServer
+
+from cloud.helpers.monitoring_transport import MonitoringTransport, MonitoringTransportException
+
+
+class StubServer(ThreadingMixIn, TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        TCPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        # Status of the next replies (200 when empty)
+        self.replies = []
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+
+    @property
+    def hostname(self):
+        return '127.0.0.1:%d' % self.server_address[1]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') != 'chunked':
+            return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = []
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if size == 0:
+                self.rfile.readline()
+                return ''.join(body)
+            body.append(self.rfile.read(size))
+            self.rfile.readline()
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        with self.server.lock:
+            self.server.requests.append((self.path, dict(self.headers), body))
+            status = self.server.replies.pop(0) if self.server.replies else 200
+        reply = 'OK %d' % len(body)
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def document():
+    yield '<?xml version="1.0" encoding="UTF-8"?><platform>'
+    for i in range(2000):
+        yield '<slice><identifier>vm%d</identifier></slice>' % i
+    yield '</platform>'
+
+
+def check():
+    server = StubServer()
+    expected = ''.join(document())
+    try:
+        transport = MonitoringTransport(server.hostname, 'user', 'secret', timeout=5, retries=2, backoff=0.01)
+
+        # Compressed and chunked, connection kept open between requests
+        for i in range(3):
+            response = transport.post('/deploy', document)
+            assert response.ok(), response.status
+            assert response.body == 'OK %d' % len(expected)
+        assert server.connections == 1, server.connections
+        path, headers, body = server.requests[-1]
+        assert path == '/deploy' and body == expected
+        assert headers['content-encoding'] == 'gzip'
+        assert headers['authorization'] == 'Basic dXNlcjpzZWNyZXQ='
+
+        # 5xx replies are retried with a new copy of the body
+        server.replies = [503, 502]
+        response = transport.post('/deploy', document)
+        assert response.ok() and server.requests[-1][2] == expected
+        assert len(server.requests) == 6
+
+        # Client errors are not retried, too many failures raise
+        server.replies = [404]
+        assert transport.post('/deploy', document).status == 404
+        server.replies = [500, 500, 500]
+        try:
+            transport.post('/deploy', document)
+            assert False, 'Expected MonitoringTransportException'
+        except MonitoringTransportException as e:
+            print 'Failed as expected: %s' % str(e)
+
+        # Uncompressed requests
+        plain = MonitoringTransport(server.hostname, timeout=5, compress=False)
+        assert plain.post('/deploy', document).ok()
+        assert 'content-encoding' not in server.requests[-1][1]
+        assert server.requests[-1][2] == expected
+        transport.pool.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    print 'OK'
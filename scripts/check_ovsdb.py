@@ -0,0 +1,278 @@
+# Checks the Open vSwitch database client against a small in-process fake
+# OVSDB server (a unix socket in a temporary directory) that implements
+# the monitor and transact methods for the tables used by Aurora.
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.check_ovsdb import check
+# check()
+
+import copy
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+
+from cloud.helpers.ovsdb import OVSDBConnection, OVSDBException, MONITORED, from_set
+
+# Reference columns and the tables they point to, rows of other tables
+# than Open_vSwitch are removed when nothing references them
+REFERENCES = {
+    ('Open_vSwitch', 'bridges'): 'Bridge',
+    ('Bridge', 'ports'): 'Port',
+    ('Bridge', 'controller'): 'Controller',
+    ('Port', 'interfaces'): 'Interface',
+}
+
+
+class FakeOVSDB(object):
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tables = dict((table, {}) for table in MONITORED)
+        self.tables['Open_vSwitch'][str(uuid.uuid4())] = {'bridges': ['set', []]}
+        self.monitors = []
+        self.transactions = 0
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(5)
+        t = threading.Thread(target=self.serve)
+        t.daemon = True
+        t.start()
+
+    def serve(self):
+        while True:
+            try:
+                client, address = self.server.accept()
+            except socket.error:
+                break
+            t = threading.Thread(target=self.handle, args=(client,))
+            t.daemon = True
+            t.start()
+
+    def close(self):
+        self.server.close()
+
+    def send(self, client, message):
+        client.sendall(json.dumps(message))
+
+    def handle(self, client):
+        decoder = json.JSONDecoder()
+        buf = ''
+        while True:
+            try:
+                data = client.recv(65536)
+            except socket.error:
+                break
+            if not data:
+                break
+            buf += data
+            while buf.strip():
+                buf = buf.lstrip()
+                try:
+                    message, end = decoder.raw_decode(buf)
+                except ValueError:
+                    break
+                buf = buf[end:]
+                with self.lock:
+                    self.dispatch(client, message)
+
+    def dispatch(self, client, message):
+        method = message['method']
+        params = message['params']
+        if method == 'monitor':
+            self.monitors.append(client)
+            result = self.changes(dict((t, {}) for t in self.tables), self.tables)
+            self.send(client, {'id': message['id'], 'result': result, 'error': None})
+        elif method == 'transact':
+            result = self.transact(params[1:])
+            self.send(client, {'id': message['id'], 'result': result, 'error': None})
+        elif method == 'echo':
+            self.send(client, {'id': message['id'], 'result': params, 'error': None})
+
+    # Row updates between two versions of the tables
+    def changes(self, old, new):
+        updates = {}
+        for table in new:
+            rows = {}
+            for row_uuid in set(old[table]) | set(new[table]):
+                before = old[table].get(row_uuid)
+                after = new[table].get(row_uuid)
+                if before == after:
+                    continue
+                change = {}
+                if before is not None:
+                    change['old'] = before
+                if after is not None:
+                    change['new'] = after
+                rows[row_uuid] = change
+            if rows:
+                updates[table] = rows
+        return updates
+
+    def resolve(self, value, named):
+        if isinstance(value, list):
+            if len(value) == 2 and value[0] == 'named-uuid':
+                return ['uuid', named[value[1]]]
+            return [self.resolve(v, named) for v in value]
+        if isinstance(value, dict):
+            return dict((k, self.resolve(v, named)) for k, v in value.items())
+        return value
+
+    def normalize(self, table, row):
+        for column, value in row.items():
+            if (table, column) in REFERENCES:
+                row[column] = ['set', [['uuid', u] for u in from_set(value)]]
+        return row
+
+    def select(self, tables, table, where):
+        rows = []
+        for row_uuid, row in tables[table].items():
+            match = True
+            for column, function, value in where:
+                current = row_uuid if column == '_uuid' else row.get(column)
+                if function != '==' or current != from_set(value)[0]:
+                    match = False
+            if match:
+                rows.append(row)
+        return rows
+
+    def transact(self, operations):
+        tables = copy.deepcopy(self.tables)
+        named = {}
+        result = []
+        for op in operations:
+            op = self.resolve(op, named) if op['op'] != 'insert' else op
+            table = op['table']
+            if op['op'] == 'insert':
+                row_uuid = str(uuid.uuid4())
+                named[op['uuid-name']] = row_uuid
+                tables[table][row_uuid] = self.normalize(table, self.resolve(op['row'], named))
+                result.append({'uuid': ['uuid', row_uuid]})
+            elif op['op'] == 'update':
+                rows = self.select(tables, table, op['where'])
+                for row in rows:
+                    row.update(self.normalize(table, op['row']))
+                result.append({'count': len(rows)})
+            elif op['op'] == 'mutate':
+                rows = self.select(tables, table, op['where'])
+                for row in rows:
+                    for column, mutator, value in op['mutations']:
+                        items = from_set(row.get(column, ['set', []]))
+                        for item in from_set(value):
+                            if mutator == 'insert' and item not in items:
+                                items.append(item)
+                            elif mutator == 'delete' and item in items:
+                                items.remove(item)
+                        row[column] = ['set', [['uuid', u] for u in items]]
+                result.append({'count': len(rows)})
+            else:
+                return result + [{'error': 'not supported', 'details': op['op']}]
+
+        # Garbage collection of rows not referenced anymore
+        reachable = set(tables['Open_vSwitch'])
+        changed = True
+        while changed:
+            changed = False
+            for (table, column), target in REFERENCES.items():
+                for row_uuid, row in tables[table].items():
+                    if row_uuid not in reachable:
+                        continue
+                    for ref in from_set(row.get(column, ['set', []])):
+                        if ref not in reachable:
+                            reachable.add(ref)
+                            changed = True
+        for table in tables:
+            if table != 'Open_vSwitch':
+                for row_uuid in list(tables[table]):
+                    if row_uuid not in reachable:
+                        del tables[table][row_uuid]
+
+        # Monitors are updated before the transaction is answered
+        updates = self.changes(self.tables, tables)
+        self.tables = tables
+        self.transactions += 1
+        for client in self.monitors:
+            try:
+                self.send(client, {'method': 'update', 'params': [None, updates], 'id': None})
+            except socket.error:
+                pass
+        return result
+
+
+def check():
+    directory = tempfile.mkdtemp()
+    server = FakeOVSDB(os.path.join(directory, 'db.sock'))
+    try:
+        run(server, 'unix:' + server.path)
+    finally:
+        server.close()
+        shutil.rmtree(directory)
+
+
+def run(server, address):
+    conn = OVSDBConnection(address, timeout=3)
+    conn.connect()
+    replica = conn.replica
+
+    # Bridge and controller created in a single transaction
+    txn = conn.transaction()
+    txn.add_bridge('hostbr1', datapath_id='a0b0b40000000001')
+    txn.set_controller('hostbr1', ['tcp:127.0.0.1:6633'])
+    txn.commit()
+    assert server.transactions == 1
+    assert replica.bridge_exists('hostbr1')
+    assert replica.port_to_bridge('hostbr1') == 'hostbr1'
+
+    # may_exist is answered by the replica without a transaction
+    conn.transaction().add_bridge('hostbr1', may_exist=True).commit()
+    assert server.transactions == 1
+    try:
+        conn.transaction().add_bridge('hostbr1')
+        raise AssertionError('Duplicated bridge was accepted')
+    except OVSDBException:
+        pass
+
+    conn.transaction().add_bridge('br2').add_port('hostbr1', 'vnet0').commit()
+    assert replica.port_to_bridge('vnet0') == 'hostbr1'
+
+    # Move a port to another bridge in one transaction
+    txn = conn.transaction()
+    txn.del_port(None, 'vnet0')
+    txn.add_port('br2', 'vnet0')
+    txn.commit()
+    assert replica.port_to_bridge('vnet0') == 'br2'
+
+    # Patch ports between bridges
+    txn = conn.transaction()
+    txn.add_port('hostbr1', 'hostbr1_to_br2', type='patch', options={'peer': 'br2_to_hostbr1'})
+    txn.add_port('br2', 'br2_to_hostbr1', type='patch', options={'peer': 'hostbr1_to_br2'})
+    txn.commit()
+    assert sorted(replica.bridge_ports('br2')) == ['br2', 'br2_to_hostbr1', 'vnet0']
+
+    # Concurrent calls share the connection
+    def add(i):
+        conn.transaction().add_port('hostbr1', 'tap%d' % i).commit()
+    threads = [threading.Thread(target=add, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(replica.bridge_ports('hostbr1')) == 22
+
+    # Ports of deleted bridges are removed by the server
+    conn.transaction().del_bridge('br2').commit()
+    assert not replica.bridge_exists('br2')
+    assert replica.port_to_bridge('vnet0') is None
+    conn.transaction().del_bridge('br2', if_exists=True).commit()
+
+    # A new connection gets the current state from the monitor
+    other = OVSDBConnection(address, timeout=3)
+    other.connect()
+    assert sorted(other.replica.bridge_ports('hostbr1')) == sorted(replica.bridge_ports('hostbr1'))
+    other.close()
+    conn.close()
+    print 'OK (%d transactions)' % server.transactions
@@ -0,0 +1,49 @@
+# Checks the ring buffers used to store metric samples (rollups, range
+# queries, aggregates and wrap around) without touching the database.
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.check_timeseries import check
+# check()
+
+from cloud.helpers.timeseries import TimeSeries, SLOT
+
+ROLLUPS = ((10, 6), (60, 10))
+
+
+def check():
+    series = TimeSeries(ROLLUPS)
+    assert series.last() is None
+    assert len(series.dumps()) == 16 * SLOT.size
+
+    # One sample every 5 seconds during 2 minutes: 1, 2, 3...
+    start = 6000
+    for i in range(24):
+        series.add(start + i * 5, float(i + 1))
+    now = start + 120
+
+    # Finest buffer only keeps the last minute (6 buckets of 10 s)
+    points = series.points(now - 60, now, now)
+    assert [p[0] for p in points] == [6070, 6080, 6090, 6100, 6110], points
+    assert points[-1] == (6110, 23.5, 23.0, 24.0, 2)
+    assert series.last() == (6110, 23.5)
+
+    # Older ranges are answered by the 1 minute rollup
+    points = series.points(now - 120, now, now)
+    assert [p[0] for p in points] == [6000, 6060], points
+    assert points[0] == (6000, 6.5, 1.0, 12.0, 12)
+    assert series.aggregate('avg', now - 120, now, now) == 12.5
+    assert series.aggregate('max', now - 30, now, now) == 24.0
+    assert series.aggregate('count', now - 30, now, now) == 6
+    assert series.aggregate('min', now - 120, now, now, resolution=60) == 1.0
+
+    # Late samples are dropped by buffers that already reused their slot
+    series.add(start, 100.0)
+    assert series.aggregate('count', now - 60, now, now) == 10
+    assert series.aggregate('count', now - 120, now, now) == 25
+
+    # Serialized data is loaded back, changing rollups starts again
+    copy = TimeSeries(ROLLUPS, series.dumps())
+    assert copy.points(now - 120, now, now) == series.points(now - 120, now, now)
+    assert TimeSeries(((10, 6),), series.dumps()).last() is None
+    print 'OK'
@@ -0,0 +1,66 @@
+# Checks the topology distance service against a local stub that emulates
+# the Floodlight /wm/topology/links/json resource, no controller is needed
+
+# Run this script from the django shell:
+# python manage.py shell
+# from scripts.check_topology import check
+# check()
+
+import json
+import threading
+import BaseHTTPServer
+
+from cloud.models.host import Host
+from cloud.helpers.topology import TopologyService
+
+
+# host1 - sw1 - sw2 - host2, host3 isolated
+LINKS = [
+    {'src-switch': 'a0:b0:b4:00:00:00:00:01', 'src-port': 1, 'dst-switch': '00:00:00:00:00:00:00:01', 'dst-port': 1},
+    {'src-switch': '00:00:00:00:00:00:00:01', 'src-port': 2, 'dst-switch': '00:00:00:00:00:00:00:02', 'dst-port': 1},
+    {'src-switch': '00:00:00:00:00:00:00:02', 'src-port': 2, 'dst-switch': 'a0:b0:b4:00:00:00:00:02', 'dst-port': 1},
+]
+
+
+class LinksHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        LinksHandler.requests += 1
+        if self.path != '/wm/topology/links/json':
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(LINKS))
+
+    def log_message(self, *args):
+        pass
+
+
+def check():
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), LinksHandler)
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+
+    try:
+        service = TopologyService('http://127.0.0.1:%d' % server.server_port)
+        # Unsaved hosts, only their ids matter
+        h1, h2, h3 = Host(id=1, name='host1'), Host(id=2, name='host2'), Host(id=3, name='host3')
+
+        assert service.distance(h1, h1) == 1
+        assert service.distance(h1, h2) == 4
+        assert service.distance(h2, h1) == 4
+        assert service.distance(h1, h3) == 42
+        assert service.path(h1, h2) == ['a0b0b40000000001', '0000000000000001', '0000000000000002', 'a0b0b40000000002']
+        assert service.path(h1, h3) is None
+
+        hops = service.host_hops([h1, h2, h3])
+        print 'Distances: %s' % str(hops)
+        print 'Controller requests: %d' % LinksHandler.requests
+        assert LinksHandler.requests == 1
+    finally:
+        server.shutdown()